@@ -0,0 +1,105 @@
+"""
+Server-Sent Events feed of newly flagged case notes
+
+Flags are recorded as rows in the anomaly_events table in the same transaction
+that sets CaseNote.is_flagged, so the event id is durable and shared by every
+worker process. Streams seek past the client's last event id; an in-process
+condition wakes them as soon as this process commits a flag, and a short poll
+picks up flags committed by other workers.
+
+Event ids are assigned when a row is inserted, not when it commits, so a
+transaction that commits late can land below ids already sent. Each poll
+therefore re-reads a window of ids behind the cursor and skips the events the
+stream has already sent.
+"""
+
+import json
+import threading
+import time
+
+
+def format_sse(data, event=None, event_id=None, retry=None):
+    """Serialise one Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    if retry is not None:
+        lines.append(f'retry: {retry}')
+    lines.extend(f'data: {line}' for line in json.dumps(data).splitlines())
+    return '\n'.join(lines) + '\n\n'
+
+
+class AnomalyFeed:
+    """Wakes waiting streams when this process publishes anomaly events"""
+
+    def __init__(self, poll_interval=1.0, heartbeat_interval=15.0, max_stream_seconds=300.0, batch_size=100,
+                 lookback=50):
+        """
+        Args:
+            poll_interval (float): Longest wait before checking for other workers' events
+            heartbeat_interval (float): Idle seconds between keep-alive comments
+            max_stream_seconds (float): Streams end after this long; browsers reconnect
+                with Last-Event-ID, which frees the worker and re-balances connections
+            batch_size (int): Events fetched per query
+            lookback (int): Ids behind the cursor re-read on every poll for events
+                whose transactions committed out of order
+        """
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.max_stream_seconds = max_stream_seconds
+        self.batch_size = batch_size
+        self.lookback = lookback
+        self._condition = threading.Condition()
+        self._sequence = 0
+
+    def publish(self):
+        """Signal that new events were committed"""
+        with self._condition:
+            self._sequence += 1
+            self._condition.notify_all()
+
+    def _wait(self, sequence, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence != sequence, timeout)
+            return self._sequence
+
+    def stream(self, fetch_after, last_event_id=0):
+        """
+        Generate SSE messages for events after last_event_id
+
+        Args:
+            fetch_after (callable): fetch_after(event_id, limit) -> list of
+                (event_id, payload dict) in ascending event id order
+            last_event_id (int): Last event the client has seen
+
+        Yields:
+            str: Encoded SSE messages
+        """
+        started = time.monotonic()
+        last_sent = started
+        sequence = self._sequence
+        sent = set()
+        yield format_sse({'last_event_id': last_event_id}, event='ready',
+                         retry=int(self.poll_interval * 1000))
+
+        while time.monotonic() - started < self.max_stream_seconds:
+            # At most `lookback` rows sit in the window, so a full batch of new events always fits
+            floor = max(last_event_id - self.lookback, 0)
+            fetched = fetch_after(floor, self.batch_size + self.lookback)
+            events = [(event_id, payload) for event_id, payload in fetched if event_id not in sent]
+            for event_id, payload in events:
+                sent.add(event_id)
+                # The id the browser resumes from never moves backwards for a late event
+                last_event_id = max(last_event_id, event_id)
+                yield format_sse(payload, event='anomaly', event_id=last_event_id)
+            sent = {event_id for event_id in sent if event_id > last_event_id - self.lookback}
+            if events:
+                last_sent = time.monotonic()
+                if len(fetched) == self.batch_size + self.lookback:
+                    continue
+            elif time.monotonic() - last_sent >= self.heartbeat_interval:
+                yield ': keep-alive\n\n'
+                last_sent = time.monotonic()
+            sequence = self._wait(sequence, self.poll_interval)
@@ -0,0 +1,175 @@
+"""
+Time-bucketed anomaly rollups
+
+Every scored note adds to hourly and daily buckets, once hospital-wide and
+once per note type, department and staff member, split by severity band.
+Counts are applied as additive upserts when a note is scored (and reversed if
+it is re-scored), so trend and summary queries read a bounded number of rollup
+rows instead of scanning case_notes.
+"""
+
+from datetime import timedelta
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+GRANULARITIES = ('hour', 'day')
+
+# Rollup dimensions; 'all' is the hospital-wide total
+DIMENSIONS = ('all', 'note_type', 'department', 'staff')
+
+# Severity bands as shown on the anomalies page: (name, lower bound inclusive)
+SEVERITY_BANDS = (('high', 0.7), ('medium', 0.4), ('low', 0.0))
+
+# Columns identifying a rollup row, and the counters added to it
+ROLLUP_KEY = ('granularity', 'bucket_start', 'dimension', 'dimension_key', 'severity')
+ROLLUP_COUNTERS = ('scored_count', 'flagged_count', 'score_sum')
+
+# Dialects with a native INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def severity_band(score):
+    """Severity band name for an anomaly score"""
+    for band, lower in SEVERITY_BANDS:
+        if (score or 0.0) >= lower:
+            return band
+    return 'low'
+
+
+def severity_bounds(band):
+    """(lower inclusive, upper exclusive or None) anomaly score bounds of a severity band"""
+    upper = None
+    for name, lower in SEVERITY_BANDS:
+        if name == band:
+            return lower, upper
+        upper = lower
+    raise ValueError(f"Unknown severity band: {band}")
+
+
+def bucket_start(moment, granularity):
+    """Start of the hour or day bucket containing a datetime"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup granularity: {granularity}")
+
+
+def bucket_step(granularity):
+    return timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+
+
+def bucket_count(start, end, granularity):
+    """Number of buckets bucket_range() would return, without building them"""
+    first = bucket_start(start, granularity)
+    if first > end:
+        return 0
+    return (end - first) // bucket_step(granularity) + 1
+
+
+def bucket_range(start, end, granularity):
+    """Bucket starts from the bucket containing start up to and including end"""
+    step = bucket_step(granularity)
+    current = bucket_start(start, granularity)
+    buckets = []
+    while current <= end:
+        buckets.append(current)
+        current += step
+    return buckets
+
+
+def rollup_deltas(created_at, note_type, department, staff_id, score, is_flagged, sign=1):
+    """
+    Rollup row increments for one scored note
+
+    Args:
+        created_at (datetime): When the note was written (the bucketed time)
+        note_type (str): Note type
+        department (str): Author's department
+        staff_id (int): Author
+        score (float): Anomaly score
+        is_flagged (bool): Whether the note was flagged
+        sign (int): 1 to add the note, -1 to remove a previous scoring
+
+    Returns:
+        list: Dicts keyed by the rollup columns with signed increments
+    """
+    band = severity_band(score)
+    keys = (('all', 'all'), ('note_type', note_type or 'unknown'),
+            ('department', department or 'unknown'), ('staff', str(staff_id)))
+    return [{
+        'granularity': granularity,
+        'bucket_start': bucket_start(created_at, granularity),
+        'dimension': dimension,
+        'dimension_key': key,
+        'severity': band,
+        'scored_count': sign,
+        'flagged_count': sign if is_flagged else 0,
+        'score_sum': sign * (score or 0.0)
+    } for granularity in GRANULARITIES for dimension, key in keys]
+
+
+def accumulate_deltas(merged, deltas):
+    """Sum increments into `merged`, keyed by rollup row"""
+    for delta in deltas:
+        key = tuple(delta[column] for column in ROLLUP_KEY)
+        if key in merged:
+            for column in ROLLUP_COUNTERS:
+                merged[key][column] += delta[column]
+        else:
+            merged[key] = dict(delta)
+
+
+def merge_deltas(deltas):
+    """Sum increments that land on the same rollup row"""
+    merged = {}
+    accumulate_deltas(merged, deltas)
+    # A fixed row order keeps concurrent upserts from deadlocking on each other
+    return [merged[key] for key in sorted(merged)]
+
+
+def _update_row(connection, table, delta):
+    """Add one delta to an existing rollup row; returns whether the row exists"""
+    statement = table.update()\
+        .where(*[table.c[column] == delta[column] for column in ROLLUP_KEY])\
+        .values({column: table.c[column] + delta[column] for column in ROLLUP_COUNTERS})
+    return connection.execute(statement).rowcount > 0
+
+
+def _upsert_generic(connection, table, delta):
+    """UPDATE, then INSERT if the row is missing, for dialects without a native upsert (e.g. MySQL)"""
+    if _update_row(connection, table, delta):
+        return
+    try:
+        # A savepoint keeps the surrounding transaction usable if the insert loses a race
+        with connection.begin_nested():
+            connection.execute(table.insert().values(**delta))
+    except IntegrityError:
+        # Another worker created the row between our UPDATE and INSERT
+        _update_row(connection, table, delta)
+
+
+def apply_deltas(connection, table, deltas):
+    """
+    Add increments to rollup rows, creating missing rows
+
+    Uses one INSERT ... ON CONFLICT DO UPDATE, executed for every row at once,
+    on PostgreSQL and SQLite so concurrent workers scoring notes in the same
+    bucket never race on row creation; other databases fall back to UPDATE
+    then INSERT per row, retrying the UPDATE if a concurrent INSERT wins.
+    """
+    rows = merge_deltas(deltas)
+    insert = _UPSERT_INSERTS.get(connection.dialect.name)
+    if insert is None:
+        for delta in rows:
+            _upsert_generic(connection, table, delta)
+        return
+    if not rows:
+        return
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(ROLLUP_KEY),
+        set_={column: table.c[column] + statement.excluded[column] for column in ROLLUP_COUNTERS}
+    )
+    connection.execute(statement, rows)
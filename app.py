@@ -1,15 +1,30 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, Response, stream_with_context, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta, date
+from werkzeug.utils import secure_filename
+from datetime import datetime, timedelta, timezone, date
 import os
+import time
+import click
 from dotenv import load_dotenv
-import boto3
-from botocore.exceptions import ClientError
+from jinja2 import FileSystemBytecodeCache
+from botocore.exceptions import BotoCoreError, ClientError
+from sqlalchemy.schema import AddConstraint, CreateColumn
 import json
 import uuid
 from nlp_processor import NLPAnomalyDetector
+from nlp_backends import load_backend
+from note_vectors import encode_vector, decode_vector, stack_vectors, most_similar
+from cohort_baseline import note_cohort_keys, text_statistics, update_baseline, cohort_metrics
+from s3_storage import S3Gateway, S3UnavailableError, compress_body, compressed_file_type, storage_codec
+from note_spool import NoteSpool, load_spool_fernet
+from pagination import keyset_paginate
+from anomaly_feed import AnomalyFeed
+from content_hash import content_sha256, simhash, find_duplicate
+from fragment_cache import FragmentCache, FragmentCacheExtension
+from compression import compress_response
+from anomaly_rollups import GRANULARITIES, DIMENSIONS, SEVERITY_BANDS, severity_bounds, rollup_deltas, accumulate_deltas, apply_deltas, bucket_count, bucket_range
 
 # Load environment variables
 load_dotenv()
@@ -24,22 +39,96 @@ app.config['AWS_ACCESS_KEY_ID'] = os.environ.get('AWS_ACCESS_KEY_ID')
 app.config['AWS_SECRET_ACCESS_KEY'] = os.environ.get('AWS_SECRET_ACCESS_KEY')
 app.config['AWS_S3_BUCKET'] = os.environ.get('AWS_S3_BUCKET')
 app.config['AWS_REGION'] = os.environ.get('AWS_REGION', 'us-east-1')
+app.config['S3_ENDPOINT_URL'] = os.environ.get('S3_ENDPOINT_URL') or None
+app.config['S3_COMPRESSION'] = os.environ.get('S3_COMPRESSION', 'none')  # none, gzip or zstd for text notes
+app.config['S3_MAX_CONCURRENCY'] = int(os.environ.get('S3_MAX_CONCURRENCY', 16))  # Match to worker threads
+app.config['S3_ACQUIRE_TIMEOUT'] = float(os.environ.get('S3_ACQUIRE_TIMEOUT', 2.0))
+app.config['S3_CONNECT_TIMEOUT'] = int(os.environ.get('S3_CONNECT_TIMEOUT', 3))
+app.config['S3_READ_TIMEOUT'] = int(os.environ.get('S3_READ_TIMEOUT', 10))
+app.config['S3_SLOW_CALL_THRESHOLD'] = float(os.environ.get('S3_SLOW_CALL_THRESHOLD', 5.0))  # Slower calls trip the breaker
+app.config['NOTE_SPOOL_DIR'] = os.environ.get('NOTE_SPOOL_DIR') or os.path.join(app.instance_path, 'note_spool')
+app.config['NOTE_SPOOL_KEYS'] = os.environ.get('NOTE_SPOOL_KEYS', '')  # Fernet keys, newest first; derived from SECRET_KEY if empty
+app.config['NOTE_SPOOL_BATCH_SIZE'] = int(os.environ.get('NOTE_SPOOL_BATCH_SIZE', 50))
+app.config['NOTE_SPOOL_GRACE'] = float(os.environ.get('NOTE_SPOOL_GRACE', 60))  # Seconds to wait for a spooled note's row to commit
+
+# Upload Configuration
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['UPLOAD_EXTENSIONS'] = ['.txt', '.pdf', '.doc', '.docx']
+
+# Attachments are stored and served with the type for their extension, never the client's claim
+ATTACHMENT_CONTENT_TYPES = {
+    '.txt': 'text/plain',
+    '.pdf': 'application/pdf',
+    '.doc': 'application/msword',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+}
+
+# NLP Configuration
+app.config['ANOMALY_THRESHOLD'] = float(os.environ.get('ANOMALY_THRESHOLD', 0.3))
+app.config['NLP_BACKEND'] = os.environ.get('NLP_BACKEND', 'tfidf')
+app.config['NLP_MODEL_PATH'] = os.environ.get('NLP_MODEL_PATH', 'models/')
+app.config['SCORING_HISTORY_SIZE'] = int(os.environ.get('SCORING_HISTORY_SIZE', 3))  # Previous notes compared
+app.config['ANOMALY_FEED_POLL_INTERVAL'] = float(os.environ.get('ANOMALY_FEED_POLL_INTERVAL', 1.0))
+app.config['ANOMALY_FEED_MAX_STREAM'] = float(os.environ.get('ANOMALY_FEED_MAX_STREAM', 300))
+app.config['ANOMALY_FEED_LOOKBACK'] = int(os.environ.get('ANOMALY_FEED_LOOKBACK', 50))  # Event ids re-polled behind the cursor
+
+# Rendering Configuration
+app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TEMPLATE_CACHE_DIR') or None  # Compiled template bytecode
+app.config['FRAGMENT_CACHE_SIZE'] = int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000))  # Cached rows per worker
+app.config['FRAGMENT_CACHE_TTL'] = float(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+app.config['COMPRESS_RESPONSES'] = os.environ.get('COMPRESS_RESPONSES', 'True').lower() in ['true', '1', 'yes']
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # Bytes
+app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+
+# Compiled templates are shared on disk, so new workers skip parsing and compiling
+if app.config['TEMPLATE_CACHE_DIR']:
+    os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+app.jinja_options = {
+    **app.jinja_options,
+    'bytecode_cache': FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR']),
+    'extensions': [FragmentCacheExtension]
+}
+app.jinja_env.fragment_cache = FragmentCache(app.config['FRAGMENT_CACHE_SIZE'], app.config['FRAGMENT_CACHE_TTL'])
+app.jinja_env.globals['date'] = date
 
 db = SQLAlchemy(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-# Initialize S3 client
-s3_client = boto3.client(
-    's3',
+# Initialize the shared S3 access layer (one pooled client for all threads)
+s3_gateway = S3Gateway(
     aws_access_key_id=app.config['AWS_ACCESS_KEY_ID'],
     aws_secret_access_key=app.config['AWS_SECRET_ACCESS_KEY'],
-    region_name=app.config['AWS_REGION']
+    region_name=app.config['AWS_REGION'],
+    endpoint_url=app.config['S3_ENDPOINT_URL'],
+    max_concurrency=app.config['S3_MAX_CONCURRENCY'],
+    acquire_timeout=app.config['S3_ACQUIRE_TIMEOUT'],
+    connect_timeout=app.config['S3_CONNECT_TIMEOUT'],
+    read_timeout=app.config['S3_READ_TIMEOUT'],
+    slow_call_threshold=app.config['S3_SLOW_CALL_THRESHOLD']
+)
+
+# Encrypted local spool: note bodies are accepted on disk and drained to S3 in the background
+note_spool = NoteSpool(
+    app.config['NOTE_SPOOL_DIR'],
+    load_spool_fernet(app.config['NOTE_SPOOL_KEYS'], app.config['SECRET_KEY']),
+    batch_size=app.config['NOTE_SPOOL_BATCH_SIZE']
 )
 
-# Initialize NLP processor
-nlp_detector = NLPAnomalyDetector()
+# Initialize NLP processor with a pre-fitted (or zero-fit) vectorizer backend
+nlp_detector = NLPAnomalyDetector(
+    anomaly_threshold=app.config['ANOMALY_THRESHOLD'],
+    backend=load_backend(app.config['NLP_BACKEND'], app.config['NLP_MODEL_PATH'])
+)
+
+# Push channel for newly flagged notes (Server-Sent Events)
+anomaly_feed = AnomalyFeed(
+    poll_interval=app.config['ANOMALY_FEED_POLL_INTERVAL'],
+    max_stream_seconds=app.config['ANOMALY_FEED_MAX_STREAM'],
+    lookback=app.config['ANOMALY_FEED_LOOKBACK']
+)
 
 # Database Models
 class Staff(UserMixin, db.Model):
@@ -71,30 +160,56 @@ class Staff(UserMixin, db.Model):
     def __repr__(self):
         return f'<Staff {self.username}>'
 
+# Stands in for a missing admission date when sorting, so never-admitted patients come last.
+# Rendered inline so the ORDER BY matches the expression index below.
+NOT_ADMITTED = db.literal(datetime(1900, 1, 1), literal_execute=True)
+
 class Patient(db.Model):
     __tablename__ = 'patients'
+    __table_args__ = (
+        db.Index('ix_patients_status_name', 'status', 'last_name', 'first_name'),
+        db.Index('ix_patients_name', 'last_name', 'first_name'),
+    )
     
     patient_id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
     date_of_birth = db.Column(db.Date, nullable=False)
     medical_record_number = db.Column(db.String(20), unique=True, nullable=False)
-    admission_date = db.Column(db.DateTime, nullable=True)
+    admission_date = db.Column(db.DateTime, nullable=True, index=True)
     discharge_date = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(20), default='Active')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    admission_sort_date = db.column_property(db.func.coalesce(admission_date, NOT_ADMITTED))  # Never NULL
+    
+    # Case note summary, kept in step with case_notes by the CaseNote mapper events
+    note_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    flagged_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_note_at = db.Column(db.DateTime, nullable=True, index=True)
+    last_note_staff_id = db.Column(db.Integer, db.ForeignKey('staff.staff_id'), nullable=True)
+    max_anomaly_score = db.Column(db.Float, nullable=True, index=True)
     
     # Relationship to case notes
     case_notes = db.relationship('CaseNote', backref='patient', lazy=True)
+    last_note_staff = db.relationship('Staff', foreign_keys=[last_note_staff_id])
     
     def __repr__(self):
         return f'<Patient {self.medical_record_number}>'
 
+# Patient list sort orders, in the directions PATIENT_SORTS reads them (also serve the age filter)
+db.Index('ix_patients_admission_sort', db.func.coalesce(Patient.admission_date, NOT_ADMITTED).desc(),
+         Patient.patient_id.desc())
+db.Index('ix_patients_birth_sort', Patient.date_of_birth.desc(), Patient.patient_id.desc())
+
 class CaseNote(db.Model):
     __tablename__ = 'case_notes'
+    __table_args__ = (db.Index('ix_case_notes_patient_created', 'patient_id', 'created_at'),)
     
     note_id = db.Column(db.Integer, primary_key=True)
-    patient_id = db.Column(db.Integer, db.ForeignKey('patients.patient_id'), nullable=False)
+    # active_history loads the old value of an expired attribute when it is set, so the
+    # summary events can tell which patient a note left and what its flag and score were
+    patient_id = db.column_property(db.Column(db.Integer, db.ForeignKey('patients.patient_id'), nullable=False),
+                                    active_history=True)
     staff_id = db.Column(db.Integer, db.ForeignKey('staff.staff_id'), nullable=False)
     note_type = db.Column(db.String(50), nullable=False)  # Assessment, Progress, Treatment, etc.
     title = db.Column(db.String(200), nullable=False)
@@ -105,16 +220,246 @@ class CaseNote(db.Model):
     file_type = db.Column(db.String(50), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    is_flagged = db.Column(db.Boolean, default=False)  # For NLP anomaly detection
-    anomaly_score = db.Column(db.Float, nullable=True)
+    is_flagged = db.column_property(db.Column(db.Boolean, default=False), active_history=True)  # NLP anomaly detection
+    anomaly_score = db.column_property(db.Column(db.Float, nullable=True), active_history=True)
+    anomaly_model_version = db.Column(db.String(50), nullable=True)  # Detector backend that produced the score
+    content_sha256 = db.Column(db.String(64), nullable=True, index=True)  # Exact duplicates; S3 object name
+    content_simhash = db.Column(db.BigInteger, nullable=True)  # Near-duplicate fingerprint
+    duplicate_of_note_id = db.Column(db.Integer, db.ForeignKey('case_notes.note_id'), nullable=True)
+    duplicate_kind = db.Column(db.String(10), nullable=True)  # exact or near copy of duplicate_of_note_id
+    
+    duplicate_of = db.relationship('CaseNote', remote_side=[note_id], foreign_keys=[duplicate_of_note_id])
+    content_preview = db.query_expression()  # Leading slice of content, populated by note_preview()
     
     def __repr__(self):
         return f'<CaseNote {self.note_id}>'
 
+# Per-staff listings newest first; on PostgreSQL the INCLUDE columns let them run as index-only scans
+db.Index('ix_case_notes_staff_created', CaseNote.staff_id, CaseNote.created_at.desc(),
+         postgresql_include=['note_id', 'patient_id', 'note_type', 'title', 'is_flagged',
+                             'anomaly_score', 'duplicate_kind', 's3_file_key', 'updated_at'])
+
+class NoteAttachment(db.Model):
+    __tablename__ = 'note_attachments'
+    
+    attachment_id = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, db.ForeignKey('case_notes.note_id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    s3_file_key = db.Column(db.String(500), nullable=False)
+    s3_bucket = db.Column(db.String(100), nullable=False)
+    file_size = db.Column(db.Integer, nullable=True)
+    file_type = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    case_note = db.relationship('CaseNote', backref=db.backref('attachments', lazy=True))
+    
+    def __repr__(self):
+        return f'<NoteAttachment {self.filename}>'
+
+class NoteVector(db.Model):
+    __tablename__ = 'note_vectors'
+    
+    note_id = db.Column(db.Integer, db.ForeignKey('case_notes.note_id'), primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.patient_id'), nullable=False, index=True)
+    model_version = db.Column(db.String(50), nullable=False, index=True)
+    dimension = db.Column(db.Integer, nullable=False)
+    indices = db.Column(db.LargeBinary, nullable=False)  # int32 feature indices
+    weights = db.Column(db.LargeBinary, nullable=False)  # float32 L2-normalised weights
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_vector(self):
+        return decode_vector(self.indices, self.weights, self.dimension)
+    
+    def __repr__(self):
+        return f'<NoteVector {self.note_id}>'
+
+class CohortBaseline(db.Model):
+    __tablename__ = 'cohort_baselines'
+    __table_args__ = (db.UniqueConstraint('model_version', 'cohort_type', 'cohort_key'),)
+    
+    baseline_id = db.Column(db.Integer, primary_key=True)
+    model_version = db.Column(db.String(50), nullable=False)  # Centroids live in this backend's feature space
+    cohort_type = db.Column(db.String(20), nullable=False)  # note_type or department
+    cohort_key = db.Column(db.String(100), nullable=False)
+    note_count = db.Column(db.Integer, default=0)
+    dimension = db.Column(db.Integer, nullable=True)
+    centroid_indices = db.Column(db.LargeBinary, nullable=True)  # Pruned sum of note vectors
+    centroid_weights = db.Column(db.LargeBinary, nullable=True)
+    length_mean = db.Column(db.Float, default=0.0)
+    length_m2 = db.Column(db.Float, default=0.0)
+    vocabulary_mean = db.Column(db.Float, default=0.0)
+    vocabulary_m2 = db.Column(db.Float, default=0.0)
+    last_note_id = db.Column(db.Integer, default=0)  # Notes up to this id are folded in
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CohortBaseline {self.cohort_type}:{self.cohort_key}>'
+
+class AnomalyEvent(db.Model):
+    __tablename__ = 'anomaly_events'
+    
+    event_id = db.Column(db.Integer, primary_key=True)  # SSE event id; clients resume after it
+    note_id = db.Column(db.Integer, db.ForeignKey('case_notes.note_id'), nullable=False, index=True)
+    anomaly_score = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AnomalyEvent {self.event_id}>'
+
+class AnomalyRollup(db.Model):
+    __tablename__ = 'anomaly_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket_start', 'dimension', 'dimension_key', 'severity',
+                            name='uq_anomaly_rollups_bucket'),
+        db.Index('ix_anomaly_rollups_series', 'granularity', 'dimension', 'bucket_start'),
+    )
+    
+    rollup_id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour or day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)  # all, note_type, department or staff
+    dimension_key = db.Column(db.String(100), nullable=False)
+    severity = db.Column(db.String(10), nullable=False)  # high, medium or low band
+    scored_count = db.Column(db.Integer, nullable=False, default=0)
+    flagged_count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<AnomalyRollup {self.granularity} {self.bucket_start} {self.dimension}:{self.dimension_key}>'
+
+def note_list_options():
+    """Loader options projecting a note listing onto the staff index columns and patient identity"""
+    return (db.load_only(CaseNote.note_id, CaseNote.patient_id, CaseNote.note_type, CaseNote.title,
+                         CaseNote.is_flagged, CaseNote.anomaly_score, CaseNote.duplicate_kind,
+                         CaseNote.s3_file_key, CaseNote.created_at, CaseNote.updated_at),
+            db.joinedload(CaseNote.patient).load_only(Patient.first_name, Patient.last_name,
+                                                      Patient.medical_record_number))
+
+def paginate_notes(query, page, per_page=10):
+    """Paginate a note listing, counting note ids instead of wrapping every column in a subquery"""
+    notes = query.paginate(page=page, per_page=per_page, error_out=False, count=False)
+    notes.total = query.order_by(None).with_entities(db.func.count(CaseNote.note_id)).scalar()
+    return notes
+
+def note_preview(length):
+    """Loader option filling content_preview with one character more than the page shows"""
+    return db.with_expression(CaseNote.content_preview, db.func.substr(CaseNote.content, 1, length + 1))
+
+def _latest(column, value):
+    """SQL expression keeping the larger of a summary column and a new value"""
+    return db.case((db.or_(column.is_(None), column <= value), value), else_=column)
+
+def patient_summary_values():
+    """Correlated aggregates that recompute every Patient summary column from case_notes"""
+    notes = CaseNote.__table__
+    patients = Patient.__table__
+    of_patient = notes.c.patient_id == patients.c.patient_id
+    return {
+        'note_count': db.select(db.func.count()).where(of_patient).scalar_subquery(),
+        'flagged_count': db.select(db.func.count()).where(of_patient, notes.c.is_flagged.is_(True)).scalar_subquery(),
+        'last_note_at': db.select(db.func.max(notes.c.created_at)).where(of_patient).scalar_subquery(),
+        'last_note_staff_id': db.select(notes.c.staff_id).where(of_patient)
+                                .order_by(notes.c.created_at.desc(), notes.c.note_id.desc())
+                                .limit(1).scalar_subquery(),
+        'max_anomaly_score': db.select(db.func.max(notes.c.anomaly_score)).where(of_patient).scalar_subquery()
+    }
+
+def refresh_patient_summaries(connection, patient_ids=None):
+    """Recompute summary columns for the given patients (all patients if None)"""
+    patients = Patient.__table__
+    statement = patients.update().values(**patient_summary_values())
+    if patient_ids is not None:
+        statement = statement.where(patients.c.patient_id.in_(list(patient_ids)))
+    return connection.execute(statement).rowcount
+
+@db.event.listens_for(CaseNote, 'before_insert')
+def fingerprint_new_note(mapper, connection, note):
+    """Hash note content as it is first written"""
+    note.content_sha256 = content_sha256(note.content)
+    note.content_simhash = simhash(note.content)
+
+@db.event.listens_for(CaseNote, 'before_update')
+def fingerprint_edited_note(mapper, connection, note):
+    """Re-hash note content when it is edited"""
+    if db.inspect(note).attrs.content.history.has_changes():
+        note.content_sha256 = content_sha256(note.content)
+        note.content_simhash = simhash(note.content)
+
+@db.event.listens_for(CaseNote, 'after_insert')
+def case_note_inserted(mapper, connection, note):
+    """Fold a new note into its patient's summary in the same transaction"""
+    patients = Patient.__table__
+    values = {
+        'note_count': patients.c.note_count + 1,
+        'flagged_count': patients.c.flagged_count + (1 if note.is_flagged else 0),
+        'last_note_at': _latest(patients.c.last_note_at, note.created_at),
+        'last_note_staff_id': db.case(
+            (db.or_(patients.c.last_note_at.is_(None), patients.c.last_note_at <= note.created_at), note.staff_id),
+            else_=patients.c.last_note_staff_id
+        )
+    }
+    if note.anomaly_score is not None:
+        values['max_anomaly_score'] = _latest(patients.c.max_anomaly_score, note.anomaly_score)
+    connection.execute(patients.update().where(patients.c.patient_id == note.patient_id).values(**values))
+
+@db.event.listens_for(CaseNote, 'after_update')
+def case_note_updated(mapper, connection, note):
+    """Apply flag and score changes incrementally; recompute when that is not possible"""
+    state = db.inspect(note)
+    patients = Patient.__table__
+    
+    # Moving a note or changing its time/author can change which note is the latest
+    moved = [key for key in ('patient_id', 'created_at', 'staff_id') if state.attrs[key].history.has_changes()]
+    if moved:
+        patient_ids = {note.patient_id, *state.attrs.patient_id.history.deleted}
+        refresh_patient_summaries(connection, [pid for pid in patient_ids if pid is not None])
+        return
+    
+    values = {}
+    flag_history = state.attrs.is_flagged.history
+    if flag_history.has_changes():
+        was_flagged = bool(flag_history.deleted[0]) if flag_history.deleted else False
+        delta = int(bool(note.is_flagged)) - int(was_flagged)
+        if delta:
+            values['flagged_count'] = patients.c.flagged_count + delta
+    
+    score_history = state.attrs.anomaly_score.history
+    if score_history.has_changes():
+        old_score = score_history.deleted[0] if score_history.deleted else None
+        if note.anomaly_score is not None and (old_score is None or note.anomaly_score >= old_score):
+            values['max_anomaly_score'] = _latest(patients.c.max_anomaly_score, note.anomaly_score)
+        else:
+            # A lowered score may have been the maximum
+            values['max_anomaly_score'] = patient_summary_values()['max_anomaly_score']
+    
+    if values:
+        connection.execute(patients.update().where(patients.c.patient_id == note.patient_id).values(**values))
+
+@db.event.listens_for(CaseNote, 'after_delete')
+def case_note_deleted(mapper, connection, note):
+    refresh_patient_summaries(connection, [note.patient_id])
+
 @login_manager.user_loader
 def load_user(user_id):
     return Staff.query.get(int(user_id))
 
+@app.before_request
+def start_note_spool():
+    """Open this worker's note spool and drainer on its first request"""
+    note_spool.ensure_started()
+
+@app.after_request
+def compress(response):
+    """Compress large text responses for clients that accept it"""
+    if not app.config['COMPRESS_RESPONSES']:
+        return response
+    return compress_response(
+        response, request.accept_encodings,
+        min_size=app.config['COMPRESS_MIN_SIZE'],
+        gzip_level=app.config['COMPRESS_GZIP_LEVEL'],
+        brotli_quality=app.config['COMPRESS_BROTLI_QUALITY']
+    )
+
 # Routes
 @app.route('/')
 def index():
@@ -191,16 +536,25 @@ def logout():
 def dashboard():
     # Get recent case notes by current user
     recent_notes = CaseNote.query.filter_by(staff_id=current_user.staff_id)\
+                                .options(*note_list_options())\
                                 .order_by(CaseNote.created_at.desc())\
                                 .limit(5).all()
     
-    # Get statistics
-    total_notes = CaseNote.query.filter_by(staff_id=current_user.staff_id).count()
-    flagged_notes = CaseNote.query.filter_by(staff_id=current_user.staff_id, is_flagged=True).count()
-    total_patients = Patient.query.count()
+    # All three statistics in one round trip; the note counts read only the staff index
+    total_notes, flagged_notes, total_patients = db.session.query(
+        db.func.count(CaseNote.note_id),
+        db.func.coalesce(db.func.sum(db.case((CaseNote.is_flagged == True, 1), else_=0)), 0),
+        db.select(db.func.count(Patient.patient_id)).scalar_subquery()
+    ).filter(CaseNote.staff_id == current_user.staff_id).one()
+    
+    # Riskiest patients straight from the indexed summary columns
+    at_risk_patients = Patient.query.filter(Patient.flagged_count > 0)\
+                                    .order_by(Patient.max_anomaly_score.desc())\
+                                    .limit(5).all()
     
     return render_template('dashboard.html', 
                          recent_notes=recent_notes,
+                         at_risk_patients=at_risk_patients,
                          total_notes=total_notes,
                          flagged_notes=flagged_notes,
                          total_patients=total_patients)
@@ -209,9 +563,9 @@ def dashboard():
 @login_required
 def case_notes():
     page = request.args.get('page', 1, type=int)
-    notes = CaseNote.query.filter_by(staff_id=current_user.staff_id)\
-                         .order_by(CaseNote.created_at.desc())\
-                         .paginate(page=page, per_page=10, error_out=False)
+    notes = paginate_notes(CaseNote.query.filter_by(staff_id=current_user.staff_id)
+                                         .options(*note_list_options())
+                                         .order_by(CaseNote.created_at.desc()), page)
     return render_template('case_notes.html', notes=notes)
 
 @app.route('/add_case_note', methods=['GET', 'POST'])
@@ -222,6 +576,13 @@ def add_case_note():
         note_type = request.form['note_type']
         title = request.form['title']
         content = request.form['content']
+        attachment = request.files.get('attachment')
+        
+        if attachment and attachment.filename:
+            extension = os.path.splitext(attachment.filename)[1].lower()
+            if extension not in app.config['UPLOAD_EXTENSIONS']:
+                flash(f'Attachments must be one of: {", ".join(app.config["UPLOAD_EXTENSIONS"])}', 'error')
+                return render_template('add_case_note.html', patients=Patient.query.all())
         
         # Create new case note with metadata
         case_note = CaseNote(
@@ -236,28 +597,48 @@ def add_case_note():
         db.session.add(case_note)
         db.session.flush()  # This assigns the note_id without committing
         
-        # Upload full content to S3 and store metadata in database
+        # Stream the attachment (spooled to disk by Werkzeug) to S3
+        attachment_row = None
+        if attachment and attachment.filename:
+            try:
+                attachment_row = upload_attachment_to_s3(case_note, attachment)
+                db.session.add(attachment_row)
+            except S3UnavailableError as e:
+                db.session.rollback()
+                flash(f'Storage is temporarily unavailable, please retry the attachment: {str(e)}', 'error')
+                return render_template('add_case_note.html', patients=Patient.query.all())
+            except Exception as e:
+                db.session.rollback()
+                flash(f'Error uploading to S3: {str(e)}', 'error')
+                return render_template('add_case_note.html', patients=Patient.query.all())
+        
+        # The body goes to the local spool and reaches S3 in the background,
+        # so saving a note neither waits on nor fails with S3
+        spooled = True
         try:
-            s3_metadata = upload_case_note_to_s3_with_metadata(case_note, current_user)
-            
-            # Update case note with S3 metadata
-            case_note.s3_file_key = s3_metadata['file_key']
-            case_note.s3_bucket = s3_metadata['bucket']
-            case_note.file_size = s3_metadata['file_size']
-            case_note.file_type = s3_metadata['file_type']
-            
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Error uploading to S3: {str(e)}', 'error')
-            return render_template('add_case_note.html', patients=Patient.query.all())
+            spool_case_note_upload(case_note)
+        except OSError:
+            # The note body is kept in the database, so it can be saved without the spool
+            spooled = False
         
-        # Commit the transaction
-        db.session.commit()
+        # Commit the transaction; the drainer can only store the body once the note is visible
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if attachment_row is not None:
+                discard_s3_object(attachment_row.s3_bucket, attachment_row.s3_file_key)
+            raise
+        if spooled:
+            note_spool.notify()
         
         # Run NLP anomaly detection asynchronously
         try:
             run_anomaly_detection(case_note.note_id)
-            flash('Case note added successfully and uploaded to secure storage!', 'success')
+            if spooled:
+                flash('Case note added successfully and queued for secure storage!', 'success')
+            else:
+                flash('Case note saved, but it could not be queued for secure storage.', 'warning')
         except Exception as e:
             flash(f'Note saved successfully, but anomaly detection encountered an issue: {str(e)}', 'warning')
         
@@ -266,42 +647,163 @@ def add_case_note():
     patients = Patient.query.filter_by(status='Active').order_by(Patient.last_name, Patient.first_name).all()
     return render_template('add_case_note.html', patients=patients)
 
+# Patient list sort orders as keyset (column, descending) pairs ending in a unique key
+PATIENT_SORTS = {
+    'name': [(Patient.last_name, False), (Patient.first_name, False), (Patient.patient_id, False)],
+    'mrn': [(Patient.medical_record_number, False)],
+    'admission': [(Patient.admission_sort_date, True), (Patient.patient_id, True)],
+    'age': [(Patient.date_of_birth, True), (Patient.patient_id, True)]
+}
+
+PATIENT_AGE_RANGES = {'18-25': (18, 25), '26-35': (26, 35), '36-50': (36, 50), '51-65': (51, 65), '65+': (65, None)}
+
+def years_before(day, years):
+    """The same calendar day `years` earlier (29 February maps to 28 February)"""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+def date_of_birth_bounds(age_range, today=None):
+    """Translate an age range like '26-35' into (earliest, latest) date_of_birth bounds"""
+    youngest, oldest = PATIENT_AGE_RANGES[age_range]
+    today = today or date.today()
+    latest = years_before(today, youngest)
+    # Still `oldest` until the day before their (oldest + 1)th birthday
+    earliest = years_before(today, oldest + 1) + timedelta(days=1) if oldest is not None else None
+    return earliest, latest
+
 @app.route('/patients')
 @login_required
 def patients():
-    page = request.args.get('page', 1, type=int)
-    patients = Patient.query.paginate(page=page, per_page=10, error_out=False)
-    return render_template('patients.html', patients=patients)
+    search = request.args.get('search', '').strip()
+    status = request.args.get('status', '')
+    sort_by = request.args.get('sort_by', 'name')
+    age_range = request.args.get('age_range', '')
+    if sort_by not in PATIENT_SORTS:
+        sort_by = 'name'
+    
+    query = Patient.query.options(db.joinedload(Patient.last_note_staff))
+    if status:
+        query = query.filter(Patient.status == status)
+    if age_range in PATIENT_AGE_RANGES:
+        # Bounds on the indexed column rather than computing each patient's age
+        earliest, latest = date_of_birth_bounds(age_range)
+        query = query.filter(Patient.date_of_birth <= latest)
+        if earliest:
+            query = query.filter(Patient.date_of_birth >= earliest)
+    if search:
+        if search.isdigit():
+            query = query.filter(db.or_(Patient.patient_id == int(search),
+                                        Patient.medical_record_number.ilike(f'%{search}%')))
+        else:
+            # Every word must match a name or the MRN, so "jane smith" finds Jane Smith
+            for term in search.split():
+                query = query.filter(db.or_(
+                    Patient.first_name.ilike(f'%{term}%'),
+                    Patient.last_name.ilike(f'%{term}%'),
+                    Patient.medical_record_number.ilike(f'%{term}%')
+                ))
+    
+    patients = keyset_paginate(query, PATIENT_SORTS[sort_by],
+                               after=request.args.get('after'), before=request.args.get('before'),
+                               per_page=10)
+    filters = {key: value for key, value in
+               (('search', search), ('status', status), ('sort_by', sort_by), ('age_range', age_range)) if value}
+    return render_template('patients.html', patients=patients, filters=filters)
 
 @app.route('/anomalies')
 @login_required
 def anomalies():
-    flagged_notes = CaseNote.query.filter_by(is_flagged=True)\
-                                 .order_by(CaseNote.anomaly_score.desc()).all()
-    return render_template('anomalies.html', flagged_notes=flagged_notes)
+    # Read the feed cursor before the list, so a note flagged in between is streamed rather than lost
+    last_event_id = db.session.query(db.func.max(AnomalyEvent.event_id)).scalar() or 0
+    
+    query = CaseNote.query.filter_by(is_flagged=True)
+    
+    # The same filters the live feed applies to streamed notes in the browser
+    severity = request.args.get('severity', '')
+    if severity in dict(SEVERITY_BANDS):
+        lower, upper = severity_bounds(severity)
+        if lower > 0:
+            query = query.filter(CaseNote.anomaly_score >= lower)
+        if upper is not None:
+            query = query.filter(CaseNote.anomaly_score < upper)
+    if request.args.get('note_type'):
+        query = query.filter(CaseNote.note_type == request.args['note_type'])
+    if request.args.get('staff_filter') == 'current':
+        query = query.filter(CaseNote.staff_id == current_user.staff_id)
+    since = None
+    if request.args.get('date_range') in ROLLUP_RANGES:
+        since = (datetime.utcnow() - ROLLUP_RANGES[request.args['date_range']])\
+                    .replace(hour=0, minute=0, second=0, microsecond=0)
+        query = query.filter(CaseNote.created_at >= since)
+    
+    # Rows are cached by note id and updated_at alone, so list just those first and load
+    # full notes, with their patient and staff joins, only for rows not already rendered
+    listed = query.with_entities(CaseNote.note_id, CaseNote.updated_at)\
+                  .order_by(CaseNote.anomaly_score.desc()).all()
+    fragments = app.jinja_env.fragment_cache.get_many(
+        [('anomaly-row', row.note_id, row.updated_at) for row in listed])
+    cached_rows = {key[1]: fragment for key, fragment in fragments.items()}
+    missing = [row.note_id for row in listed if row.note_id not in cached_rows]
+    loaded = {}
+    for start in range(0, len(missing), 1000):
+        for note in CaseNote.query.filter(CaseNote.note_id.in_(missing[start:start + 1000]))\
+                                  .options(db.defer(CaseNote.content), note_preview(60),
+                                           db.joinedload(CaseNote.patient), db.joinedload(CaseNote.staff_member)):
+            loaded[note.note_id] = note
+    flagged_notes = [row if row.note_id in cached_rows else loaded[row.note_id]
+                     for row in listed if row.note_id in cached_rows or row.note_id in loaded]
+    
+    # Summary counters come from the daily rollups rather than scanning case_notes
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    _, recent_anomalies = anomaly_rollup_totals(start=today - timedelta(days=6))
+    scored, flagged = anomaly_rollup_totals()
+    anomaly_rate = round(100.0 * flagged / scored, 1) if scored else 0
+    return render_template('anomalies.html', flagged_notes=flagged_notes, cached_rows=cached_rows,
+                           last_event_id=last_event_id, since=since, recent_anomalies=recent_anomalies, anomaly_rate=anomaly_rate)
+
+CLIENT_QUICK_VIEWS = {
+    'recent': 'Recently Active Clients',
+    'active': 'Active Clients',
+    'flagged': 'Clients with Flagged Notes',
+    'new': 'New Admissions'
+}
 
 @app.route('/client_search')
 @login_required
 def client_search():
     search_query = request.args.get('search', '')
+    view = request.args.get('view', '')
     page = request.args.get('page', 1, type=int)
     
+    query = Patient.query.options(db.joinedload(Patient.last_note_staff))
     if search_query:
         # Search patients by name, MRN, or patient ID
-        patients = Patient.query.filter(
+        query = query.filter(
             db.or_(
                 Patient.first_name.ilike(f'%{search_query}%'),
                 Patient.last_name.ilike(f'%{search_query}%'),
                 Patient.medical_record_number.ilike(f'%{search_query}%'),
-                db.func.concat(Patient.first_name, ' ', Patient.last_name).ilike(f'%{search_query}%')
+                (Patient.first_name + ' ' + Patient.last_name).ilike(f'%{search_query}%')
             )
-        ).order_by(Patient.last_name, Patient.first_name)\
-         .paginate(page=page, per_page=10, error_out=False)
+        )
+    
+    # Quick views use the denormalized note summary columns, which are indexed
+    if view == 'recent':
+        query = query.filter(Patient.last_note_at.isnot(None)).order_by(Patient.last_note_at.desc())
+    elif view == 'flagged':
+        query = query.filter(Patient.flagged_count > 0).order_by(Patient.max_anomaly_score.desc())
+    elif view == 'active':
+        query = query.filter(Patient.status == 'Active').order_by(Patient.last_name, Patient.first_name)
+    elif view == 'new':
+        query = query.order_by(Patient.admission_date.desc())
     else:
-        patients = Patient.query.order_by(Patient.last_name, Patient.first_name)\
-                               .paginate(page=page, per_page=10, error_out=False)
+        query = query.order_by(Patient.last_name, Patient.first_name)
     
-    return render_template('client_search.html', patients=patients, search_query=search_query)
+    patients = query.paginate(page=page, per_page=10, error_out=False)
+    return render_template('client_search.html', patients=patients, search_query=search_query,
+                           view=view, quick_views=CLIENT_QUICK_VIEWS)
 
 @app.route('/client_notes/<int:patient_id>')
 @login_required
@@ -313,8 +815,10 @@ def client_notes(patient_id):
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
     
-    # Build query for patient's case notes
-    query = CaseNote.query.filter_by(patient_id=patient_id)
+    # Build query for patient's case notes; the cards only show the opening of each note
+    query = CaseNote.query.filter_by(patient_id=patient_id)\
+                          .options(db.defer(CaseNote.content), note_preview(200),
+                                   db.joinedload(CaseNote.staff_member))
     
     # Apply filters
     if note_type:
@@ -341,20 +845,20 @@ def client_notes(patient_id):
             pass
     
     # Get paginated notes
-    notes = query.order_by(CaseNote.created_at.desc())\
-                 .paginate(page=page, per_page=10, error_out=False)
+    notes = paginate_notes(query.order_by(CaseNote.created_at.desc()), page)
     
     # Get all staff who have written notes for this patient
     staff_list = db.session.query(Staff).join(CaseNote)\
                           .filter(CaseNote.patient_id == patient_id)\
                           .distinct().all()
     
-    # Calculate statistics
-    total_notes = CaseNote.query.filter_by(patient_id=patient_id).count()
-    flagged_notes = CaseNote.query.filter_by(patient_id=patient_id, is_flagged=True).count()
-    recent_notes = CaseNote.query.filter_by(patient_id=patient_id)\
-                                .filter(CaseNote.created_at >= datetime.now() - timedelta(days=30))\
-                                .count()
+    # All three statistics in one round trip that reads no note bodies
+    total_notes, flagged_notes, recent_notes = db.session.query(
+        db.func.count(CaseNote.note_id),
+        db.func.coalesce(db.func.sum(db.case((CaseNote.is_flagged == True, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((CaseNote.created_at >= datetime.now() - timedelta(days=30), 1),
+                                             else_=0)), 0)
+    ).filter(CaseNote.patient_id == patient_id).one()
     
     return render_template('client_notes.html', 
                          patient=patient, 
@@ -373,23 +877,190 @@ def view_note(note_id):
     s3_content = None
     if note.s3_file_key and note.s3_bucket:
         try:
-            s3_data = retrieve_case_note_from_s3(note.s3_file_key, note.s3_bucket)
+            s3_data = retrieve_case_note_from_s3(note.s3_file_key, note.s3_bucket, note.file_type)
             s3_content = s3_data['content']
+        except S3UnavailableError:
+            flash('Secure storage is temporarily unavailable; showing the database copy of this note.', 'info')
         except Exception as e:
             flash(f'Could not retrieve full content from storage: {str(e)}', 'warning')
     
-    # Get related notes for context (previous 3 notes for same patient)
-    related_notes = CaseNote.query.filter(
-        CaseNote.patient_id == note.patient_id,
-        CaseNote.note_id != note.note_id,
-        CaseNote.created_at < note.created_at
-    ).order_by(CaseNote.created_at.desc()).limit(3).all()
+    # Get related notes for context (most similar notes for same patient)
+    related_notes = find_related_notes(note)
     
     return render_template('view_note.html', 
                          note=note, 
                          s3_content=s3_content,
                          related_notes=related_notes)
 
+@app.route('/download_note/<int:note_id>')
+@login_required
+def download_note(note_id):
+    """Stream the stored note body from S3 without buffering it"""
+    note = CaseNote.query.get_or_404(note_id)
+    if not (note.s3_file_key and note.s3_bucket):
+        abort(404)
+    
+    return stream_s3_object(note.s3_bucket, note.s3_file_key, storage_codec(note.file_type),
+                            'text/plain; charset=utf-8', f'case_note_{note.note_id}.txt')
+
+@app.route('/attachment/<int:attachment_id>')
+@login_required
+def download_attachment(attachment_id):
+    """Stream an attachment from S3, honouring Range requests"""
+    attachment = NoteAttachment.query.get_or_404(attachment_id)
+    
+    # Rows written before types were fixed by extension may hold whatever the browser sent
+    return stream_s3_object(attachment.s3_bucket, attachment.s3_file_key, 'none',
+                            attachment_content_type(attachment.filename), attachment.filename)
+
+@app.route('/api/s3_metrics')
+@login_required
+def api_s3_metrics():
+    """Per-operation S3 latency percentiles, circuit breaker and note spool state for this worker"""
+    return jsonify(dict(s3_gateway.metrics(), spool=note_spool.stats()))
+
+ROLLUP_RANGES = {'today': timedelta(0), 'week': timedelta(days=6), 'month': timedelta(days=29)}
+ROLLUP_MAX_BUCKETS = 24 * 31
+
+def parse_utc_datetime(value):
+    """ISO date or datetime as naive UTC, the way timestamps are stored"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def anomaly_rollup_totals(granularity='day', start=None, end=None):
+    """Scored and flagged note totals from the hospital-wide rollups"""
+    query = db.session.query(db.func.coalesce(db.func.sum(AnomalyRollup.scored_count), 0),
+                             db.func.coalesce(db.func.sum(AnomalyRollup.flagged_count), 0))\
+                      .filter(AnomalyRollup.granularity == granularity, AnomalyRollup.dimension == 'all')
+    if start:
+        query = query.filter(AnomalyRollup.bucket_start >= start)
+    if end:
+        query = query.filter(AnomalyRollup.bucket_start <= end)
+    scored, flagged = query.one()
+    return int(scored), int(flagged)
+
+@app.route('/api/anomaly_rollups')
+@login_required
+def api_anomaly_rollups():
+    """Anomaly trend series per bucket and dimension key, read from the materialized rollups"""
+    granularity = request.args.get('granularity', 'day')
+    dimension = request.args.get('dimension', 'all')
+    if granularity not in GRANULARITIES or dimension not in DIMENSIONS:
+        return jsonify({'error': f'granularity must be one of {GRANULARITIES}, dimension one of {DIMENSIONS}'}), 400
+    
+    now = datetime.utcnow()
+    try:
+        start = parse_utc_datetime(request.args['from']) if request.args.get('from') else None
+        end = parse_utc_datetime(request.args['to']) if request.args.get('to') else now
+    except ValueError:
+        return jsonify({'error': 'from and to must be ISO dates'}), 400
+    if start is None:
+        span = ROLLUP_RANGES.get(request.args.get('range', 'week'), ROLLUP_RANGES['week'])
+        start = (now - span).replace(hour=0, minute=0, second=0, microsecond=0)
+    # Checked before the bucket list is built, so a wide range cannot make the server build it
+    if bucket_count(start, end, granularity) > ROLLUP_MAX_BUCKETS:
+        return jsonify({'error': 'Too many buckets; use day granularity for long ranges'}), 400
+    buckets = bucket_range(start, end, granularity)
+    
+    query = AnomalyRollup.query.filter(
+        AnomalyRollup.granularity == granularity,
+        AnomalyRollup.dimension == dimension,
+        AnomalyRollup.bucket_start >= (buckets[0] if buckets else start),
+        AnomalyRollup.bucket_start <= end
+    )
+    if request.args.get('key'):
+        query = query.filter(AnomalyRollup.dimension_key == request.args['key'])
+    if request.args.get('severity'):
+        query = query.filter(AnomalyRollup.severity == request.args['severity'])
+    
+    position = {bucket: index for index, bucket in enumerate(buckets)}
+    series = {}
+    score_sums = {}
+    by_severity = {band: {'scored': 0, 'flagged': 0} for band, _ in SEVERITY_BANDS}
+    for row in query.all():
+        if row.dimension_key not in series:
+            series[row.dimension_key] = {'scored': [0] * len(buckets), 'flagged': [0] * len(buckets)}
+            score_sums[row.dimension_key] = [0.0] * len(buckets)
+        index = position[row.bucket_start]
+        series[row.dimension_key]['scored'][index] += row.scored_count
+        series[row.dimension_key]['flagged'][index] += row.flagged_count
+        score_sums[row.dimension_key][index] += row.score_sum
+        by_severity[row.severity]['scored'] += row.scored_count
+        by_severity[row.severity]['flagged'] += row.flagged_count
+    
+    for key, values in series.items():
+        values['avg_score'] = [round(total / count, 4) if count else None
+                               for total, count in zip(score_sums[key], values['scored'])]
+    
+    scored = sum(band['scored'] for band in by_severity.values())
+    flagged = sum(band['flagged'] for band in by_severity.values())
+    return jsonify({
+        'granularity': granularity,
+        'dimension': dimension,
+        'from': buckets[0].isoformat() if buckets else start.isoformat(),
+        'to': end.isoformat(),
+        'buckets': [bucket.isoformat() for bucket in buckets],
+        'series': series,
+        'totals': {
+            'scored': scored,
+            'flagged': flagged,
+            'detection_rate': round(100.0 * flagged / scored, 1) if scored else 0.0,
+            'by_severity': by_severity
+        }
+    })
+
+def fetch_anomaly_events(last_event_id, limit):
+    """Anomaly events after last_event_id with the fields the anomalies table shows"""
+    rows = db.session.query(
+        AnomalyEvent.event_id, CaseNote.note_id, CaseNote.note_type, CaseNote.title,
+        db.func.substr(CaseNote.content, 1, 61).label('snippet'), CaseNote.created_at,
+        CaseNote.anomaly_score, CaseNote.is_flagged, CaseNote.duplicate_kind,
+        Patient.first_name.label('patient_first_name'), Patient.last_name.label('patient_last_name'),
+        Patient.medical_record_number,
+        Staff.staff_id, Staff.first_name.label('staff_first_name'), Staff.last_name.label('staff_last_name'),
+        Staff.job_title
+    ).join(CaseNote, AnomalyEvent.note_id == CaseNote.note_id)\
+     .join(Patient, CaseNote.patient_id == Patient.patient_id)\
+     .join(Staff, CaseNote.staff_id == Staff.staff_id)\
+     .filter(AnomalyEvent.event_id > last_event_id)\
+     .order_by(AnomalyEvent.event_id).limit(limit).all()
+    # Hand the connection back to the pool between polls of a long-lived stream
+    db.session.close()
+    
+    return [(row.event_id, {
+        'note_id': row.note_id,
+        'note_type': row.note_type,
+        'title': row.title,
+        'snippet': row.snippet,
+        'created_at': row.created_at.strftime('%Y-%m-%d %H:%M'),
+        'anomaly_score': row.anomaly_score,
+        'is_flagged': row.is_flagged,
+        'duplicate_kind': row.duplicate_kind,
+        'patient_name': f'{row.patient_first_name} {row.patient_last_name}',
+        'medical_record_number': row.medical_record_number,
+        'staff_id': row.staff_id,
+        'staff_name': f'{row.staff_first_name} {row.staff_last_name}',
+        'job_title': row.job_title
+    }) for row in rows]
+
+@app.route('/api/anomalies/stream')
+@login_required
+def anomaly_stream():
+    """Server-Sent Events stream of newly flagged notes, resumable via Last-Event-ID"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+    
+    response = Response(stream_with_context(anomaly_feed.stream(fetch_anomaly_events, last_event_id)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx buffering the stream
+    return response
+
 @app.route('/api/search_patients')
 @login_required
 def api_search_patients():
@@ -403,7 +1074,7 @@ def api_search_patients():
             Patient.first_name.ilike(f'%{query}%'),
             Patient.last_name.ilike(f'%{query}%'),
             Patient.medical_record_number.ilike(f'%{query}%'),
-            db.func.concat(Patient.first_name, ' ', Patient.last_name).ilike(f'%{query}%')
+            (Patient.first_name + ' ' + Patient.last_name).ilike(f'%{query}%')
         )
     ).limit(10).all()
     
@@ -418,111 +1089,639 @@ def api_search_patients():
     
     return jsonify(results)
 
-def upload_case_note_to_s3_with_metadata(case_note, staff_user):
-    """Upload case note content to S3 with comprehensive metadata and return metadata dict"""
-    # Create structured file path
-    file_key = f"case_notes/{case_note.patient_id}/{datetime.now().strftime('%Y/%m/%d')}/{case_note.note_id}_{uuid.uuid4().hex}.txt"
-    
-    # Get patient information
-    patient = Patient.query.get(case_note.patient_id)
-    
-    # Prepare comprehensive metadata
-    s3_metadata = {
-        'note_id': str(case_note.note_id),
-        'patient_id': str(case_note.patient_id),
-        'patient_mrn': patient.medical_record_number if patient else 'unknown',
-        'patient_name': f"{patient.first_name} {patient.last_name}" if patient else 'unknown',
-        'staff_id': str(case_note.staff_id),
-        'staff_name': f"{staff_user.first_name} {staff_user.last_name}",
-        'staff_title': staff_user.job_title,
-        'staff_department': staff_user.department or 'unknown',
-        'note_type': case_note.note_type,
-        'note_title': case_note.title,
-        'created_at': datetime.now().isoformat(),
-        'content_length': str(len(case_note.content)),
-        'hospital_name': app.config.get('HOSPITAL_NAME', 'Mental Health Hospital'),
-        'system_version': '1.0.0'
-    }
+def spool_case_note_upload(case_note):
+    """Queue the note body for S3 in the local spool, keyed by its content hash"""
+    # Optionally compress the body at rest; the codec is recorded in file_type
+    body, codec = compress_body(case_note.content.encode('utf-8'), app.config['S3_COMPRESSION'])
     
-    try:
-        # Upload to S3 with rich metadata
-        s3_client.put_object(
-            Bucket=app.config['AWS_S3_BUCKET'],
-            Key=file_key,
-            Body=case_note.content.encode('utf-8'),
-            ContentType='text/plain; charset=utf-8',
-            Metadata=s3_metadata,
-            ServerSideEncryption='AES256',  # Enable encryption
-            StorageClass='STANDARD'  # Can be changed to STANDARD_IA for cost optimization
-        )
+    # Content-addressed: identical bodies share one object, named by hash and encoding,
+    # which also makes replaying a spooled upload idempotent
+    sha256 = case_note.content_sha256 or content_sha256(case_note.content)
+    note_spool.append({
+        'note_id': case_note.note_id,
+        # Ids of rolled-back notes are reused, so the drainer matches on content as well
+        'content_sha256': sha256,
+        'bucket': app.config['AWS_S3_BUCKET'],
+        'file_key': f"case_notes/sha256/{sha256[:2]}/{sha256}.txt{'' if codec == 'none' else '.' + codec}",
+        'file_type': compressed_file_type('text/plain', codec),
+        'content_encoding': None if codec == 'none' else codec,
+        # Shared objects carry no per-note metadata; patient and author details live in the database
+        'metadata': {
+            'content_sha256': sha256,
+            'content_length': str(len(case_note.content)),
+            'hospital_name': app.config.get('HOSPITAL_NAME', 'Mental Health Hospital'),
+            'system_version': '1.0.0'
+        },
+        'spooled_at': time.time()
+    }, body)
+
+def store_spooled_notes(records):
+    """Upload spooled note bodies to S3 and record their keys; returns (records done, waiting on a commit)"""
+    with app.app_context():
+        headers = [record.header for record in records]
+        existing = dict(db.session.query(CaseNote.note_id, CaseNote.content_sha256).filter(
+            CaseNote.note_id.in_([header['note_id'] for header in headers])))
+        stored = set(db.session.query(CaseNote.s3_file_key, CaseNote.s3_bucket).filter(
+            CaseNote.s3_file_key.in_({header['file_key'] for header in headers})).distinct())
         
-        # Return metadata for database storage
-        return {
-            'file_key': file_key,
-            'bucket': app.config['AWS_S3_BUCKET'],
-            'file_size': len(case_note.content.encode('utf-8')),
-            'file_type': 'text/plain',
-            'upload_timestamp': datetime.now().isoformat(),
-            'staff_id': case_note.staff_id
-        }
+        done, updates, error, waiting = 0, [], None, False
+        for record, header in zip(records, headers):
+            # Records spooled before the hash was a header field carry it in the object metadata
+            sha256 = header.get('content_sha256') or header['metadata']['content_sha256']
+            if header['note_id'] not in existing:
+                # Spooled before its transaction committed: wait for it, unless it was rolled back
+                if time.time() - header['spooled_at'] < app.config['NOTE_SPOOL_GRACE']:
+                    waiting = True
+                    break
+                done += 1
+                continue
+            if existing[header['note_id']] != sha256:
+                # The note was rolled back and its id reused (or its content has since changed)
+                done += 1
+                continue
+            if (header['file_key'], header['bucket']) not in stored:
+                try:
+                    s3_gateway.upload_bytes(
+                        record.body, header['bucket'], header['file_key'],
+                        content_type='text/plain; charset=utf-8',
+                        metadata=header['metadata'],
+                        content_encoding=header['content_encoding']
+                    )
+                except Exception as e:
+                    error = e
+                    break
+                stored.add((header['file_key'], header['bucket']))
+            updates.append({
+                'b_note_id': header['note_id'],
+                'b_content_sha256': sha256,
+                's3_file_key': header['file_key'],
+                's3_bucket': header['bucket'],
+                'file_size': len(record.body),
+                'file_type': header['file_type'],
+                'updated_at': datetime.utcnow()
+            })
+            done += 1
         
+        # One transaction per batch; the hash guard also covers a note edited since the check above
+        if updates:
+            notes = CaseNote.__table__
+            db.session.execute(
+                notes.update().where(notes.c.note_id == db.bindparam('b_note_id'),
+                                     notes.c.content_sha256 == db.bindparam('b_content_sha256')),
+                updates
+            )
+            db.session.commit()
+        if error is not None and not done:
+            raise error
+        return done, waiting
+
+note_spool.set_handler(store_spooled_notes)
+
+def upload_attachment_to_s3(case_note, attachment):
+    """Stream an uploaded file to S3 (multipart for large files) and return its NoteAttachment"""
+    filename = secure_filename(attachment.filename)
+    content_type = attachment_content_type(filename)
+    file_key = f"attachments/{case_note.patient_id}/{datetime.now().strftime('%Y/%m/%d')}/{case_note.note_id}_{uuid.uuid4().hex}_{filename}"
+    
+    # Werkzeug spools uploads to a temporary file, so the size is known without reading it
+    stream = attachment.stream
+    stream.seek(0, os.SEEK_END)
+    file_size = stream.tell()
+    stream.seek(0)
+    
+    try:
+        s3_gateway.upload_fileobj(
+            stream, app.config['AWS_S3_BUCKET'], file_key,
+            content_type=content_type,
+            metadata={
+                'note_id': str(case_note.note_id),
+                'patient_id': str(case_note.patient_id),
+                'staff_id': str(case_note.staff_id),
+                'original_filename': filename
+            }
+        )
+    except ClientError as e:
+        raise Exception(f"Failed to upload attachment to S3: {e}")
+    
+    return NoteAttachment(
+        note_id=case_note.note_id,
+        filename=filename,
+        s3_file_key=file_key,
+        s3_bucket=app.config['AWS_S3_BUCKET'],
+        file_size=file_size,
+        file_type=content_type
+    )
+
+def attachment_content_type(filename):
+    """Content type served for an attachment, from its extension"""
+    return ATTACHMENT_CONTENT_TYPES.get(os.path.splitext(filename)[1].lower(), 'application/octet-stream')
+
+def discard_s3_object(bucket_name, s3_file_key):
+    """Delete an uploaded object whose database row was rolled back; failures only leave an orphan"""
+    try:
+        s3_gateway.delete_object(bucket_name, s3_file_key)
+    except (ClientError, BotoCoreError, S3UnavailableError) as e:
+        app.logger.warning("Could not delete orphaned S3 object %s: %s", s3_file_key, e)
+
+def retrieve_case_note_from_s3(s3_file_key, bucket_name, file_type=None):
+    """Retrieve case note content from S3, decompressing it if stored compressed"""
+    try:
+        return s3_gateway.read_text(bucket_name, s3_file_key, storage_codec(file_type))
     except ClientError as e:
-        raise Exception(f"Failed to upload to S3: {e}")
+        raise Exception(f"Failed to retrieve from S3: {e}")
 
-def retrieve_case_note_from_s3(s3_file_key, bucket_name):
-    """Retrieve case note content from S3"""
+def stream_s3_object(bucket_name, s3_file_key, codec, content_type, filename):
+    """Relay an S3 object to the client chunk by chunk"""
     try:
-        response = s3_client.get_object(Bucket=bucket_name, Key=s3_file_key)
-        content = response['Body'].read().decode('utf-8')
-        metadata = response.get('Metadata', {})
-        
-        return {
-            'content': content,
-            'metadata': metadata,
-            'last_modified': response.get('LastModified'),
-            'content_length': response.get('ContentLength')
-        }
+        chunks, status, headers = s3_gateway.open_stream(bucket_name, s3_file_key,
+                                                         request.headers.get('Range'), codec)
+    except S3UnavailableError:
+        abort(503)
     except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            abort(404)
+        if e.response.get('Error', {}).get('Code') == 'InvalidRange':
+            abort(416)
         raise Exception(f"Failed to retrieve from S3: {e}")
+    
+    headers['Content-Disposition'] = f'attachment; filename="{secure_filename(filename)}"'
+    headers['X-Content-Type-Options'] = 'nosniff'
+    return Response(stream_with_context(chunks), status=status, headers=headers, content_type=content_type)
+
+def get_note_vectors(notes):
+    """
+    Return stored vectors for notes in order, computing and persisting any that are missing
+    
+    Args:
+        notes (list): Notes or rows with note_id, patient_id and content
+    """
+    stored = {
+        row.note_id: row for row in
+        NoteVector.query.filter(NoteVector.note_id.in_([note.note_id for note in notes])).all()
+    }
+    
+    vectors = []
+    for note in notes:
+        row = stored.get(note.note_id)
+        if row is None or row.model_version != nlp_detector.model_version:
+            # Missing, or produced by a different backend version: vectorize with the current one
+            vector = nlp_detector.vectorize(nlp_detector.note_tokens(note.note_id, note.content))
+            indices, weights = encode_vector(vector)
+            if row is None:
+                row = NoteVector(note_id=note.note_id, patient_id=note.patient_id)
+                db.session.add(row)
+            row.model_version = nlp_detector.model_version
+            row.dimension = nlp_detector.backend.dimension
+            row.indices = indices
+            row.weights = weights
+        vectors.append(row.to_vector())
+    return vectors
+
+def find_related_notes(note, limit=3):
+    """Most similar notes for the same patient, falling back to the most recent ones"""
+    # Only this patient's vectors are needed, so rank them in place rather than keeping an index
+    rows = db.session.query(NoteVector.note_id, NoteVector.indices, NoteVector.weights, NoteVector.dimension)\
+                     .filter(NoteVector.patient_id == note.patient_id,
+                             NoteVector.model_version == nlp_detector.model_version).all()
+    target = next((row for row in rows if row.note_id == note.note_id), None)
+    candidates = [row for row in rows if row.note_id != note.note_id]
+    
+    if target is not None and candidates:
+        matrix = stack_vectors([(row.indices, row.weights) for row in candidates], target.dimension)
+        matches = most_similar(decode_vector(target.indices, target.weights, target.dimension), matrix,
+                               [row.note_id for row in candidates], limit=limit, min_score=0.01)
+        if matches:
+            notes_by_id = {
+                related.note_id: related for related in
+                CaseNote.query.filter(CaseNote.note_id.in_([note_id for note_id, _ in matches])).all()
+            }
+            return [notes_by_id[note_id] for note_id, _ in matches if note_id in notes_by_id]
+    
+    return CaseNote.query.filter(
+        CaseNote.patient_id == note.patient_id,
+        CaseNote.note_id != note.note_id,
+        CaseNote.created_at < note.created_at
+    ).order_by(CaseNote.created_at.desc()).limit(limit).all()
+
+def get_cohort_baselines(cohort_keys):
+    """Existing baseline rows for the given (cohort_type, cohort_key) pairs, keyed by pair"""
+    rows = CohortBaseline.query.filter(
+        CohortBaseline.model_version == nlp_detector.model_version,
+        db.or_(*[
+            db.and_(CohortBaseline.cohort_type == cohort_type, CohortBaseline.cohort_key == cohort_key)
+            for cohort_type, cohort_key in cohort_keys
+        ])
+    ).all()
+    return {(row.cohort_type, row.cohort_key): row for row in rows}
+
+def fold_cohort_baselines(batch_size=1000):
+    """
+    Fold notes saved since the last pass into the cohort baselines, in note_id order
+    
+    Baselines are only written here, never while a note is saved, so concurrent note
+    writes do not queue on the shared cohort rows. Each batch locks the rows and skips
+    notes a row already holds (last_note_id), so overlapping passes do not fold a note twice.
+    
+    Returns:
+        int: Number of notes read
+    """
+    read = 0
+    last_note_id = None
+    while True:
+        baselines = {
+            (row.cohort_type, row.cohort_key): row for row in
+            CohortBaseline.query.filter_by(model_version=nlp_detector.model_version).with_for_update().all()
+        }
+        if last_note_id is None:
+            last_note_id = min((row.last_note_id or 0 for row in baselines.values()), default=0)
+        notes = CaseNote.query.filter(CaseNote.note_id > last_note_id)\
+                              .options(db.joinedload(CaseNote.staff_member))\
+                              .order_by(CaseNote.note_id).limit(batch_size).all()
+        if not notes:
+            db.session.commit()
+            break
+        
+        for note, vector in zip(notes, get_note_vectors(notes)):
+            length, vocabulary_size = text_statistics(nlp_detector.tokenize(note.content))
+            for key in note_cohort_keys(note.note_type, note.staff_member.department):
+                baseline = baselines.get(key)
+                if baseline is None:
+                    baseline = baselines[key] = CohortBaseline(
+                        model_version=nlp_detector.model_version, cohort_type=key[0], cohort_key=key[1],
+                        note_count=0, length_mean=0.0, length_m2=0.0, vocabulary_mean=0.0, vocabulary_m2=0.0
+                    )
+                    db.session.add(baseline)
+                if note.note_id > (baseline.last_note_id or 0):
+                    update_baseline(baseline, vector, length, vocabulary_size)
+        
+        last_note_id = notes[-1].note_id
+        for baseline in baselines.values():
+            baseline.last_note_id = max(baseline.last_note_id or 0, last_note_id)
+        read += len(notes)
+        db.session.commit()
+    return read
+
+def _earlier_notes(targets, *conditions):
+    """Join condition from target notes to the same patient's notes written before each target"""
+    return db.and_(
+        db.or_(CaseNote.created_at < targets.created_at,
+               db.and_(CaseNote.created_at == targets.created_at, CaseNote.note_id < targets.note_id)),
+        *conditions
+    )
+
+def load_scoring_histories(case_notes, history_size):
+    """
+    Previous notes for a batch of notes in one round trip
+    
+    Ranks, for each target note, the same patient's notes written before it
+    newest first with ROW_NUMBER(), so re-scoring a historical note never
+    compares it with notes written after it. Other notes of the batch are part
+    of a target's history when they are older than it. Only the columns
+    scoring needs are loaded.
+    
+    Returns:
+        dict: note_id -> list of rows (note_id, patient_id, content, fingerprints and
+            previous scoring), newest first
+    """
+    if not case_notes:
+        return {}
+    
+    # Rank on the (patient_id, created_at) index only, then fetch content for the survivors
+    targets = db.aliased(CaseNote)
+    ranked = db.select(
+        targets.note_id.label('target_id'), CaseNote.note_id,
+        db.func.row_number().over(partition_by=targets.note_id,
+                                  order_by=(CaseNote.created_at.desc(), CaseNote.note_id.desc())).label('position')
+    ).join(targets, _earlier_notes(targets, CaseNote.patient_id == targets.patient_id))\
+     .where(targets.note_id.in_([note.note_id for note in case_notes])).subquery()
+    rows = db.session.execute(
+        db.select(ranked.c.target_id, CaseNote.note_id, CaseNote.patient_id, CaseNote.content,
+                  CaseNote.content_sha256, CaseNote.content_simhash,
+                  CaseNote.is_flagged, CaseNote.anomaly_score, CaseNote.anomaly_model_version)
+          .join(CaseNote, CaseNote.note_id == ranked.c.note_id)
+          .where(ranked.c.position <= history_size)
+          .order_by(ranked.c.target_id, ranked.c.position)
+    ).all()
+    
+    histories = {note.note_id: [] for note in case_notes}
+    for row in rows:
+        histories[row.target_id].append(row)
+    return histories
+
+def load_earlier_copies(case_notes):
+    """Most recent earlier note with byte-identical content (any patient) for each note of a batch"""
+    hashed = [note.note_id for note in case_notes if note.content_sha256]
+    if not hashed:
+        return {}
+    
+    targets = db.aliased(CaseNote)
+    ranked = db.select(
+        targets.note_id.label('target_id'), CaseNote.note_id,
+        db.func.row_number().over(partition_by=targets.note_id,
+                                  order_by=(CaseNote.created_at.desc(), CaseNote.note_id.desc())).label('position')
+    ).join(targets, _earlier_notes(targets, CaseNote.content_sha256 == targets.content_sha256))\
+     .where(targets.note_id.in_(hashed)).subquery()
+    rows = db.session.execute(db.select(ranked.c.target_id, ranked.c.note_id).where(ranked.c.position == 1))
+    return {row.target_id: row for row in rows}
 
 def run_anomaly_detection(note_id):
     """Run NLP anomaly detection on the case note"""
-    case_note = CaseNote.query.get(note_id)
-    if not case_note:
+    score_case_notes([note_id])
+
+def score_case_notes(note_ids, history_size=None):
+    """Run NLP anomaly detection on a batch of case notes, committing once"""
+    history_size = history_size or app.config['SCORING_HISTORY_SIZE']
+    case_notes = CaseNote.query.filter(CaseNote.note_id.in_(note_ids))\
+                               .options(db.joinedload(CaseNote.staff_member))\
+                               .order_by(CaseNote.note_id).all()
+    if not case_notes:
         return
+    histories = load_scoring_histories(case_notes, history_size)
+    earlier_copies = load_earlier_copies(case_notes)
     
-    # Get the last 3 case notes for the same patient (excluding current one)
-    previous_notes = CaseNote.query.filter(
-        CaseNote.patient_id == case_note.patient_id,
-        CaseNote.note_id != case_note.note_id
-    ).order_by(CaseNote.created_at.desc()).limit(3).all()
+    # Vectors for the batch and every note it is compared with, in one lookup
+    compared = {}
+    for note in case_notes:
+        for row in histories[note.note_id]:
+            compared.setdefault(row.note_id, row)
+    for note in case_notes:
+        compared[note.note_id] = note
+    vectors = dict(zip(compared, get_note_vectors(list(compared.values()))))
     
-    if len(previous_notes) < 2:  # Need at least 2 previous notes for comparison
-        return
+    # Cohort baselines for the whole batch; notes are folded into them later by fold_cohort_baselines
+    cohort_keys = {note.note_id: note_cohort_keys(note.note_type, note.staff_member.department)
+                   for note in case_notes}
+    baselines = get_cohort_baselines(list(dict.fromkeys(key for keys in cohort_keys.values() for key in keys)))
     
-    # Extract content from previous notes
-    previous_contents = [note.content for note in previous_notes]
+    published = False
+    deltas = []
+    for case_note in case_notes:
+        newly_flagged, note_deltas = _score_case_note(
+            case_note, histories[case_note.note_id], earlier_copies.get(case_note.note_id), vectors,
+            [baselines[key] for key in cohort_keys[case_note.note_id] if key in baselines]
+        )
+        published |= newly_flagged
+        deltas += note_deltas
+    
+    # One set of rollup upserts for the batch
+    apply_deltas(db.session.connection(), AnomalyRollup.__table__, deltas)
+    db.session.commit()
+    if published:
+        anomaly_feed.publish()
+
+def _score_case_note(case_note, previous_notes, earlier_copy, vectors, baselines):
+    """
+    Score one note against its history and cohorts
     
-    # Run anomaly detection
-    is_anomaly, score = nlp_detector.detect_anomaly(case_note.content, previous_contents)
+    Returns:
+        tuple: (True if the note was newly flagged, rollup deltas for its change of score)
+    """
+    # Copies of one of the patient's recent notes are caught from the history already loaded;
+    # byte-identical copies of any other earlier note come from the batch's hash lookup
+    duplicate, duplicate_kind = find_duplicate(case_note.content_sha256, case_note.content_simhash, previous_notes)
+    inherited = None
+    if duplicate is not None:
+        if (duplicate_kind == 'exact' and duplicate.anomaly_score is not None
+                and duplicate.anomaly_model_version == nlp_detector.model_version):
+            # Scoring an identical copy of a scored note would only re-derive its score;
+            # near copies can differ in the words that matter, so they are scored in full
+            inherited = (duplicate.is_flagged, duplicate.anomaly_score)
+    elif earlier_copy is not None:
+        duplicate, duplicate_kind = earlier_copy, 'exact'
+    case_note.duplicate_of_note_id = duplicate.note_id if duplicate else None
+    case_note.duplicate_kind = duplicate_kind
     
-    # Update case note with results
+    # The new note was vectorized once with the batch; it is stored and reused by later comparisons
+    current_vector = vectors[case_note.note_id]
+    
+    # Score against the note type / department cohorts
+    current_tokens = nlp_detector.note_tokens(case_note.note_id, case_note.content)
+    length, vocabulary_size = text_statistics(current_tokens)
+    cohort = cohort_metrics(baselines, current_vector, length, vocabulary_size) if inherited is None else None
+    
+    if inherited is not None:
+        is_anomaly, score = inherited
+    else:
+        # Need at least 2 previous notes or an established cohort for comparison
+        if len(previous_notes) < 2 and cohort is None:
+            return False, []
+        
+        # Tokens of previous notes are cached by note_id, so each note is tokenized once
+        previous_tokens = [nlp_detector.note_tokens(note.note_id, note.content) for note in previous_notes]
+        previous_vectors = [vectors[note.note_id] for note in previous_notes] if len(previous_notes) >= 2 else None
+        
+        # Run anomaly detection
+        is_anomaly, score = nlp_detector.detect_anomaly(current_tokens, previous_tokens,
+                                                        current_vector, previous_vectors, cohort)
+    
+    # Move the note's contribution in the anomaly rollups from its old score to the new one
+    department = case_note.staff_member.department
+    deltas = rollup_deltas(case_note.created_at, case_note.note_type, department, case_note.staff_id,
+                           score, is_anomaly)
+    if case_note.anomaly_score is not None:
+        deltas += rollup_deltas(case_note.created_at, case_note.note_type, department, case_note.staff_id,
+                                case_note.anomaly_score, case_note.is_flagged, sign=-1)
+    
+    # Update case note with results; newly flagged notes are queued for the live feed
+    newly_flagged = is_anomaly and not case_note.is_flagged
     case_note.is_flagged = is_anomaly
     case_note.anomaly_score = score
+    case_note.anomaly_model_version = nlp_detector.model_version
+    if newly_flagged:
+        db.session.add(AnomalyEvent(note_id=case_note.note_id, anomaly_score=score))
+    return newly_flagged, deltas
+
+@app.cli.command('score-notes')
+@click.option('--all', 'rescore', is_flag=True, help='Re-score notes that already have a score')
+@click.option('--batch-size', default=200, show_default=True)
+def score_notes_command(rescore, batch_size):
+    """Score case notes in batches (unscored notes only unless --all)"""
+    scored = 0
+    last_note_id = 0
+    while True:
+        query = db.session.query(CaseNote.note_id).filter(CaseNote.note_id > last_note_id)
+        if not rescore:
+            query = query.filter(CaseNote.anomaly_model_version.is_(None))
+        note_ids = [row.note_id for row in query.order_by(CaseNote.note_id).limit(batch_size).all()]
+        if not note_ids:
+            break
+        score_case_notes(note_ids)
+        scored += len(note_ids)
+        last_note_id = note_ids[-1]
+    folded = fold_cohort_baselines()
+    print(f"Scored {scored} case notes; folded {folded} new notes into the cohort baselines")
+
+@app.cli.command('fold-cohort-baselines')
+def fold_cohort_baselines_command():
+    """Fold notes saved since the last pass into the cohort baselines"""
+    print(f"Folded {fold_cohort_baselines()} notes into the cohort baselines")
+
+@app.cli.command('repair-patient-summaries')
+def repair_patient_summaries():
+    """Recompute Patient note summaries after bulk loads or out-of-band edits"""
+    updated = refresh_patient_summaries(db.session.connection())
     db.session.commit()
+    print(f"Repaired note summaries for {updated} patients")
 
-if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        # Create dummy data if no staff exists
-        if Staff.query.count() == 0:
-            create_dummy_data()
+def _reflected_indexes(connection, inspector, table_name):
+    """A table's indexes by name, including the expression indexes SQLite reflection skips"""
+    if connection.dialect.name == 'sqlite':
+        names = connection.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                                   {'table': table_name}).scalars()
+        return {name: {'name': name} for name in names}
+    return {index['name']: index for index in inspector.get_indexes(table_name)}
+
+def include_columns_changed(index, reflected):
+    """Whether an existing index's PostgreSQL INCLUDE columns differ from the model's"""
+    wanted = index.dialect_options['postgresql']['include'] or []
+    existing = reflected.get('dialect_options', {}).get('postgresql_include') or reflected.get('include_columns') or []
+    return {str(column) for column in wanted} != set(existing)
+
+def _rebuild_index_concurrently(index):
+    """Drop and re-create a PostgreSQL index without blocking note writes"""
+    # CONCURRENTLY cannot run inside a transaction block
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(db.text(f"DROP INDEX CONCURRENTLY IF EXISTS "
+                                   f"{connection.dialect.identifier_preparer.format_index(index)}"))
+        options = index.dialect_options['postgresql']
+        options['concurrently'] = True
+        try:
+            index.create(connection)
+        finally:
+            options['concurrently'] = False
+
+def upgrade_schema():
+    """
+    Create missing tables, then add the columns and indexes db.create_all() skips on existing tables
+
+    On PostgreSQL, indexes whose INCLUDE columns changed (so the note lists stay
+    index-only scans) are rebuilt concurrently once the upgrade has committed.
+
+    Returns:
+        list: Names of the columns and indexes that were added or rebuilt
+    """
+    db.create_all()
+    connection = db.session.connection()
+    inspector = db.inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    added = []
+    rebuild = []
+    for table in db.metadata.sorted_tables:
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        new_columns = [column for column in table.columns if column.name not in existing_columns]
+        for column in new_columns:
+            connection.execute(db.text(f"ALTER TABLE {preparer.format_table(table)} "
+                                       f"ADD COLUMN {CreateColumn(column).compile(dialect=connection.dialect)}"))
+            added.append(f'{table.name}.{column.name}')
+        # SQLite cannot add constraints to an existing table (and does not enforce them by default)
+        if connection.dialect.name != 'sqlite':
+            for constraint in table.foreign_key_constraints:
+                if any(column in new_columns for column in constraint.columns):
+                    connection.execute(AddConstraint(constraint))
+        
+        existing_indexes = _reflected_indexes(connection, inspector, table.name)
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(connection)
+                added.append(index.name)
+            elif connection.dialect.name == 'postgresql' and include_columns_changed(index, existing_indexes[index.name]):
+                rebuild.append(index)
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Fingerprint notes written before content hashes existed
+    notes = CaseNote.__table__
+    while True:
+        rows = connection.execute(db.select(notes.c.note_id, notes.c.content)
+                                  .where(notes.c.content_sha256.is_(None))
+                                  .order_by(notes.c.note_id).limit(1000)).all()
+        if not rows:
+            break
+        connection.execute(notes.update().where(notes.c.note_id == db.bindparam('b_note_id')),
+                           [{'b_note_id': row.note_id, 'content_sha256': content_sha256(row.content),
+                             'content_simhash': simhash(row.content)} for row in rows])
+    db.session.commit()
+    
+    for index in rebuild:
+        _rebuild_index_concurrently(index)
+        added.append(f'{index.name} (rebuilt)')
+    return added
+
+@app.cli.command('upgrade-schema')
+def upgrade_schema_command():
+    """One-off upgrade of a database created by an earlier release; safe to re-run"""
+    added = upgrade_schema()
+    print(f"Added {len(added)} columns and indexes" + (f": {', '.join(added)}" if added else ""))
+    updated = refresh_patient_summaries(db.session.connection())
+    db.session.commit()
+    print(f"Repaired note summaries for {updated} patients")
+
+def rebuild_anomaly_rollups(batch_size=5000):
+    """Recompute all anomaly rollups from scored case notes; returns the number of notes"""
+    AnomalyRollup.query.delete()
+    rollups = {}
+    scored = 0
+    last_note_id = 0
+    while True:
+        rows = db.session.query(CaseNote.note_id, CaseNote.created_at, CaseNote.note_type, CaseNote.staff_id,
+                                CaseNote.anomaly_score, CaseNote.is_flagged, Staff.department)\
+                         .join(Staff, CaseNote.staff_id == Staff.staff_id)\
+                         .filter(CaseNote.note_id > last_note_id, CaseNote.anomaly_score.isnot(None))\
+                         .order_by(CaseNote.note_id).limit(batch_size).all()
+        if not rows:
+            break
+        for row in rows:
+            accumulate_deltas(rollups, rollup_deltas(row.created_at, row.note_type, row.department,
+                                                     row.staff_id, row.anomaly_score, row.is_flagged))
+        scored += len(rows)
+        last_note_id = rows[-1].note_id
+    
+    # Aggregated in memory first, so each rollup row is a single plain insert
+    rows = list(rollups.values())
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(db.insert(AnomalyRollup), rows[start:start + batch_size])
+    db.session.commit()
+    return scored
+
+@app.cli.command('rebuild-anomaly-rollups')
+def rebuild_anomaly_rollups_command():
+    """Recompute anomaly rollups after bulk loads or out-of-band score changes"""
+    print(f"Rebuilt anomaly rollups from {rebuild_anomaly_rollups()} scored case notes")
+
+@app.cli.command('drain-note-spool')
+def drain_note_spool():
+    """Upload every note body left in the local spool (e.g. before retiring a host)"""
+    drained = note_spool.drain_once()
+    stats = note_spool.stats()
+    print(f"Uploaded {stats['drained']} spooled note bodies; "
+          f"{'spool is empty' if drained else str(stats['pending_bytes']) + ' bytes still pending'}")
+
+@app.cli.command('precompile-templates')
+def precompile_templates():
+    """Compile every template into the bytecode cache before workers start"""
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    print(f"Compiled {len(names)} templates")
+
+@app.cli.command('rebuild-cohort-baselines')
+def rebuild_cohort_baselines():
+    """Recompute cohort baselines from every stored case note"""
+    CohortBaseline.query.filter_by(model_version=nlp_detector.model_version).delete()
+    folded = fold_cohort_baselines()
+    rebuilt = CohortBaseline.query.filter_by(model_version=nlp_detector.model_version).count()
+    print(f"Rebuilt {rebuilt} cohort baselines from {folded} notes")
 
 def create_dummy_data():
     """Create dummy staff and patient data for testing"""
     from dummy_data import create_dummy_staff, create_dummy_patients, create_dummy_case_notes
     create_dummy_staff(db)
     create_dummy_patients(db)
-    create_dummy_case_notes(db, s3_client, app.config['AWS_S3_BUCKET'])
+    create_dummy_case_notes(db, s3_gateway, app.config['AWS_S3_BUCKET'])
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        # Create dummy data if asked to and no staff exists
+        if os.environ.get('SEED_DEMO_DATA', 'False').lower() in ['true', '1', 'yes'] and Staff.query.count() == 0:
+            create_dummy_data()
+    
+    app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for case note text preprocessing
+Compares the old three-pass pipeline (regex clean-up, analyzer tokenization,
+then split() for length and lower().split() for vocabulary) with the
+single-pass token stream used by NLPAnomalyDetector, on notes up to
+MAX_CASE_NOTE_LENGTH characters. The last column is the cost of preparing one
+scoring call (the new note plus 3 history notes, whose tokens are cached).
+"""
+
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from nlp_backends import analyze_tokens
+from nlp_processor import NLPAnomalyDetector
+
+MAX_CASE_NOTE_LENGTH = int(os.environ.get('MAX_CASE_NOTE_LENGTH', 10000))
+
+WORDS = (
+    "patient mood affect stable sleep appetite medication compliance therapy group family "
+    "support anxiety improved engaged calm agitation risk assessment plan review discharge "
+    "reported denies suicidal ideation insight judgement orientation speech thought-process "
+    "e.g. b.d. mg/day (PRN) 10:30, ward-round; follow-up."
+).split()
+
+
+def make_note(length, rng):
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word.capitalize() if rng.random() < 0.1 else word)
+        size += len(word) + 1
+    return ' '.join(words)[:length]
+
+
+# The per-note text handling before the single-pass pipeline
+_legacy_analyzer = TfidfVectorizer(stop_words='english', ngram_range=(1, 2)).build_analyzer()
+
+
+def legacy_pipeline(text):
+    cleaned = text.lower()
+    cleaned = re.sub(r'[^\w\s\-\.]', ' ', cleaned)
+    cleaned = ' '.join(cleaned.split())
+    features = _legacy_analyzer(cleaned)
+    length = len(text.split())
+    vocabulary = set(text.lower().split())
+    return features, length, vocabulary
+
+
+def single_pass_pipeline(detector, text):
+    tokens = detector.tokenize(text)
+    features = analyze_tokens(tokens.tokens)
+    return features, len(tokens), tokens.vocabulary
+
+
+def main():
+    rng = random.Random(0)
+    detector = NLPAnomalyDetector()
+    number = 200
+
+    print(f"{'chars':>7} {'legacy ms':>10} {'single ms':>10} {'cached ms':>10} {'per scoring':>12}")
+    for length in (500, 2000, MAX_CASE_NOTE_LENGTH):
+        note = make_note(length, rng)
+        detector.note_tokens(1, note)
+
+        legacy = timeit.timeit(lambda: legacy_pipeline(note), number=number) / number
+        single = timeit.timeit(lambda: single_pass_pipeline(detector, note), number=number) / number
+        cached = timeit.timeit(lambda: detector.note_tokens(1, note), number=number) / number
+
+        speedup = (4 * legacy) / (single + 3 * cached)
+        print(f"{length:>7} {legacy * 1e3:>10.3f} {single * 1e3:>10.3f} {cached * 1e3:>10.4f} {speedup:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark for page rendering and response size
+Seeds a throwaway SQLite database with the synthetic data generator, then
+reports for the heaviest list pages the server time per request with cold and
+warm row fragment caches, and the bytes on the wire uncompressed, gzipped and
+brotli-compressed (when the brotli package is installed). The first table is
+the cost of loading every template in a fresh worker with and without the
+on-disk bytecode cache.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+WORKDIR = tempfile.mkdtemp(prefix='bench-rendering-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'bench.db')
+os.environ['TEMPLATE_CACHE_DIR'] = os.path.join(WORKDIR, 'templates')
+os.environ.setdefault('AWS_S3_BUCKET', 'bench-bucket')
+
+from jinja2 import Environment, FileSystemBytecodeCache
+
+from app import app, db, CaseNote
+from compression import brotli
+from dummy_data import create_dummy_staff, create_dummy_patients, create_dummy_case_notes
+from fragment_cache import FragmentCacheExtension
+
+
+def time_template_loading(repeat):
+    names = app.jinja_env.list_templates()
+    bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+
+    def load_all(cache):
+        environment = Environment(loader=app.jinja_loader, extensions=[FragmentCacheExtension],
+                                  bytecode_cache=cache)
+        started = time.perf_counter()
+        for name in names:
+            environment.get_template(name)
+        return time.perf_counter() - started
+
+    load_all(bytecode_cache)
+    compiled = min(load_all(None) for _ in range(repeat))
+    cached = min(load_all(bytecode_cache) for _ in range(repeat))
+    print(f"{'templates':>10} {'compile ms':>11} {'bytecode ms':>12}")
+    print(f"{len(names):>10} {compiled * 1e3:>11.1f} {cached * 1e3:>12.1f}\n")
+
+
+def time_request(client, url, repeat, clear_fragments):
+    timings = []
+    for _ in range(repeat):
+        if clear_fragments:
+            app.jinja_env.fragment_cache.clear()
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, (url, response.status_code)
+    return statistics.median(timings)
+
+
+def wire_size(client, url, encoding):
+    response = client.get(url, headers={'Accept-Encoding': encoding})
+    return len(response.data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--notes', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        create_dummy_staff(db)
+        create_dummy_patients(db, count=args.patients)
+        create_dummy_case_notes(db, count=args.notes)
+        busiest_patient = db.session.query(CaseNote.patient_id)\
+                                    .group_by(CaseNote.patient_id)\
+                                    .order_by(db.func.count().desc()).limit(1).scalar()
+
+    time_template_loading(args.repeat)
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'dr_smith', 'password': 'password123'})
+    pages = ['/dashboard', '/case_notes', '/patients', '/client_search?view=recent',
+             '/anomalies', f'/client_notes/{busiest_patient}']
+
+    print(f"{'page':<28} {'cold ms':>8} {'warm ms':>8} {'bytes':>8} {'gzip':>8} {'br':>8}")
+    for url in pages:
+        cold = time_request(client, url, args.repeat, clear_fragments=True)
+        warm = time_request(client, url, args.repeat, clear_fragments=False)
+        identity = wire_size(client, url, 'identity')
+        gzipped = wire_size(client, url, 'gzip')
+        brotlied = f"{wire_size(client, url, 'br'):>8}" if brotli is not None else f"{'n/a':>8}"
+        print(f"{url:<28} {cold * 1e3:>8.1f} {warm * 1e3:>8.1f} {identity:>8} {gzipped:>8} {brotlied}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Load test simulating a ward shift change
+Virtual staff arrive in a burst (most within the first part of the ramp, as
+at handover), log in, open the dashboard, then repeat weighted journeys with
+exponential think times until the run ends:
+    file a note     - search patients, open the form, submit a note
+    look up patient - search patients, open a recent note
+    review flags    - open the anomalies page, open one or two flagged notes
+Each gunicorn configuration given with --gunicorn is started in turn against
+the same seeded database, with S3 served by the in-memory stub
+(benchmarks/s3_stub.py). Reports throughput and latency percentiles per
+endpoint and per configuration; --json keeps the numbers for comparing
+releases.
+
+    python benchmarks/load_test.py --users 60 --duration 120 \\
+        --gunicorn workers=3,threads=16 --gunicorn workers=6,threads=4 --gunicorn workers=6,worker_class=sync
+
+SQLite serialises writers across worker processes; set --database-url to a
+PostgreSQL database for numbers that reflect production. --target runs the
+journeys against a server that is already running (no seeding, no stub).
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from s3_stub import S3Stub
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Accounts created by dummy_data.py
+STAFF_ACCOUNTS = ['dr_smith', 'nurse_johnson', 'therapist_brown', 'social_worker_davis']
+PASSWORD = 'password123'
+
+# Search prefixes clinicians type into the patient lookup
+SEARCH_TERMS = ['sm', 'jo', 'wi', 'br', 'da', 'mi', 'ga', 'ro', 'ma', 'th', 'le', 'an', 'MRN0']
+
+NOTE_TYPES = ['Progress', 'Assessment', 'Treatment', 'Medication', 'Incident', 'Discharge']
+NOTE_SENTENCES = [
+    "Patient seen on the ward round and engaged well.",
+    "Mood appears stable with reactive affect.",
+    "Sleep has improved since the medication review.",
+    "Attended group therapy and contributed appropriately.",
+    "No concerns raised by nursing staff overnight.",
+    "Family visited this afternoon; visit went well.",
+    "Denies thoughts of self-harm when asked directly.",
+    "Plan to continue current treatment and review next week.",
+]
+
+# (journey name, weight)
+JOURNEY_WEIGHTS = [('file_note', 0.4), ('look_up_patient', 0.35), ('review_flags', 0.25)]
+
+_NOTE_LINK = re.compile(rb'(?:/view_note/|viewNote\()(\d+)')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))]
+
+
+class Stats:
+    """Latencies and error counts per endpoint, shared by all virtual users"""
+
+    def __init__(self):
+        self._latencies = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self._latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed):
+        """
+        Summarise the run
+
+        Returns:
+            dict: endpoint -> requests, errors, rps and p50/p95/p99/max in ms,
+                plus a 'total' row over all endpoints
+        """
+        with self._lock:
+            series = {name: sorted(values) for name, values in self._latencies.items()}
+            errors = dict(self._errors)
+        series['total'] = sorted(value for values in series.values() for value in values)
+        errors['total'] = sum(errors.values())
+
+        report = {}
+        for name, values in series.items():
+            report[name] = {
+                'requests': len(values),
+                'errors': errors.get(name, 0),
+                'rps': len(values) / elapsed,
+                'p50_ms': percentile(values, 0.50) * 1e3,
+                'p95_ms': percentile(values, 0.95) * 1e3,
+                'p99_ms': percentile(values, 0.99) * 1e3,
+                'max_ms': (values[-1] if values else 0.0) * 1e3
+            }
+        return report
+
+
+class Client:
+    """One browser session: a keep-alive connection and a cookie jar"""
+
+    def __init__(self, base_url, stats, timeout=30.0):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.stats = stats
+        self.timeout = timeout
+        self.cookies = {}
+        self._connection = None
+
+    def request(self, method, path, endpoint, form=None, expect=None):
+        """
+        Send one request and record its latency under the endpoint name
+
+        Redirects are not followed; 2xx and 3xx count as success unless
+        `expect` names the only acceptable status.
+
+        Returns:
+            tuple: (status, body bytes); status is 0 on connection errors
+        """
+        headers = {'Accept-Encoding': 'gzip', 'Connection': 'keep-alive'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        started = time.perf_counter()
+        try:
+            if self._connection is None:
+                self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._connection.request(method, path, body=body, headers=headers)
+            response = self._connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.stats.record(endpoint, time.perf_counter() - started, ok=False)
+            self.close()
+            return 0, b''
+        elapsed = time.perf_counter() - started
+
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        if response.headers.get('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        if response.will_close:
+            self.close()
+
+        ok = response.status == expect if expect else response.status < 400
+        self.stats.record(endpoint, elapsed, ok)
+        return response.status, data
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class VirtualUser:
+    """Runs the shift journeys for one member of staff"""
+
+    def __init__(self, client, rng, username, think_time):
+        self.client = client
+        self.rng = rng
+        self.username = username
+        self.think_time = think_time
+        self.note_ids = []
+        self.patient_ids = []
+
+    def think(self):
+        time.sleep(self.rng.expovariate(1.0 / self.think_time) if self.think_time > 0 else 0)
+
+    def remember_notes(self, page):
+        found = [int(note_id) for note_id in _NOTE_LINK.findall(page)]
+        if found:
+            self.note_ids = found[:20]
+
+    def start_shift(self):
+        self.client.request('GET', '/login', '/login')
+        status, _ = self.client.request('POST', '/login', 'POST /login',
+                                        form={'username': self.username, 'password': PASSWORD}, expect=302)
+        _, page = self.client.request('GET', '/dashboard', '/dashboard')
+        self.remember_notes(page)
+        return status == 302
+
+    def search_patients(self):
+        term = self.rng.choice(SEARCH_TERMS)
+        status, data = self.client.request('GET', f'/api/search_patients?q={term}', '/api/search_patients')
+        if status == 200:
+            try:
+                self.patient_ids = [patient['id'] for patient in json.loads(data)] or self.patient_ids
+            except ValueError:
+                pass
+
+    def view_note(self):
+        if self.note_ids:
+            note_id = self.rng.choice(self.note_ids)
+            self.client.request('GET', f'/view_note/{note_id}', '/view_note/<id>')
+
+    def file_note(self):
+        for _ in range(self.rng.randint(1, 3)):
+            self.search_patients()
+            self.think()
+        self.client.request('GET', '/add_case_note', '/add_case_note')
+        if not self.patient_ids:
+            return
+        self.think()
+        sentences = self.rng.sample(NOTE_SENTENCES, self.rng.randint(2, len(NOTE_SENTENCES)))
+        self.client.request('POST', '/add_case_note', 'POST /add_case_note', form={
+            'patient_id': self.rng.choice(self.patient_ids),
+            'note_type': self.rng.choice(NOTE_TYPES),
+            'title': f'{self.rng.choice(NOTE_TYPES)} note',
+            'content': ' '.join(sentences)
+        }, expect=302)
+        _, page = self.client.request('GET', '/dashboard', '/dashboard')
+        self.remember_notes(page)
+
+    def look_up_patient(self):
+        self.search_patients()
+        self.think()
+        self.view_note()
+
+    def review_flags(self):
+        _, page = self.client.request('GET', '/anomalies', '/anomalies')
+        self.remember_notes(page)
+        for _ in range(self.rng.randint(1, 2)):
+            self.think()
+            self.view_note()
+
+    def run(self, start_at, stop_at):
+        time.sleep(max(0.0, start_at - time.monotonic()))
+        if not self.start_shift():
+            return
+        names, weights = zip(*JOURNEY_WEIGHTS)
+        while time.monotonic() < stop_at:
+            getattr(self, self.rng.choices(names, weights)[0])()
+            self.think()
+        self.client.close()
+
+
+def run_load(base_url, users, duration, ramp, think_time, seed):
+    """
+    Drive the journeys against a running server
+
+    Returns:
+        dict: Stats.report() for the run
+    """
+    stats = Stats()
+    rng = random.Random(seed)
+    started = time.monotonic()
+    stop_at = started + ramp + duration
+    threads = []
+    for index in range(users):
+        # Shift change: arrivals bunch at the start of the ramp and tail off
+        start_at = started + ramp * rng.triangular(0.0, 1.0, 0.0)
+        user = VirtualUser(Client(base_url, stats), random.Random(rng.random()),
+                           STAFF_ACCOUNTS[index % len(STAFF_ACCOUNTS)], think_time)
+        thread = threading.Thread(target=user.run, args=(start_at, stop_at), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return stats.report(time.monotonic() - started)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def parse_gunicorn_spec(spec):
+    """'workers=3,threads=16,worker_class=gthread' -> dict with defaults filled in"""
+    settings = {'workers': 3, 'threads': 16, 'worker_class': 'gthread'}
+    for item in filter(None, spec.split(',')):
+        name, _, value = item.partition('=')
+        if name not in settings:
+            raise ValueError(f"Unknown gunicorn setting {name!r} in {spec!r}")
+        settings[name] = value if name == 'worker_class' else int(value)
+    if settings['worker_class'] == 'sync':
+        settings['threads'] = 1
+    return settings
+
+
+def start_gunicorn(settings, port, env):
+    command = [sys.executable, '-m', 'gunicorn', 'wsgi:application',
+               '--bind', f'127.0.0.1:{port}',
+               '--workers', str(settings['workers']),
+               '--threads', str(settings['threads']),
+               '--worker-class', settings['worker_class'],
+               '--timeout', '60', '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start listening within 60s")
+
+
+def print_report(title, report):
+    print(f"\n{title}")
+    print(f"{'endpoint':<24} {'requests':>8} {'errors':>7} {'req/s':>7} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name in sorted(report, key=lambda name: (name == 'total', name)):
+        row = report[name]
+        print(f"{name:<24} {row['requests']:>8} {row['errors']:>7} {row['rps']:>7.1f} {row['p50_ms']:>8.1f} "
+              f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ward shift-change load test')
+    parser.add_argument('--gunicorn', action='append', metavar='SPEC',
+                        help='Worker configuration, e.g. workers=3,threads=16,worker_class=gthread (repeatable)')
+    parser.add_argument('--target', help='Base URL of an already running server instead of starting gunicorn')
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--duration', type=float, default=60, help='Seconds of steady load after the ramp')
+    parser.add_argument('--ramp', type=float, default=20, help='Seconds over which staff arrive')
+    parser.add_argument('--think-time', type=float, default=2.0, help='Mean seconds between actions')
+    parser.add_argument('--database-url', help='Database for the servers (default: a fresh SQLite file)')
+    parser.add_argument('--patients', type=int, default=2000, help='Patients to seed')
+    parser.add_argument('--notes', type=int, default=50000, help='Case notes to seed')
+    parser.add_argument('--no-seed', action='store_true', help='Use --database-url as it is')
+    parser.add_argument('--s3-latency', type=float, default=0.02, help='Seconds added to each stubbed S3 call')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Write all reports to this file')
+    args = parser.parse_args()
+
+    results = {}
+    if args.target:
+        report = run_load(args.target, args.users, args.duration, args.ramp, args.think_time, args.seed)
+        print_report(args.target, report)
+        results[args.target] = report
+    else:
+        database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='load-test-'), 'load.db')
+        with S3Stub(latency=args.s3_latency, seed=args.seed) as stub:
+            env = dict(os.environ,
+                       DATABASE_URL=database_url,
+                       S3_ENDPOINT_URL=stub.endpoint_url,
+                       AWS_S3_BUCKET='load-test',
+                       AWS_ACCESS_KEY_ID='stub',
+                       AWS_SECRET_ACCESS_KEY='stub',
+                       AWS_REGION='us-east-1',
+                       SEED_DEMO_DATA='False')
+            if not args.no_seed:
+                subprocess.run([sys.executable, 'dummy_data.py', '--patients', str(args.patients),
+                                '--notes', str(args.notes), '--seed', str(args.seed),
+                                # The dashboard and anomaly ranges are relative to today
+                                '--epoch', 'now'],
+                               cwd=ROOT, env=env, check=True)
+
+            for spec in args.gunicorn or ['workers=3,threads=16,worker_class=gthread']:
+                settings = parse_gunicorn_spec(spec)
+                port = free_port()
+                process = start_gunicorn(settings, port, env)
+                try:
+                    report = run_load(f'http://127.0.0.1:{port}', args.users, args.duration,
+                                      args.ramp, args.think_time, args.seed)
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+                name = f"{settings['workers']}x{settings['threads']} {settings['worker_class']}"
+                print_report(name, report)
+                results[name] = report
+
+        print(f"\n{'configuration':<24} {'req/s':>7} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for name, report in results.items():
+            total = report['total']
+            print(f"{name:<24} {total['rps']:>7.1f} {total['p95_ms']:>8.1f} {total['p99_ms']:>8.1f} "
+                  f"{total['errors']:>7}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'users': args.users, 'duration': args.duration, 'ramp': args.ramp,
+                       'think_time': args.think_time, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
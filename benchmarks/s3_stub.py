@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+In-memory stand-in for S3 object storage
+Implements just enough of the S3 REST API for the app's note storage (PUT,
+multipart uploads, GET with byte ranges, HEAD and DELETE), so load tests and local
+seeding never touch AWS. Latency and an error rate (503 SlowDown) can be
+injected to rehearse a slow or failing object store.
+
+Point the app at it with S3_ENDPOINT_URL (any credentials are accepted):
+    python benchmarks/s3_stub.py --port 9000 --latency 0.02
+"""
+
+import argparse
+import hashlib
+import random
+import re
+import threading
+import time
+import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Stored headers echoed back on GET and HEAD
+_OBJECT_HEADERS = ('content-type', 'content-encoding', 'cache-control', 'content-disposition')
+
+
+def _error_body(code, message):
+    return (f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<Error><Code>{code}</Code><Message>{message}</Message></Error>').encode()
+
+
+def decode_aws_chunked(body):
+    """Strip aws-chunked framing (chunk sizes, signatures and trailers) from an upload body"""
+    decoded = bytearray()
+    position = 0
+    while True:
+        line_end = body.index(b'\r\n', position)
+        size = int(body[position:line_end].split(b';')[0], 16)
+        if size == 0:
+            return bytes(decoded)
+        start = line_end + 2
+        decoded += body[start:start + size]
+        position = start + size + 2
+
+
+class S3Stub:
+    """Threaded HTTP server holding objects in memory"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, seed=None):
+        """
+        Args:
+            host (str): Interface to bind
+            port (int): Port to bind; 0 picks a free one
+            latency (float): Seconds added to every request
+            error_rate (float): Fraction of requests answered with 503 SlowDown
+            seed (int): Seed for the error injection
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.objects = {}
+        self.uploads = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _inject_fault(self):
+        with self._lock:
+            self.requests += 1
+            fail = self.error_rate and self._random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        return fail
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _object_key(self):
+                # Host plus path covers both path-style and virtual-hosted addressing
+                return self.headers.get('Host', '').split(':')[0] + self.path.split('?')[0]
+
+            def _query(self):
+                return parse_qs(self.path.partition('?')[2], keep_blank_values=True)
+
+            def _stored_headers(self):
+                return {name: value for name, value in self.headers.items()
+                        if name.lower().startswith('x-amz-meta-')
+                        or (name.lower() in _OBJECT_HEADERS and 'aws-chunked' not in value)}
+
+            def _store(self, body, headers):
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                headers = dict(headers, **{'ETag': etag, 'Last-Modified': formatdate(usegmt=True)})
+                with stub._lock:
+                    stub.objects[self._object_key()] = (body, headers)
+                return etag
+
+            def _reply(self, status, body=b'', headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def _read_body(self):
+                if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                    chunks = bytearray()
+                    while True:
+                        size = int(self.rfile.readline().split(b';')[0], 16)
+                        if size == 0:
+                            while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                                pass
+                            break
+                        chunks += self.rfile.read(size)
+                        self.rfile.readline()
+                    body = bytes(chunks)
+                else:
+                    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if 'aws-chunked' in self.headers.get('Content-Encoding', ''):
+                    body = decode_aws_chunked(body)
+                return body
+
+            def _faulted(self):
+                if stub._inject_fault():
+                    self._reply(503, _error_body('SlowDown', 'Please reduce your request rate.'),
+                                {'Content-Type': 'application/xml'})
+                    return True
+                return False
+
+            def do_PUT(self):
+                body = self._read_body()
+                if self._faulted():
+                    return
+                query = self._query()
+                if 'uploadId' in query:
+                    with stub._lock:
+                        upload = stub.uploads.get(query['uploadId'][0])
+                    if upload is None:
+                        self._reply(404, _error_body('NoSuchUpload', 'The specified upload does not exist.'),
+                                    {'Content-Type': 'application/xml'})
+                        return
+                    upload['parts'][int(query['partNumber'][0])] = body
+                    self._reply(200, headers={'ETag': f'"{hashlib.md5(body).hexdigest()}"'})
+                    return
+                self._reply(200, headers={'ETag': self._store(body, self._stored_headers())})
+
+            def do_POST(self):
+                # The multipart XML is not needed, but reading it drains the request for keep-alive
+                self._read_body()
+                if self._faulted():
+                    return
+                query = self._query()
+                if 'uploads' in query:
+                    upload_id = uuid.uuid4().hex
+                    with stub._lock:
+                        stub.uploads[upload_id] = {'headers': self._stored_headers(), 'parts': {}}
+                    self._reply(200, (f'<?xml version="1.0" encoding="UTF-8"?><InitiateMultipartUploadResult>'
+                                      f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>').encode(),
+                                {'Content-Type': 'application/xml'})
+                elif 'uploadId' in query:
+                    with stub._lock:
+                        upload = stub.uploads.pop(query['uploadId'][0], None)
+                    if upload is None:
+                        self._reply(404, _error_body('NoSuchUpload', 'The specified upload does not exist.'),
+                                    {'Content-Type': 'application/xml'})
+                        return
+                    etag = self._store(b''.join(upload['parts'][n] for n in sorted(upload['parts'])),
+                                       upload['headers'])
+                    self._reply(200, (f'<?xml version="1.0" encoding="UTF-8"?><CompleteMultipartUploadResult>'
+                                      f'<ETag>{etag}</ETag></CompleteMultipartUploadResult>').encode(),
+                                {'Content-Type': 'application/xml'})
+                else:
+                    self._reply(501, _error_body('NotImplemented', 'Operation not stubbed'),
+                                {'Content-Type': 'application/xml'})
+
+            def do_GET(self):
+                if self._faulted():
+                    return
+                with stub._lock:
+                    stored = stub.objects.get(self._object_key())
+                if stored is None:
+                    self._reply(404, _error_body('NoSuchKey', 'The specified key does not exist.'),
+                                {'Content-Type': 'application/xml'})
+                    return
+                body, headers = stored
+                headers = dict(headers, **{'Accept-Ranges': 'bytes'})
+                match = _RANGE_PATTERN.match(self.headers.get('Range', ''))
+                if match and body and any(match.groups()):
+                    first, last = match.groups()
+                    if first:
+                        start, end = int(first), min(int(last) if last else len(body) - 1, len(body) - 1)
+                    else:
+                        start, end = max(len(body) - int(last), 0), len(body) - 1
+                    headers['Content-Range'] = f'bytes {start}-{end}/{len(body)}'
+                    self._reply(206, body[start:end + 1], headers)
+                else:
+                    self._reply(200, body, headers)
+
+            do_HEAD = do_GET
+
+            def do_DELETE(self):
+                if self._faulted():
+                    return
+                query = self._query()
+                with stub._lock:
+                    if 'uploadId' in query:
+                        stub.uploads.pop(query['uploadId'][0], None)
+                    else:
+                        stub.objects.pop(self._object_key(), None)
+                self._reply(204)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve an in-memory S3 stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 503')
+    args = parser.parse_args()
+
+    stub = S3Stub(args.host, args.port, args.latency, args.error_rate)
+    print(f"S3 stub listening on {stub.endpoint_url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
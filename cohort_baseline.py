@@ -0,0 +1,123 @@
+"""
+Hospital-wide cohort baselines for anomaly scoring
+
+A cohort is every note sharing a note type or a staff department. Each cohort
+keeps a running sum of its notes' L2-normalised vectors (the centroid direction)
+and Welford running moments of note length and vocabulary size. Baselines are
+updated incrementally by a periodic pass over newly saved notes, so scoring a
+note against its cohorts costs the same regardless of how many notes the cohort
+holds.
+"""
+
+import numpy as np
+from scipy import sparse
+
+from note_vectors import encode_vector, decode_vector
+
+# Cohort dimensions a note is scored against
+COHORT_TYPES = ('note_type', 'department')
+
+# Centroids are pruned to their heaviest features to keep per-note work constant
+CENTROID_MAX_FEATURES = 8192
+
+# Cohorts with fewer notes than this are not trusted for scoring
+MIN_COHORT_NOTES = 20
+
+
+def note_cohort_keys(note_type, department):
+    """
+    Cohort keys a note belongs to
+
+    Args:
+        note_type (str): Note type (Assessment, Progress, ...)
+        department (str): Authoring staff member's department
+
+    Returns:
+        list: (cohort_type, cohort_key) tuples
+    """
+    return [('note_type', note_type or 'unknown'), ('department', department or 'unknown')]
+
+
+def text_statistics(note_tokens):
+    """Word count and distinct word count (from NoteTokens) used by the cohort distributions"""
+    return len(note_tokens.tokens), len(note_tokens.vocabulary)
+
+
+def update_baseline(baseline, vector, length, vocabulary_size, max_features=CENTROID_MAX_FEATURES):
+    """
+    Fold one note into a cohort baseline in place
+
+    Args:
+        baseline: CohortBaseline row
+        vector (scipy.sparse matrix): L2-normalised note vector
+        length (int): Note word count
+        vocabulary_size (int): Note distinct word count
+        max_features (int): Number of centroid features kept after the update
+    """
+    dimension = vector.shape[1]
+    if baseline.centroid_indices:
+        centroid = decode_vector(baseline.centroid_indices, baseline.centroid_weights, dimension)
+        centroid = centroid + vector
+    else:
+        centroid = sparse.csr_matrix(vector, dtype=np.float32)
+
+    if centroid.nnz > max_features:
+        keep = np.argpartition(-centroid.data, max_features - 1)[:max_features]
+        centroid = sparse.csr_matrix(
+            (centroid.data[keep], (np.zeros(len(keep), dtype=np.int32), centroid.indices[keep])),
+            shape=(1, dimension)
+        )
+
+    baseline.dimension = dimension
+    baseline.centroid_indices, baseline.centroid_weights = encode_vector(centroid)
+
+    # Welford's online update of mean and sum of squared deviations
+    count = (baseline.note_count or 0) + 1
+    length_delta = length - (baseline.length_mean or 0.0)
+    baseline.length_mean = (baseline.length_mean or 0.0) + length_delta / count
+    baseline.length_m2 = (baseline.length_m2 or 0.0) + length_delta * (length - baseline.length_mean)
+    vocabulary_delta = vocabulary_size - (baseline.vocabulary_mean or 0.0)
+    baseline.vocabulary_mean = (baseline.vocabulary_mean or 0.0) + vocabulary_delta / count
+    baseline.vocabulary_m2 = (baseline.vocabulary_m2 or 0.0) + vocabulary_delta * (vocabulary_size - baseline.vocabulary_mean)
+    baseline.note_count = count
+
+
+def _zscore(value, mean, m2, count):
+    std = np.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+    return (value - mean) / std if std > 0 else 0.0
+
+
+def cohort_metrics(baselines, vector, length, vocabulary_size, min_notes=MIN_COHORT_NOTES):
+    """
+    Compare a note against its cohort baselines
+
+    Args:
+        baselines (list): CohortBaseline rows for the note's cohorts
+        vector (scipy.sparse matrix): L2-normalised note vector
+        length (int): Note word count
+        vocabulary_size (int): Note distinct word count
+        min_notes (int): Minimum cohort size to be considered
+
+    Returns:
+        dict: Cohort metrics, or None when no cohort is large enough
+    """
+    usable = [b for b in baselines if (b.note_count or 0) >= min_notes and b.centroid_indices]
+    if not usable:
+        return None
+
+    # One sparse product against all cohort centroids at once
+    centroids = sparse.vstack([
+        decode_vector(b.centroid_indices, b.centroid_weights, vector.shape[1]) for b in usable
+    ], format='csr')
+    norms = np.sqrt(np.asarray(centroids.multiply(centroids).sum(axis=1)).ravel())
+    similarities = (centroids @ vector.T).toarray().ravel() / np.maximum(norms, 1e-12)
+
+    length_z = [_zscore(length, b.length_mean, b.length_m2, b.note_count) for b in usable]
+    vocabulary_z = [_zscore(vocabulary_size, b.vocabulary_mean, b.vocabulary_m2, b.note_count) for b in usable]
+
+    return {
+        'cohort_similarity': float(np.mean(similarities)),
+        'length_zscore': float(max(length_z, key=abs)),
+        'vocabulary_zscore': float(max(vocabulary_z, key=abs)),
+        'cohort_size': int(min(b.note_count for b in usable))
+    }
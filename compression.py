@@ -0,0 +1,83 @@
+"""
+HTTP response compression
+
+Rendered pages and JSON responses are compressed in the app (gzip, or brotli
+when the optional ``brotli`` package is installed and the client accepts it).
+Small bodies are sent as-is because the framing overhead outweighs the saving,
+and streamed responses (SSE, S3 downloads) and file responses are never
+buffered for compression.
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml'
+}
+
+
+def choose_encoding(accept_encodings):
+    """
+    Best content coding the client accepts
+
+    Args:
+        accept_encodings: werkzeug Accept object (request.accept_encodings)
+
+    Returns:
+        str: 'br', 'gzip' or None for identity
+    """
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, accept_encodings, min_size=1024, gzip_level=6, brotli_quality=5):
+    """
+    Compress a buffered response body in place when worthwhile
+
+    Args:
+        response: Flask response
+        accept_encodings: werkzeug Accept object from the request
+        min_size (int): Bodies smaller than this many bytes are left uncompressed
+        gzip_level (int): gzip compression level (1-9)
+        brotli_quality (int): brotli quality (0-11)
+
+    Returns:
+        The same response
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=brotli_quality)
+    else:
+        compressed = gzip.compress(body, compresslevel=gzip_level)
+    if len(compressed) >= len(body):
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # A strong validator must not be shared between encodings of the same entity
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
@@ -18,6 +18,17 @@ class Config:
     AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
     AWS_S3_BUCKET = os.environ.get('AWS_S3_BUCKET')
     AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+    S3_COMPRESSION = os.environ.get('S3_COMPRESSION', 'none')  # none, gzip or zstd (needs zstandard)
+    S3_MAX_CONCURRENCY = int(os.environ.get('S3_MAX_CONCURRENCY', 16))  # Match to worker threads
+    S3_ACQUIRE_TIMEOUT = float(os.environ.get('S3_ACQUIRE_TIMEOUT', 2.0))
+    S3_CONNECT_TIMEOUT = int(os.environ.get('S3_CONNECT_TIMEOUT', 3))
+    S3_READ_TIMEOUT = int(os.environ.get('S3_READ_TIMEOUT', 10))
+    S3_SLOW_CALL_THRESHOLD = float(os.environ.get('S3_SLOW_CALL_THRESHOLD', 5.0))  # Slower calls trip the breaker
+    NOTE_SPOOL_DIR = os.environ.get('NOTE_SPOOL_DIR')  # Local disk; defaults to instance/note_spool
+    NOTE_SPOOL_KEYS = os.environ.get('NOTE_SPOOL_KEYS', '')  # Comma-separated Fernet keys, newest first; derived from SECRET_KEY if empty
+    NOTE_SPOOL_BATCH_SIZE = int(os.environ.get('NOTE_SPOOL_BATCH_SIZE', 50))  # Spooled uploads per drain transaction
+    NOTE_SPOOL_GRACE = float(os.environ.get('NOTE_SPOOL_GRACE', 60))  # Seconds to wait for a spooled note's row to commit
     
     # Security settings
     BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
@@ -29,6 +40,20 @@ class Config:
     MAX_CASE_NOTE_LENGTH = int(os.environ.get('MAX_CASE_NOTE_LENGTH', 10000))
     ANOMALY_THRESHOLD = float(os.environ.get('ANOMALY_THRESHOLD', 0.3))
     NLP_MODEL_PATH = os.environ.get('NLP_MODEL_PATH', 'models/')
+    NLP_BACKEND = os.environ.get('NLP_BACKEND', 'tfidf')  # tfidf (fitted offline) or hashing (zero-fit)
+    SCORING_HISTORY_SIZE = int(os.environ.get('SCORING_HISTORY_SIZE', 3))  # Previous notes each note is compared with
+    ANOMALY_FEED_POLL_INTERVAL = float(os.environ.get('ANOMALY_FEED_POLL_INTERVAL', 1.0))  # Seconds; picks up other workers' flags
+    ANOMALY_FEED_MAX_STREAM = float(os.environ.get('ANOMALY_FEED_MAX_STREAM', 300))  # Seconds before clients reconnect
+    ANOMALY_FEED_LOOKBACK = int(os.environ.get('ANOMALY_FEED_LOOKBACK', 50))  # Event ids re-polled for late commits
+    
+    # Rendering settings
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR') or None  # Compiled template bytecode; system temp dir if unset
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000))  # Cached table rows per worker
+    FRAGMENT_CACHE_TTL = float(os.environ.get('FRAGMENT_CACHE_TTL', 300))  # Seconds before a cached row is re-rendered
+    COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', 'True').lower() in ['true', '1', 'yes']
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # Smaller bodies are sent uncompressed
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))  # Used when the brotli package is installed
     
     # Email configuration (optional)
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
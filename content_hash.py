@@ -0,0 +1,87 @@
+"""
+Content fingerprints for case notes
+
+An exact SHA-256 of the note body identifies byte-identical notes (and names
+content-addressed S3 objects), and a 64-bit SimHash over word unigrams and
+bigrams identifies near-identical ones: notes whose fingerprints differ in only
+a few bits share almost all of their wording.
+"""
+
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+from nlp_processor import TOKEN_PATTERN
+
+SIMHASH_BITS = 64
+
+# Fingerprints this many bits apart or fewer are treated as near-duplicates
+NEAR_DUPLICATE_DISTANCE = 3
+
+_SIGN_BIT = 1 << (SIMHASH_BITS - 1)
+_MASK = (1 << SIMHASH_BITS) - 1
+
+
+def content_sha256(text):
+    """Hex SHA-256 of the note body as stored (UTF-8)"""
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+
+# Clinical vocabulary is small and repetitive, so most feature hashes are cache hits
+@lru_cache(maxsize=1 << 16)
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(text):
+    """
+    64-bit SimHash of a note, as a signed integer so it fits a BIGINT column
+
+    Args:
+        text (str): Note body
+
+    Returns:
+        int: Fingerprint in [-2**63, 2**63)
+    """
+    tokens = TOKEN_PATTERN.findall((text or '').lower())
+    features = tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+    if not features:
+        return 0
+
+    # Per-bit votes across all feature hashes, vectorised as a (features x 64) bit matrix
+    hashes = np.fromiter((_feature_hash(feature) for feature in features), dtype='<u8', count=len(features))
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    majority = (2 * bits.sum(axis=0, dtype=np.int64) > len(features)).astype(np.uint8)
+    fingerprint = int.from_bytes(np.packbits(majority, bitorder='little').tobytes(), 'little')
+    return fingerprint - (1 << SIMHASH_BITS) if fingerprint & _SIGN_BIT else fingerprint
+
+
+def hamming_distance(first, second):
+    """Number of differing bits between two (signed) fingerprints"""
+    return bin((first ^ second) & _MASK).count('1')
+
+
+def find_duplicate(sha256, fingerprint, candidates, max_distance=NEAR_DUPLICATE_DISTANCE):
+    """
+    Closest duplicate of a note among candidate notes
+
+    Args:
+        sha256 (str): The note's content hash
+        fingerprint (int): The note's SimHash
+        candidates (list): Rows with note_id, content_sha256 and content_simhash
+        max_distance (int): Largest SimHash distance counted as a near-duplicate
+
+    Returns:
+        tuple: (candidate, 'exact' or 'near'), or (None, None)
+    """
+    best, best_distance = None, max_distance + 1
+    for candidate in candidates:
+        if candidate.content_sha256 and candidate.content_sha256 == sha256:
+            return candidate, 'exact'
+        if candidate.content_simhash is None or fingerprint is None:
+            continue
+        distance = hamming_distance(fingerprint, candidate.content_simhash)
+        if distance < best_distance:
+            best, best_distance = candidate, distance
+    return (best, 'near') if best is not None else (None, None)
@@ -124,6 +124,9 @@ SESSION_TIMEOUT=3600
 # Logging Configuration
 LOG_LEVEL=INFO
 LOG_FILE=logs/application.log
+
+# Rendering Settings
+TEMPLATE_CACHE_DIR=$APP_DIR/cache/templates
 EOF
     print_warning "IMPORTANT: Please update the AWS Access Key ID and Secret Access Key in .env file!"
     print_warning "Your S3 bucket (hosptialbuckets3) and RDS database are already configured."
@@ -133,14 +136,13 @@ fi
 mkdir -p logs
 chmod 755 logs
 
-# Initialize database
+# Initialize database; also brings a database from an earlier release up to date
 print_header "Initializing database..."
-python3 -c "
-from app import app, db
-with app.app_context():
-    db.create_all()
-    print('Database tables created successfully!')
-"
+python3 -m flask --app app upgrade-schema
+
+# Compile templates once so every worker loads bytecode instead of compiling
+mkdir -p cache/templates
+TEMPLATE_CACHE_DIR=$APP_DIR/cache/templates python3 -m flask --app app precompile-templates
 
 # Create Gunicorn configuration
 print_header "Creating Gunicorn configuration..."
@@ -148,7 +150,9 @@ cat > gunicorn.conf.py << EOF
 # Gunicorn configuration file
 bind = "127.0.0.1:8000"
 workers = 3
-worker_class = "sync"
+# Threaded workers: the /api/anomalies/stream SSE connections hold a thread, not a whole worker
+worker_class = "gthread"
+threads = 16
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 100
@@ -319,6 +323,9 @@ chmod +x monitor.sh
 # Setup cron job for monitoring (every 5 minutes)
 (crontab -l 2>/dev/null; echo "*/5 * * * * $APP_DIR/monitor.sh") | crontab -
 
+# Fold newly saved notes into the anomaly cohort baselines (every 10 minutes)
+(crontab -l 2>/dev/null; echo "*/10 * * * * cd $APP_DIR && venv/bin/python -m flask --app app fold-cohort-baselines >> logs/cohort_baselines.log 2>&1") | crontab -
+
 # Final status check
 print_header "Checking deployment status..."
 sleep 5
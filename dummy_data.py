@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Synthetic data for demos and load testing
+Generates staff, patients and case notes with realistic text and timing
+distributions using bulk inserts. Output is deterministic for a given seed and
+epoch (the time the generated history ends at).
+
+Small demo data set (what run.py creates on an empty database):
+    python dummy_data.py
+
+Benchmark-scale data set:
+    python dummy_data.py --staff 500 --patients 100000 --notes 5000000 --seed 7
+
+Pass --epoch now to end the history at the current time instead of EPOCH.
+
+Pass --upload-s3 to also write note bodies to AWS_S3_BUCKET (point
+S3_ENDPOINT_URL at a local stand-in such as MinIO to avoid touching AWS).
+"""
+
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from content_hash import content_sha256, simhash
+from app import app, Staff, Patient, CaseNote, refresh_patient_summaries, rebuild_anomaly_rollups
+
+# Rows per INSERT batch / transaction
+BATCH_SIZE = 10000
+
+# Generated timestamps and ages are relative to this, so a seed always yields the same rows
+EPOCH = datetime(2026, 1, 1)
+
+# Demo accounts documented in README.md
+DEMO_STAFF = [
+    ('dr_smith', 'John', 'Smith', 'Psychiatrist', 'Acute Psychiatry'),
+    ('nurse_johnson', 'Emily', 'Johnson', 'Nurse', 'Acute Psychiatry'),
+    ('therapist_brown', 'Michael', 'Brown', 'Therapist', 'Psychological Therapies'),
+    ('social_worker_davis', 'Sarah', 'Davis', 'Social Worker', 'Community Mental Health'),
+]
+DEMO_PASSWORD = 'password123'
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+    'Daniel', 'Nancy', 'Matthew', 'Lisa', 'Anthony', 'Betty', 'Mark', 'Sandra', 'Aroha', 'Wiremu',
+    'Mei', 'Hiroshi', 'Priya', 'Arjun', 'Fatima', 'Omar', 'Sofia', 'Mateo', 'Chloe', 'Liam',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin', 'Lee',
+    'Thompson', 'White', 'Harris', 'Clark', 'Lewis', 'Walker', 'Young', 'Allen', 'King', 'Wright',
+    'Ngata', 'Tane', 'Chen', 'Wang', 'Patel', 'Singh', 'Khan', 'Nguyen', 'Kim', 'Silva',
+]
+JOB_TITLES = ['Psychiatrist', 'Nurse', 'Nurse', 'Nurse', 'Therapist', 'Psychologist', 'Social Worker', 'Occupational Therapist']
+DEPARTMENTS = ['Acute Psychiatry', 'Psychological Therapies', 'Community Mental Health',
+               'Child and Adolescent', 'Older Adults', 'Addiction Services', 'Forensic Psychiatry']
+
+# Note types weighted roughly by how often they are written on a ward
+NOTE_TYPES = ['Progress', 'Assessment', 'Treatment', 'Medication', 'Therapy', 'Discharge', 'Incident', 'Consultation']
+NOTE_TYPE_WEIGHTS = [45, 12, 10, 10, 12, 4, 3, 4]
+
+PATIENT_STATUSES = ['Active', 'Discharged', 'On Leave']
+PATIENT_STATUS_WEIGHTS = [60, 35, 5]
+
+COMMON_SENTENCES = [
+    "Patient was seen on the ward this morning.",
+    "Mood appears euthymic with congruent affect.",
+    "Sleep has been adequate, approximately seven hours per night.",
+    "Appetite is reported as normal and weight is stable.",
+    "No thoughts of self-harm or harm to others were expressed.",
+    "Patient is engaging well with ward activities.",
+    "Family visited yesterday and the visit went well.",
+    "Medication was taken as prescribed with no side effects reported.",
+    "Insight and judgement are fair.",
+    "Speech is normal in rate and volume.",
+    "Thought process is linear and goal directed.",
+    "Patient is oriented to time, place and person.",
+    "Continue current management plan and review in one week.",
+    "Discussed coping strategies for anxiety.",
+    "Attended the morning group session.",
+]
+TYPE_SENTENCES = {
+    'Progress': [
+        "Overall progress continues to be positive.",
+        "Patient reports feeling more settled than last week.",
+        "Some low mood in the evenings, improving with support.",
+        "Participated in occupational therapy and completed the task.",
+    ],
+    'Assessment': [
+        "Presenting complaint is low mood and poor sleep for six weeks.",
+        "Past psychiatric history includes one previous admission.",
+        "Risk assessment completed; overall risk judged to be low.",
+        "Collateral history obtained from next of kin.",
+    ],
+    'Treatment': [
+        "Treatment plan reviewed with the multidisciplinary team.",
+        "Goals agreed for the coming fortnight.",
+        "Psychoeducation provided about the diagnosis.",
+    ],
+    'Medication': [
+        "Sertraline continued at 100 mg daily.",
+        "Olanzapine dose reduced due to sedation.",
+        "Bloods requested to monitor lithium level.",
+        "Discussed side effects and adherence.",
+    ],
+    'Therapy': [
+        "Session focused on cognitive restructuring.",
+        "Homework from the previous session was completed.",
+        "Explored triggers for recent distress.",
+        "Practised grounding techniques during the session.",
+    ],
+    'Discharge': [
+        "Discharge planning meeting held with family present.",
+        "Community follow-up arranged for next week.",
+        "Crisis plan provided and discussed.",
+    ],
+    'Incident': [
+        "Patient became verbally aggressive towards staff.",
+        "De-escalation techniques were used successfully.",
+        "Incident reported through the safety system.",
+    ],
+    'Consultation': [
+        "Consultation requested by the medical team.",
+        "Capacity assessment completed for treatment decisions.",
+        "Recommendations documented for the referring team.",
+    ],
+}
+# Rare out-of-pattern notes so the anomaly paths have something to find
+CRISIS_SENTENCES = [
+    "Emergency intervention required after acute deterioration.",
+    "Patient absconded from the ward and police were notified.",
+    "Severe agitation requiring rapid tranquillisation and restraint.",
+    "Expressed active suicidal intent with a specific plan.",
+    "Unexplained injuries noted; safeguarding referral made.",
+]
+CRISIS_RATE = 0.02
+
+
+class NoteGenerator:
+    """Deterministic case note text generator"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.sentences = {
+            note_type: TYPE_SENTENCES[note_type] * 3 + COMMON_SENTENCES
+            for note_type in NOTE_TYPES
+        }
+
+    def note(self, note_type):
+        """Return (title, content, is_crisis) for one note"""
+        rng = self.rng
+        # Log-normal sentence counts: most notes are short, a long tail is long
+        count = min(max(int(rng.lognormvariate(2.0, 0.6)), 2), 120)
+        is_crisis = rng.random() < CRISIS_RATE
+        sentences = CRISIS_SENTENCES if is_crisis else self.sentences[note_type]
+        content = ' '.join(rng.choices(sentences, k=count))
+        title = f"{note_type} note - {rng.choice(['ward review', 'daily review', 'follow-up', 'session', 'update'])}"
+        return title, content, is_crisis
+
+
+def _insert_batches(db, model, rows):
+    """Bulk insert row dicts with executemany, committing per batch"""
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(db.insert(model), rows[start:start + BATCH_SIZE])
+        db.session.commit()
+
+
+def create_dummy_staff(db, count=len(DEMO_STAFF), seed=0, epoch=EPOCH):
+    """Create the demo staff accounts plus generated staff up to count"""
+    rng = random.Random(f'staff-{seed}')
+    # Hash once: per-account hashing would dominate seeding time
+    password_hash = generate_password_hash(DEMO_PASSWORD)
+
+    rows = []
+    for index in range(count):
+        if index < len(DEMO_STAFF):
+            username, first_name, last_name, job_title, department = DEMO_STAFF[index]
+        else:
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            job_title, department = rng.choice(JOB_TITLES), rng.choice(DEPARTMENTS)
+            username = f"{first_name.lower()}.{last_name.lower()}{index}"
+        rows.append({
+            'username': username,
+            'email': f'{username}@hospital.example',
+            'password_hash': password_hash,
+            'first_name': first_name,
+            'last_name': last_name,
+            'job_title': job_title,
+            'department': department,
+            'created_at': epoch,
+            'is_active': True
+        })
+
+    _insert_batches(db, Staff, rows)
+    return len(rows)
+
+
+def create_dummy_patients(db, count=20, seed=0, epoch=EPOCH):
+    """Create patients with realistic age, status and admission distributions"""
+    rng = random.Random(f'patients-{seed}')
+    offset = db.session.query(db.func.count(Patient.patient_id)).scalar()
+
+    rows = []
+    for index in range(count):
+        age_days = rng.randint(18 * 365, 85 * 365)
+        status = rng.choices(PATIENT_STATUSES, PATIENT_STATUS_WEIGHTS)[0]
+        admission_date = epoch - timedelta(days=rng.randint(1, 3 * 365), minutes=rng.randint(0, 1439))
+        discharge_date = None
+        if status == 'Discharged':
+            discharge_date = admission_date + timedelta(days=rng.randint(3, 120))
+        rows.append({
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES),
+            'date_of_birth': epoch.date() - timedelta(days=age_days),
+            'medical_record_number': f'MRN{offset + index + 1:08d}',
+            'admission_date': admission_date,
+            'discharge_date': discharge_date,
+            'status': status,
+            'created_at': admission_date
+        })
+
+    _insert_batches(db, Patient, rows)
+    return len(rows)
+
+
+def create_dummy_case_notes(db, s3_gateway=None, bucket=None, count=100, seed=0, days=365, upload_workers=8,
+                            epoch=EPOCH):
+    """
+    Create case notes spread over the `days` days before epoch
+
+    Patients are chosen with a skewed distribution so a few have long histories
+    while most have a handful of notes. Crisis notes are pre-flagged with high
+    anomaly scores so anomaly pages have realistic data without running the
+    detector over every note.
+
+    Args:
+        db: Flask-SQLAlchemy handle
+        s3_gateway: S3Gateway used to upload note bodies (optional)
+        bucket (str): Bucket to upload to; bodies are only uploaded if set
+        count (int): Number of notes
+        seed (int): Random seed
+        days (int): Time window the notes are spread over
+        upload_workers (int): Concurrent S3 uploads
+        epoch (datetime): Time the generated history ends at
+    """
+    rng = random.Random(f'notes-{seed}')
+    generator = NoteGenerator(rng)
+    staff_ids = [row[0] for row in db.session.query(Staff.staff_id).order_by(Staff.staff_id).all()]
+    patient_ids = [row[0] for row in db.session.query(Patient.patient_id).order_by(Patient.patient_id).all()]
+    if not staff_ids or not patient_ids:
+        raise ValueError("Create staff and patients before case notes")
+
+    upload = s3_gateway is not None and bool(bucket)
+    executor = ThreadPoolExecutor(max_workers=upload_workers) if upload else None
+    uploaded_keys = set()
+    window = days * 24 * 3600
+
+    created = 0
+    while created < count:
+        batch = []
+        for index in range(created, min(created + BATCH_SIZE, count)):
+            note_type = rng.choices(NOTE_TYPES, NOTE_TYPE_WEIGHTS)[0]
+            title, content, is_crisis = generator.note(note_type)
+            # Squaring a uniform draw skews notes towards low patient indexes
+            patient_id = patient_ids[int(len(patient_ids) * rng.random() ** 2)]
+            created_at = epoch - timedelta(seconds=rng.randint(0, window))
+            row = {
+                'patient_id': patient_id,
+                'staff_id': rng.choice(staff_ids),
+                'note_type': note_type,
+                'title': title,
+                'content': content,
+                'created_at': created_at,
+                'updated_at': created_at,
+                # Bulk inserts skip the ORM events that fingerprint notes
+                'content_sha256': content_sha256(content),
+                'content_simhash': simhash(content),
+                'is_flagged': is_crisis,
+                'anomaly_score': round(rng.uniform(0.55, 1.0), 3) if is_crisis else round(rng.uniform(0.0, 0.4), 3)
+            }
+            if upload:
+                row['s3_file_key'] = f"case_notes/sha256/{row['content_sha256'][:2]}/{row['content_sha256']}.txt"
+                row['s3_bucket'] = bucket
+                row['file_size'] = len(content.encode('utf-8'))
+                row['file_type'] = 'text/plain'
+            batch.append(row)
+
+        db.session.execute(db.insert(CaseNote), batch)
+        db.session.commit()
+
+        if upload:
+            # Keys are content-addressed, so each distinct body is uploaded once
+            pending = {row['s3_file_key']: row for row in batch if row['s3_file_key'] not in uploaded_keys}
+            uploaded_keys.update(pending)
+            list(executor.map(lambda row: s3_gateway.upload_bytes(
+                row['content'].encode('utf-8'), bucket, row['s3_file_key'],
+                content_type='text/plain; charset=utf-8',
+                metadata={'content_sha256': row['content_sha256']}
+            ), pending.values()))
+
+        created += len(batch)
+
+    if executor:
+        executor.shutdown()
+    
+    # Bulk inserts bypass the ORM events and scoring hooks that maintain derived tables
+    refresh_patient_summaries(db.session.connection())
+    db.session.commit()
+    rebuild_anomaly_rollups()
+    return created
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seed the database with synthetic hospital data')
+    parser.add_argument('--staff', type=int, default=len(DEMO_STAFF))
+    parser.add_argument('--patients', type=int, default=20)
+    parser.add_argument('--notes', type=int, default=100)
+    parser.add_argument('--days', type=int, default=365, help='Spread notes over this many days')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--epoch', default=EPOCH.isoformat(),
+                        help="End of the generated history (ISO date/time, or 'now')")
+    parser.add_argument('--upload-s3', action='store_true', help='Also write note bodies to AWS_S3_BUCKET')
+    args = parser.parse_args()
+    epoch = datetime.utcnow() if args.epoch == 'now' else datetime.fromisoformat(args.epoch)
+
+    from app import db, s3_gateway
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        if Staff.query.count() == 0:
+            print(f"Created {create_dummy_staff(db, args.staff, args.seed, epoch)} staff")
+        print(f"Created {create_dummy_patients(db, args.patients, args.seed, epoch)} patients")
+        created = create_dummy_case_notes(
+            db, s3_gateway, app.config['AWS_S3_BUCKET'] if args.upload_s3 else None,
+            count=args.notes, seed=args.seed, days=args.days, epoch=epoch
+        )
+        elapsed = time.perf_counter() - started
+        print(f"Created {created} case notes in {elapsed:.1f}s ({created / max(elapsed, 1e-9):.0f} notes/s)")
@@ -0,0 +1,110 @@
+"""
+Per-row template fragment caching
+
+Large list pages render the same note rows over and over; a row only changes
+when its note does. The ``{% cache %}`` tag stores the rendered markup of its
+body under a key built from the tag's arguments, so templates key rows on a
+fragment name, the note id and ``updated_at``:
+
+    {% cache 'anomaly-row', note.note_id, note.updated_at %}
+        <tr>...</tr>
+    {% endcache %}
+
+Keys must only hold what the fragment depends on (no per-user values), so
+every user shares one entry per row. A hit only saves rendering unless the
+view also skips loading the row: views can check which keys are cached with
+``get_many`` and load full rows, with their joins, only for the misses.
+
+Entries live in a bounded in-process LRU with a time-to-live; the TTL bounds
+how stale related data shown in a row (patient or staff names) can become.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered fragments with a time-to-live"""
+
+    def __init__(self, max_entries=5000, ttl=300.0):
+        """
+        Args:
+            max_entries (int): Fragments kept per process; 0 disables caching
+            ttl (float): Seconds a fragment is served before it is re-rendered
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached fragment for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_many(self, keys):
+        """Cached fragments for those of keys that are cached, as {key: fragment}"""
+        found = {}
+        for key in keys:
+            fragment = self.get(key)
+            if fragment is not None:
+                found[key] = fragment
+        return found
+
+    def set(self, key, value):
+        """Store a fragment, evicting the least recently used beyond max_entries"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every fragment and reset the hit counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja extension adding ``{% cache key, ... %}...{% endcache %}``"""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_cached', [nodes.Tuple(key, 'load')]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        cache = self.environment.fragment_cache
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = caller()
+            cache.set(key, fragment)
+        return fragment
@@ -0,0 +1,238 @@
+"""
+Vectorizer backends for the NLP anomaly detector
+
+A backend turns tokenized notes (lists of lowercase word tokens, see
+NLPAnomalyDetector.tokenize) into L2-normalised sparse vectors in a fixed
+feature space. Backends never fit at request time: the hashing backend
+needs no fitting at all, and the TF-IDF backend loads a vocabulary fitted
+offline (see train_nlp_model.py) from NLP_MODEL_PATH.
+
+Model directory layout (one sub-directory per version):
+
+    <NLP_MODEL_PATH>/CURRENT                 name of the active version
+    <NLP_MODEL_PATH>/<version>/manifest.json    backend name, analyzer and dimension
+    <NLP_MODEL_PATH>/<version>/term_hashes.npy  uint64 term hashes, sorted; memory-mapped on load
+    <NLP_MODEL_PATH>/<version>/term_columns.npy int32 feature column of each hash; memory-mapped
+    <NLP_MODEL_PATH>/<version>/idf.npy          float32, memory-mapped on load
+    <NLP_MODEL_PATH>/<version>/vocabulary.json  terms by column, for inspection only (not loaded)
+"""
+
+import hashlib
+import json
+import logging
+import os
+from functools import lru_cache
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer, ENGLISH_STOP_WORDS
+from sklearn.preprocessing import normalize
+
+logger = logging.getLogger(__name__)
+
+# Default size of the hashed feature space
+HASHING_DIMENSION = 2 ** 18
+
+# Identifies analyze_tokens; models fitted with any other analyzer are refused on load
+ANALYZER = 'tokens-english-stop-1-2'
+
+# Odd 64-bit constant mixing a bigram's first word hash into its second
+_BIGRAM_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def analyze_tokens(tokens):
+    """
+    Turn a token list into unigram and bigram features
+
+    Matches scikit-learn's word analyzer with English stop words and
+    ngram_range=(1, 2), but starts from already tokenized text so notes are
+    only scanned once.
+    """
+    words = [token for token in tokens if token not in ENGLISH_STOP_WORDS]
+    return words + [f'{first} {second}' for first, second in zip(words, words[1:])]
+
+
+@lru_cache(maxsize=65536)
+def _word_hash(word):
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def feature_hashes(tokens):
+    """
+    Stable 64-bit hashes of the analyze_tokens features of a token list, in the same order
+
+    Only words are hashed; bigram hashes are combined from their words' hashes,
+    so a note costs one (usually cached) hash per word.
+    """
+    words = [token for token in tokens if token not in ENGLISH_STOP_WORDS]
+    hashes = np.fromiter((_word_hash(word) for word in words), dtype=np.uint64, count=len(words))
+    return np.concatenate([hashes, hashes[:-1] * _BIGRAM_MULTIPLIER ^ hashes[1:]])
+
+
+def term_hash(term):
+    """Hash of one vocabulary term ('word' or 'first second'), matching feature_hashes"""
+    return int(feature_hashes(term.split(' '))[-1])
+
+
+class HashingBackend:
+    """Zero-fit backend: features are hashed, so any text can be vectorized immediately"""
+
+    name = 'hashing'
+
+    def __init__(self, n_features=HASHING_DIMENSION):
+        self.dimension = n_features
+        self.version = f'hashing-v1-{n_features}'
+        self._vectorizer = HashingVectorizer(
+            n_features=n_features,
+            analyzer=analyze_tokens,
+            alternate_sign=False,
+            norm='l2',
+            dtype=np.float32
+        )
+
+    def transform(self, texts):
+        return self._vectorizer.transform(texts)
+
+
+class TfidfBackend:
+    """
+    Backend using a TF-IDF vocabulary and IDF weights fitted offline
+
+    The vocabulary is held as sorted 64-bit term hashes with their feature
+    columns, so a saved model is memory-mapped and shared by every worker
+    instead of being parsed into a dict per process. Fitting uses
+    analyze_tokens and transforming hashes exactly the same features.
+    """
+
+    name = 'tfidf'
+
+    def __init__(self, term_hashes, term_columns, idf, version, terms=None):
+        self.term_hashes = term_hashes
+        self.term_columns = term_columns
+        self.dimension = len(idf)
+        self.version = version
+        self.idf = idf
+        self.terms = terms
+
+    @classmethod
+    def from_terms(cls, terms, idf, version):
+        """Build a backend from terms listed in feature-column order"""
+        hashes = np.array([term_hash(term) for term in terms], dtype=np.uint64)
+        order = np.argsort(hashes)
+        return cls(hashes[order], order.astype(np.int32), idf, version, list(terms))
+
+    def _columns(self, tokens):
+        """Feature columns of the in-vocabulary features of one token list (repeats included)"""
+        hashes = feature_hashes(tokens)
+        if not len(hashes) or not self.dimension:
+            return np.empty(0, dtype=np.int32)
+        positions = np.minimum(np.searchsorted(self.term_hashes, hashes), self.dimension - 1)
+        known = self.term_hashes[positions] == hashes
+        return self.term_columns[positions[known]]
+
+    def transform(self, texts):
+        columns = [self._columns(tokens) for tokens in texts]
+        indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in columns], out=indptr[1:])
+        indices = np.concatenate(columns) if columns else np.empty(0, dtype=np.int32)
+        counts = csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr),
+                            shape=(len(columns), self.dimension))
+        counts.sum_duplicates()
+        return normalize(counts.multiply(self.idf).tocsr().astype(np.float32), norm='l2')
+
+    @classmethod
+    def fit(cls, token_lists, version, max_features=50000, min_df=2):
+        """Fit a vocabulary and IDF weights on a corpus of tokenized notes (offline only)"""
+        vectorizer = TfidfVectorizer(
+            max_features=max_features,
+            analyzer=analyze_tokens,
+            min_df=min_df,
+            max_df=0.95
+        )
+        vectorizer.fit(token_lists)
+        terms = [term for term, _ in sorted(vectorizer.vocabulary_.items(), key=lambda item: item[1])]
+        return cls.from_terms(terms, vectorizer.idf_.astype(np.float32), version)
+
+    def save(self, model_path):
+        """Write this model under model_path/<version> and mark it as current"""
+        version_dir = os.path.join(model_path, self.version)
+        os.makedirs(version_dir, exist_ok=True)
+
+        np.save(os.path.join(version_dir, 'term_hashes.npy'), np.asarray(self.term_hashes, dtype=np.uint64))
+        np.save(os.path.join(version_dir, 'term_columns.npy'), np.asarray(self.term_columns, dtype=np.int32))
+        np.save(os.path.join(version_dir, 'idf.npy'), np.asarray(self.idf, dtype=np.float32))
+        if self.terms is not None:
+            with open(os.path.join(version_dir, 'vocabulary.json'), 'w') as f:
+                json.dump(self.terms, f)
+        with open(os.path.join(version_dir, 'manifest.json'), 'w') as f:
+            json.dump({
+                'backend': self.name,
+                'version': self.version,
+                'analyzer': ANALYZER,
+                'dimension': self.dimension
+            }, f)
+
+        # Switch the CURRENT pointer atomically so running workers never see a partial write
+        pointer = os.path.join(model_path, 'CURRENT')
+        with open(pointer + '.tmp', 'w') as f:
+            f.write(self.version)
+        os.replace(pointer + '.tmp', pointer)
+        return version_dir
+
+    @classmethod
+    def load(cls, model_path, version=None):
+        """
+        Load a saved model with its vocabulary and IDF arrays memory-mapped
+
+        Raises:
+            ValueError: If the model was fitted with a different analyzer (retrain it)
+        """
+        if version is None:
+            with open(os.path.join(model_path, 'CURRENT')) as f:
+                version = f.read().strip()
+        version_dir = os.path.join(model_path, version)
+
+        with open(os.path.join(version_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('analyzer') != ANALYZER:
+            raise ValueError(f"model {version} was fitted with analyzer {manifest.get('analyzer')!r}, "
+                             f"not {ANALYZER!r}; retrain it with train_nlp_model.py")
+
+        def load_array(name):
+            return np.load(os.path.join(version_dir, name), mmap_mode='r')
+
+        return cls(load_array('term_hashes.npy'), load_array('term_columns.npy'), load_array('idf.npy'),
+                   manifest['version'])
+
+
+BACKENDS = {
+    HashingBackend.name: HashingBackend,
+    TfidfBackend.name: TfidfBackend
+}
+
+
+def load_backend(name='tfidf', model_path=None):
+    """
+    Build the configured vectorizer backend
+
+    Falls back to the hashing backend when a fitted model is requested but
+    none has been trained yet, so a fresh deployment can still score notes.
+
+    Args:
+        name (str): Backend name ('hashing' or 'tfidf')
+        model_path (str): Directory holding fitted models (NLP_MODEL_PATH)
+
+    Returns:
+        Backend instance
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown NLP backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+
+    if name == TfidfBackend.name:
+        try:
+            return TfidfBackend.load(model_path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("No usable TF-IDF model under %s (%s); using hashing backend", model_path, e)
+            return HashingBackend()
+
+    return HashingBackend()
@@ -1,27 +1,50 @@
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
+from scipy import sparse
 import re
 import string
+import threading
+from collections import OrderedDict
+from nlp_backends import HashingBackend
+
+# Word tokens of two or more characters, matching the vectorizers' token pattern
+TOKEN_PATTERN = re.compile(r'\w\w+')
+
+class NoteTokens:
+    """Token stream of one note, shared by vectorization and the length/vocabulary metrics"""
+    __slots__ = ('tokens', 'vocabulary')
+    
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.vocabulary = frozenset(tokens)
+    
+    def __len__(self):
+        return len(self.tokens)
 
 class NLPAnomalyDetector:
-    def __init__(self, anomaly_threshold=0.3):
+    def __init__(self, anomaly_threshold=0.3, cohort_threshold=0.15, cohort_zscore=3.0, backend=None,
+                 token_cache_size=1024):
         """
         Initialize NLP Anomaly Detector
         
         Args:
             anomaly_threshold (float): Threshold below which similarity is considered anomalous
+            cohort_threshold (float): Threshold below which similarity to a cohort centroid is anomalous
+            cohort_zscore (float): Length/vocabulary z-score beyond which a note is unusual for its cohort
+            backend: Vectorizer backend from nlp_backends (defaults to the zero-fit hashing backend)
+            token_cache_size (int): Number of notes whose tokens are kept, keyed by note_id
         """
         self.anomaly_threshold = anomaly_threshold
-        self.vectorizer = TfidfVectorizer(
-            max_features=1000,
-            stop_words='english',
-            ngram_range=(1, 2),
-            min_df=1,
-            max_df=0.95
-        )
-        self.scaler = StandardScaler()
+        self.cohort_threshold = cohort_threshold
+        self.cohort_zscore = cohort_zscore
+        self.backend = backend or HashingBackend()
+        self.token_cache_size = token_cache_size
+        self._token_cache = OrderedDict()
+        self._token_cache_lock = threading.Lock()
+    
+    @property
+    def model_version(self):
+        """Version string of the vectorizer backend, recorded with every score"""
+        return self.backend.version
         
     def preprocess_text(self, text):
         """
@@ -31,90 +54,117 @@ class NLPAnomalyDetector:
             text (str): Raw text to preprocess
             
         Returns:
-            str: Cleaned and preprocessed text
+            str: Cleaned and preprocessed text (space-joined tokens)
         """
-        if not text:
-            return ""
-        
-        # Convert to lowercase
-        text = text.lower()
-        
-        # Remove special characters but keep medical terms
-        text = re.sub(r'[^\w\s\-\.]', ' ', text)
+        return ' '.join(self.tokenize(text).tokens)
+    
+    def tokenize(self, text):
+        """
+        Tokenize text in a single pass
         
-        # Remove extra whitespace
-        text = ' '.join(text.split())
+        Args:
+            text (str or NoteTokens): Raw text, or tokens from a previous call
+            
+        Returns:
+            NoteTokens: Lowercase word tokens with their distinct vocabulary
+        """
+        if isinstance(text, NoteTokens):
+            return text
+        return NoteTokens(TOKEN_PATTERN.findall(text.lower()) if text else [])
+    
+    def note_tokens(self, note_id, text):
+        """
+        Tokenize a stored note, reusing tokens cached for its note_id
         
-        return text
+        Args:
+            note_id (int): Case note ID used as the cache key
+            text (str): Case note content
+            
+        Returns:
+            NoteTokens: Tokens for the note
+        """
+        with self._token_cache_lock:
+            cached = self._token_cache.get(note_id)
+            if cached is not None:
+                self._token_cache.move_to_end(note_id)
+                return cached
+        
+        tokens = self.tokenize(text)
+        with self._token_cache_lock:
+            self._token_cache[note_id] = tokens
+            while len(self._token_cache) > self.token_cache_size:
+                self._token_cache.popitem(last=False)
+        return tokens
     
     def extract_features(self, texts):
         """
-        Extract TF-IDF features from texts
+        Extract feature vectors from texts using the configured backend
         
         Args:
-            texts (list): List of texts to process
+            texts (list): List of texts (or NoteTokens) to process
             
         Returns:
-            numpy.ndarray: Feature matrix
+            scipy.sparse.csr_matrix: L2-normalised feature matrix, one row per text
         """
-        # Preprocess all texts
-        processed_texts = [self.preprocess_text(text) for text in texts]
-        
-        # Handle case where we have very few documents
-        if len(processed_texts) <= 1:
-            return np.array([[0.0]])
+        return self.backend.transform([self.tokenize(text).tokens for text in texts])
+    
+    def vectorize(self, text):
+        """
+        Compute the persistent vector for a single note
         
-        try:
-            # Fit and transform texts to TF-IDF vectors
-            tfidf_matrix = self.vectorizer.fit_transform(processed_texts)
-            return tfidf_matrix.toarray()
-        except ValueError:
-            # Handle case where all texts are empty or very similar
-            return np.ones((len(texts), 1))
+        Args:
+            text (str or NoteTokens): Case note text or its tokens
+            
+        Returns:
+            scipy.sparse.csr_matrix: L2-normalised 1 x backend.dimension vector
+        """
+        return self.extract_features([text])
     
-    def calculate_similarity_metrics(self, current_text, previous_texts):
+    def calculate_similarity_metrics(self, current_text, previous_texts,
+                                     current_vector=None, previous_vectors=None):
         """
         Calculate various similarity metrics between current and previous texts
         
+        Texts may be passed as NoteTokens so each note is tokenized only once
+        and the same token stream feeds every metric.
+        
         Args:
-            current_text (str): Current case note text
-            previous_texts (list): List of previous case note texts
+            current_text (str or NoteTokens): Current case note text
+            previous_texts (list): List of previous case note texts (or NoteTokens)
+            current_vector (scipy.sparse matrix): Stored vector for the current note (optional)
+            previous_vectors (list): Stored vectors for the previous notes (optional)
             
         Returns:
             dict: Dictionary containing similarity metrics
         """
-        all_texts = [current_text] + previous_texts
-        features = self.extract_features(all_texts)
-        
-        if features.shape[1] == 1:  # All texts are too similar or empty
-            return {
-                'avg_cosine_similarity': 1.0,
-                'min_cosine_similarity': 1.0,
-                'max_cosine_similarity': 1.0,
-                'std_cosine_similarity': 0.0,
-                'length_ratio': 1.0,
-                'word_count_ratio': 1.0
-            }
+        current_tokens = self.tokenize(current_text)
+        previous_tokens = [self.tokenize(text) for text in previous_texts]
         
-        current_vector = features[0:1]  # First vector is current text
-        previous_vectors = features[1:]  # Rest are previous texts
+        if current_vector is None or not previous_vectors:
+            features = self.extract_features([current_tokens] + previous_tokens)
+            current_vector = features[0]  # First vector is current text
+            previous_vectors = [features[1:]]  # Rest are previous texts
         
-        # Calculate cosine similarities
-        similarities = cosine_similarity(current_vector, previous_vectors)[0]
+        if current_vector.nnz == 0:
+            # No informative terms (empty or stop words only): nothing to compare
+            similarities = np.ones(len(previous_tokens))
+        else:
+            # Vectors are L2-normalised, so cosine similarity is a dot product
+            similarities = (sparse.vstack(previous_vectors) @ current_vector.T).toarray().ravel().astype(np.float64)
         
         # Text length analysis
-        current_length = len(current_text.split())
-        previous_lengths = [len(text.split()) for text in previous_texts]
+        current_length = len(current_tokens)
+        previous_lengths = [len(tokens) for tokens in previous_tokens]
         avg_previous_length = np.mean(previous_lengths) if previous_lengths else 1
         
         # Word count ratio (current vs average previous)
         length_ratio = current_length / max(avg_previous_length, 1)
         
         # Calculate unique word ratio
-        current_words = set(current_text.lower().split())
+        current_words = current_tokens.vocabulary
         previous_words = set()
-        for text in previous_texts:
-            previous_words.update(text.lower().split())
+        for tokens in previous_tokens:
+            previous_words.update(tokens.vocabulary)
         
         if previous_words:
             unique_words_ratio = len(current_words - previous_words) / len(current_words) if current_words else 0
@@ -130,42 +180,59 @@ class NLPAnomalyDetector:
             'unique_words_ratio': unique_words_ratio
         }
     
-    def detect_anomaly(self, current_text, previous_texts):
+    def detect_anomaly(self, current_text, previous_texts,
+                       current_vector=None, previous_vectors=None, cohort_metrics=None):
         """
-        Detect if current text is anomalous compared to previous texts
+        Detect if current text is anomalous compared to previous texts and its cohort
         
         Args:
             current_text (str): Current case note text
             previous_texts (list): List of previous case note texts
+            current_vector (scipy.sparse matrix): Stored vector for the current note (optional)
+            previous_vectors (list): Stored vectors for the previous notes (optional)
+            cohort_metrics (dict): Output of cohort_baseline.cohort_metrics (optional)
             
         Returns:
             tuple: (is_anomaly (bool), anomaly_score (float))
         """
-        if not previous_texts or len(previous_texts) < 2:
+        has_history = bool(previous_texts) and len(previous_texts) >= 2
+        if not has_history and not cohort_metrics:
             return False, 0.0
         
-        # Calculate similarity metrics
-        metrics = self.calculate_similarity_metrics(current_text, previous_texts)
-        
         # Anomaly detection logic
         anomaly_indicators = []
         
-        # 1. Low similarity to previous notes
-        if metrics['avg_cosine_similarity'] < self.anomaly_threshold:
-            anomaly_indicators.append(1.0 - metrics['avg_cosine_similarity'])
-        
-        # 2. Extreme length differences
-        if metrics['length_ratio'] < 0.3 or metrics['length_ratio'] > 3.0:
-            length_anomaly = abs(1.0 - metrics['length_ratio']) / 2.0
-            anomaly_indicators.append(min(length_anomaly, 1.0))
-        
-        # 3. High unique word ratio (very different vocabulary)
-        if metrics['unique_words_ratio'] > 0.7:
-            anomaly_indicators.append(metrics['unique_words_ratio'])
-        
-        # 4. Very low minimum similarity (completely different from at least one previous note)
-        if metrics['min_cosine_similarity'] < 0.1:
-            anomaly_indicators.append(1.0 - metrics['min_cosine_similarity'])
+        if has_history:
+            # Calculate similarity metrics
+            metrics = self.calculate_similarity_metrics(current_text, previous_texts,
+                                                        current_vector, previous_vectors)
+            
+            # 1. Low similarity to previous notes
+            if metrics['avg_cosine_similarity'] < self.anomaly_threshold:
+                anomaly_indicators.append(1.0 - metrics['avg_cosine_similarity'])
+            
+            # 2. Extreme length differences
+            if metrics['length_ratio'] < 0.3 or metrics['length_ratio'] > 3.0:
+                length_anomaly = abs(1.0 - metrics['length_ratio']) / 2.0
+                anomaly_indicators.append(min(length_anomaly, 1.0))
+            
+            # 3. High unique word ratio (very different vocabulary)
+            if metrics['unique_words_ratio'] > 0.7:
+                anomaly_indicators.append(metrics['unique_words_ratio'])
+            
+            # 4. Very low minimum similarity (completely different from at least one previous note)
+            if metrics['min_cosine_similarity'] < 0.1:
+                anomaly_indicators.append(1.0 - metrics['min_cosine_similarity'])
+        
+        if cohort_metrics:
+            # 5. Low similarity to the note type / department centroid
+            if cohort_metrics['cohort_similarity'] < self.cohort_threshold:
+                anomaly_indicators.append(1.0 - cohort_metrics['cohort_similarity'])
+            
+            # 6. Length or vocabulary far outside the cohort distribution
+            for key in ('length_zscore', 'vocabulary_zscore'):
+                if abs(cohort_metrics[key]) > self.cohort_zscore:
+                    anomaly_indicators.append(min(abs(cohort_metrics[key]) / (2 * self.cohort_zscore), 1.0))
         
         # Calculate overall anomaly score
         if anomaly_indicators:
@@ -177,35 +244,49 @@ class NLPAnomalyDetector:
         
         return is_anomaly, round(anomaly_score, 3)
     
-    def analyze_anomaly_reasons(self, current_text, previous_texts):
+    def analyze_anomaly_reasons(self, current_text, previous_texts, cohort_metrics=None):
         """
         Provide detailed analysis of why a text might be considered anomalous
         
         Args:
             current_text (str): Current case note text
             previous_texts (list): List of previous case note texts
+            cohort_metrics (dict): Output of cohort_baseline.cohort_metrics (optional)
             
         Returns:
             dict: Detailed analysis results
         """
-        metrics = self.calculate_similarity_metrics(current_text, previous_texts)
-        is_anomaly, score = self.detect_anomaly(current_text, previous_texts)
+        metrics = self.calculate_similarity_metrics(current_text, previous_texts) if previous_texts else {}
+        is_anomaly, score = self.detect_anomaly(current_text, previous_texts, cohort_metrics=cohort_metrics)
         
         reasons = []
         
-        if metrics['avg_cosine_similarity'] < self.anomaly_threshold:
-            reasons.append(f"Low content similarity ({metrics['avg_cosine_similarity']:.3f})")
-        
-        if metrics['length_ratio'] < 0.3:
-            reasons.append(f"Significantly shorter than usual ({metrics['length_ratio']:.2f}x)")
-        elif metrics['length_ratio'] > 3.0:
-            reasons.append(f"Significantly longer than usual ({metrics['length_ratio']:.2f}x)")
-        
-        if metrics['unique_words_ratio'] > 0.7:
-            reasons.append(f"High unique vocabulary ({metrics['unique_words_ratio']:.3f})")
+        if metrics:
+            if metrics['avg_cosine_similarity'] < self.anomaly_threshold:
+                reasons.append(f"Low content similarity ({metrics['avg_cosine_similarity']:.3f})")
+            
+            if metrics['length_ratio'] < 0.3:
+                reasons.append(f"Significantly shorter than usual ({metrics['length_ratio']:.2f}x)")
+            elif metrics['length_ratio'] > 3.0:
+                reasons.append(f"Significantly longer than usual ({metrics['length_ratio']:.2f}x)")
+            
+            if metrics['unique_words_ratio'] > 0.7:
+                reasons.append(f"High unique vocabulary ({metrics['unique_words_ratio']:.3f})")
+            
+            if metrics['min_cosine_similarity'] < 0.1:
+                reasons.append(f"Very different from at least one previous note ({metrics['min_cosine_similarity']:.3f})")
         
-        if metrics['min_cosine_similarity'] < 0.1:
-            reasons.append(f"Very different from at least one previous note ({metrics['min_cosine_similarity']:.3f})")
+        if cohort_metrics:
+            metrics = dict(metrics, **cohort_metrics)
+            
+            if cohort_metrics['cohort_similarity'] < self.cohort_threshold:
+                reasons.append(f"Unlike other notes of this type/department ({cohort_metrics['cohort_similarity']:.3f})")
+            
+            if abs(cohort_metrics['length_zscore']) > self.cohort_zscore:
+                reasons.append(f"Unusual length for its cohort (z={cohort_metrics['length_zscore']:.1f})")
+            
+            if abs(cohort_metrics['vocabulary_zscore']) > self.cohort_zscore:
+                reasons.append(f"Unusual vocabulary size for its cohort (z={cohort_metrics['vocabulary_zscore']:.1f})")
         
         return {
             'is_anomaly': is_anomaly,
@@ -0,0 +1,447 @@
+"""
+Encrypted local write-ahead spool for note uploads
+
+Saving a note appends its S3 payload to an append-only segment file on local
+disk and returns once the record is fsynced; a background drainer replays the
+records to S3 afterwards. Note capture therefore neither waits on nor fails
+with the object store.
+
+- Records are Fernet tokens (AES-128-CBC + HMAC-SHA256), length-prefixed, so
+  note text never rests on disk in the clear and torn or tampered frames are
+  detected.
+- Concurrent appends share fsyncs (group commit): whichever writer syncs
+  first makes every record written so far durable, and writers that queued
+  behind it usually find their record already synced.
+- Each process appends to its own directory, which it holds an exclusive
+  flock on. Directories whose lock is free belong to exited processes (e.g.
+  recycled gunicorn workers) and are drained by whichever drainer claims them.
+- Drain progress is a checkpoint of (segment, offset) written atomically per
+  batch; records are replayed at least once, so uploads must use idempotent
+  (content-addressed) keys.
+- Records that cannot be decrypted with the configured keys (e.g. after the
+  secret changed) or decoded are moved to a quarantine file in the spool root
+  instead of blocking the records behind them.
+"""
+
+import base64
+import fcntl
+import json
+import os
+import struct
+import threading
+import time
+import uuid
+
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+_FRAME_HEADER = struct.Struct('>I')
+_RECORD_HEADER = struct.Struct('>I')
+
+SEGMENT_SUFFIX = '.seg'
+QUARANTINE_FILE = 'quarantine'
+
+# Outcomes of a drain pass
+DRAINED = 'drained'
+WAITING = 'waiting'  # The handler is waiting on a record that is not ready yet (not a failure)
+FAILED = 'failed'
+
+
+def derive_spool_key(secret):
+    """Derive a Fernet key from the application secret"""
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'note-spool').derive(secret.encode('utf-8'))
+    return base64.urlsafe_b64encode(key)
+
+
+def load_spool_fernet(keys, secret):
+    """
+    Fernet for spool records
+
+    Args:
+        keys (str): Comma-separated Fernet keys; the first encrypts, all decrypt
+            (so a key can be rotated while old records drain). Empty to derive
+            the key from `secret`.
+        secret (str): Application secret used when no keys are configured
+    """
+    keys = [key.strip() for key in (keys or '').split(',') if key.strip()]
+    if not keys:
+        return Fernet(derive_spool_key(secret))
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def _fsync_directory(path):
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def _segment_path(directory, number):
+    return os.path.join(directory, f'{number:08d}{SEGMENT_SUFFIX}')
+
+
+def _segment_numbers(directory):
+    return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                  if name.endswith(SEGMENT_SUFFIX))
+
+
+def _read_checkpoint(directory):
+    try:
+        with open(os.path.join(directory, 'checkpoint')) as f:
+            checkpoint = json.load(f)
+        return checkpoint['segment'], checkpoint['offset']
+    except FileNotFoundError:
+        numbers = _segment_numbers(directory)
+        return (numbers[0] if numbers else 1), 0
+
+
+def _write_checkpoint(directory, segment, offset):
+    path = os.path.join(directory, 'checkpoint')
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'segment': segment, 'offset': offset}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+class SpoolRecord:
+    """One spooled upload: a JSON-serialisable header and the body bytes"""
+
+    __slots__ = ('header', 'body')
+
+    def __init__(self, header, body):
+        self.header = header
+        self.body = body
+
+
+class NoteSpool:
+    """Append-only, fsync-batched, encrypted spool drained to S3 in the background"""
+
+    def __init__(self, directory, fernet, segment_bytes=64 * 1024 * 1024, batch_size=50,
+                 drain_interval=1.0, max_backoff=30.0):
+        """
+        Args:
+            directory (str): Spool root; each process appends to its own subdirectory
+            fernet: Fernet or MultiFernet used for records
+            segment_bytes (int): Segment size after which a new segment file is started
+            batch_size (int): Records handed to the drain handler at a time
+            drain_interval (float): Seconds between drain passes when idle
+            max_backoff (float): Longest wait between retries while the handler fails
+        """
+        self.root = directory
+        self.fernet = fernet
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.drain_interval = drain_interval
+        self.max_backoff = max_backoff
+
+        self._handler = None
+        self._pid = None
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._directory = None
+        self._lock_file = None
+        self._file = None
+        self._segment = 0
+        self._offset = 0
+        self._synced = (0, 0)
+
+        self._stats_lock = threading.Lock()
+        self._appended = 0
+        self._drained = 0
+        self._quarantined = 0
+        self._fsyncs = 0
+        self._last_error = None
+
+    def set_handler(self, handler):
+        """
+        Set what the drainer replays records with
+
+        Args:
+            handler (callable): handler(list of SpoolRecord) -> (stored, waiting),
+                where stored is the number of leading records it has durably
+                stored and waiting is True if it stopped at a record that is not
+                ready yet. Stopping early without waiting is a failure, retried
+                with backoff.
+        """
+        self._handler = handler
+
+    def ensure_started(self):
+        """
+        Open this process's spool directory and start its drainer, once per process
+
+        Opening is deferred to first use because gunicorn forks workers after
+        importing the app, and a child must not share the parent's files,
+        lock or drainer thread.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._write_lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.root, exist_ok=True)
+            name = f'{os.getpid()}-{uuid.uuid4().hex[:12]}'
+            # Locked before it gets its visible name, so no drainer mistakes it for an orphan
+            staging = os.path.join(self.root, '.' + name)
+            os.makedirs(staging)
+            self._lock_file = open(os.path.join(staging, 'lock'), 'w')
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            directory = os.path.join(self.root, name)
+            os.rename(staging, directory)
+            self._directory = directory
+            self._segment, self._offset = 1, 0
+            self._file = open(_segment_path(directory, 1), 'ab')
+            _fsync_directory(directory)
+            _fsync_directory(self.root)
+            self._synced = (1, 0)
+            self._wake = threading.Event()
+            self._pid = os.getpid()
+            if self._handler is not None:
+                threading.Thread(target=self._drain_forever, name='note-spool-drainer', daemon=True).start()
+
+    def append(self, header, body):
+        """
+        Durably spool one upload; returns once the record is on disk
+
+        Args:
+            header (dict): JSON-serialisable upload details
+            body (bytes): Object body
+        """
+        self.ensure_started()
+        encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        token = self.fernet.encrypt(_RECORD_HEADER.pack(len(encoded)) + encoded + body)
+        frame = _FRAME_HEADER.pack(len(token)) + token
+
+        if self._offset >= self.segment_bytes:
+            self._rotate()
+        with self._write_lock:
+            self._file.write(frame)
+            self._offset += len(frame)
+            position = (self._segment, self._offset)
+        self._sync(position)
+
+        with self._stats_lock:
+            self._appended += 1
+
+    def notify(self):
+        """Wake the drainer, e.g. once the transaction a record was spooled for has committed"""
+        self._wake.set()
+
+    def _sync(self, position):
+        with self._sync_lock:
+            if self._synced >= position:
+                return
+            with self._write_lock:
+                self._file.flush()
+                target = (self._segment, self._offset)
+                descriptor = self._file.fileno()
+            os.fsync(descriptor)
+            self._synced = target
+            with self._stats_lock:
+                self._fsyncs += 1
+
+    def _rotate(self):
+        with self._sync_lock, self._write_lock:
+            if self._offset < self.segment_bytes:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = open(_segment_path(self._directory, self._segment + 1), 'ab')
+            _fsync_directory(self._directory)
+            self._segment, self._offset = self._segment + 1, 0
+            self._synced = (self._segment, 0)
+
+    def _decode(self, token):
+        plaintext = self.fernet.decrypt(token)
+        header_length = _RECORD_HEADER.unpack_from(plaintext)[0]
+        header_end = _RECORD_HEADER.size + header_length
+        return SpoolRecord(json.loads(plaintext[_RECORD_HEADER.size:header_end]), plaintext[header_end:])
+
+    def _read_records(self, path, offset, limit):
+        """
+        Decrypt records from offset up to the limit offset (or end of file)
+
+        Returns:
+            list: (end offset, SpoolRecord or None, token) tuples; the record is
+                None when the token could not be read
+        """
+        entries = []
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while len(entries) < self.batch_size:
+                if limit is not None and offset >= limit:
+                    break
+                prefix = f.read(_FRAME_HEADER.size)
+                if len(prefix) < _FRAME_HEADER.size:
+                    break
+                token = f.read(_FRAME_HEADER.unpack(prefix)[0])
+                # A short frame is a write torn by a crash; nothing after it was acknowledged
+                if len(token) < _FRAME_HEADER.unpack(prefix)[0]:
+                    break
+                offset = f.tell()
+                try:
+                    entries.append((offset, self._decode(token), token))
+                except (InvalidToken, ValueError, struct.error):
+                    entries.append((offset, None, token))
+        return entries
+
+    def _quarantine(self, token):
+        """Move an unreadable record aside, framed as in a segment, for an operator to inspect"""
+        with open(os.path.join(self.root, QUARANTINE_FILE), 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(_FRAME_HEADER.pack(len(token)) + token)
+            f.flush()
+            os.fsync(f.fileno())
+        with self._stats_lock:
+            self._quarantined += 1
+
+    def _drain_directory(self, directory, active):
+        """
+        Replay one spool directory's records until it is empty or the handler stops
+
+        Returns:
+            str: DRAINED if everything spooled (and synced) so far was drained,
+                otherwise WAITING or FAILED
+        """
+        segment, offset = _read_checkpoint(directory)
+        for number in _segment_numbers(directory):
+            if number < segment:
+                os.remove(_segment_path(directory, number))
+                continue
+            if number > segment:
+                segment, offset = number, 0
+            path = _segment_path(directory, number)
+
+            while True:
+                limit = None
+                if active:
+                    # Read before the sync position: a segment sealed by then is read to its end
+                    current = self._segment
+                    synced_segment, synced_offset = self._synced
+                    limit = synced_offset if synced_segment == number else None
+                entries = self._read_records(path, offset, limit)
+                if not entries:
+                    break
+                readable = [record for _, record, _ in entries if record is not None]
+                stored, waiting = self._handler(readable) if readable else (0, False)
+
+                # Advance past the stored records and any unreadable ones among them
+                done, consumed = 0, 0
+                for end, record, token in entries:
+                    if record is None:
+                        self._quarantine(token)
+                    elif done == stored:
+                        break
+                    else:
+                        done += 1
+                    offset, consumed = end, consumed + 1
+                if consumed:
+                    _write_checkpoint(directory, segment, offset)
+                    with self._stats_lock:
+                        self._drained += stored
+                if stored < len(readable):
+                    return WAITING if waiting else FAILED
+
+            if active and number >= current:
+                return DRAINED
+            # A finished segment is never appended to again
+            os.remove(path)
+            segment, offset = number + 1, 0
+            _write_checkpoint(directory, segment, offset)
+        return DRAINED
+
+    def _drain_orphans(self):
+        """Claim and drain directories left behind by exited processes"""
+        for name in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, name)
+            if name.startswith('.') or directory == self._directory or not os.path.isdir(directory):
+                continue
+            try:
+                lock_file = open(os.path.join(directory, 'lock'), 'a')
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                continue
+            try:
+                status = self._drain_directory(directory, active=False)
+                if status != DRAINED:
+                    return status
+                for entry in os.listdir(directory):
+                    os.remove(os.path.join(directory, entry))
+                os.rmdir(directory)
+            finally:
+                lock_file.close()
+        return DRAINED
+
+    def _drain_pass(self):
+        self.ensure_started()
+        with self._drain_lock:
+            status = self._drain_directory(self._directory, active=True)
+            if status == FAILED:
+                return status
+            # A record waiting on its transaction does not hold up other processes' leftovers
+            orphans = self._drain_orphans()
+            return orphans if orphans != DRAINED else status
+
+    def drain_once(self):
+        """
+        Replay everything currently spooled by this and exited processes
+
+        Returns:
+            bool: True if nothing was left behind
+        """
+        return self._drain_pass() == DRAINED
+
+    def _drain_forever(self):
+        pid = os.getpid()
+        backoff = self.drain_interval
+        while self._pid == pid:
+            try:
+                status = self._drain_pass()
+                error = None
+            except Exception as e:
+                status, error = FAILED, f'{type(e).__name__}: {e}'
+            with self._stats_lock:
+                self._last_error = error
+
+            if status == FAILED:
+                # New appends do not cut a backoff short while S3 is failing
+                backoff = min(backoff * 2, self.max_backoff)
+                time.sleep(backoff)
+            else:
+                # Waiting on an uncommitted record is normal; notify() after its commit wakes us
+                backoff = self.drain_interval
+                self._wake.wait(self.drain_interval)
+                self._wake.clear()
+
+    def stats(self):
+        """Spool activity for this process and the bytes still waiting on disk"""
+        pending_bytes = 0
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                directory = os.path.join(self.root, name)
+                if name.startswith('.') or not os.path.isdir(directory):
+                    continue
+                try:
+                    segment, offset = _read_checkpoint(directory)
+                    pending_bytes += sum(os.path.getsize(_segment_path(directory, number))
+                                         for number in _segment_numbers(directory) if number >= segment) - offset
+                except (OSError, ValueError):
+                    continue
+        with self._stats_lock:
+            return {
+                'appended': self._appended,
+                'drained': self._drained,
+                'quarantined': self._quarantined,
+                'fsyncs': self._fsyncs,
+                'pending_bytes': pending_bytes,
+                'last_error': self._last_error
+            }
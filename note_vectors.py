@@ -0,0 +1,95 @@
+"""
+Compact storage and similarity lookup for case note vectors
+
+Note vectors are L2-normalised sparse rows, so cosine similarity between two
+notes is a plain sparse dot product. Vectors are persisted as raw float32
+weights plus int32 feature indices. Similarity lookups load one patient's
+vectors straight into a single CSR matrix and rank them in place; nothing is
+held in memory between requests.
+"""
+
+import numpy as np
+from scipy import sparse
+
+
+def encode_vector(vector):
+    """
+    Serialise a sparse row vector into compact byte strings
+
+    Args:
+        vector (scipy.sparse matrix): 1 x n sparse vector
+
+    Returns:
+        tuple: (indices bytes as int32, weights bytes as float32)
+    """
+    row = sparse.csr_matrix(vector, dtype=np.float32)
+    row.sum_duplicates()
+    row.sort_indices()
+    return row.indices.astype(np.int32).tobytes(), row.data.astype(np.float32).tobytes()
+
+
+def decode_vector(indices, weights, dimension):
+    """
+    Rebuild a sparse row vector from its serialised form
+
+    Args:
+        indices (bytes): int32 feature indices
+        weights (bytes): float32 feature weights
+        dimension (int): Size of the feature space
+
+    Returns:
+        scipy.sparse.csr_matrix: 1 x dimension float32 vector
+    """
+    idx = np.frombuffer(indices, dtype=np.int32)
+    data = np.frombuffer(weights, dtype=np.float32)
+    return sparse.csr_matrix((data, idx, np.array([0, len(idx)])), shape=(1, dimension))
+
+
+def stack_vectors(serialised, dimension):
+    """
+    Rebuild many serialised vectors as the rows of one CSR matrix
+
+    Args:
+        serialised (list): (indices bytes, weights bytes) pairs, one per row
+        dimension (int): Size of the feature space
+
+    Returns:
+        scipy.sparse.csr_matrix: len(serialised) x dimension float32 matrix
+    """
+    indices = [np.frombuffer(row_indices, dtype=np.int32) for row_indices, _ in serialised]
+    weights = [np.frombuffer(row_weights, dtype=np.float32) for _, row_weights in serialised]
+    indptr = np.zeros(len(serialised) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in indices], out=indptr[1:])
+    return sparse.csr_matrix((np.concatenate(weights) if weights else np.empty(0, dtype=np.float32),
+                              np.concatenate(indices) if indices else np.empty(0, dtype=np.int32),
+                              indptr), shape=(len(serialised), dimension))
+
+
+def most_similar(vector, matrix, note_ids, limit=5, min_score=0.0):
+    """
+    Rank candidate notes by cosine similarity to a query vector
+
+    Args:
+        vector (scipy.sparse matrix): L2-normalised 1 x dimension query vector
+        matrix (scipy.sparse matrix): Candidate vectors, one row per note
+        note_ids (list): Note ID of each candidate row
+        limit (int): Maximum number of results
+        min_score (float): Minimum cosine similarity to report
+
+    Returns:
+        list: (note_id, similarity) tuples, most similar first
+    """
+    if matrix.shape[0] == 0:
+        return []
+    scores = (matrix @ sparse.csr_matrix(vector, dtype=np.float32).T).toarray().ravel()
+    note_ids = np.asarray(note_ids)
+    keep = scores >= min_score
+    scores, note_ids = scores[keep], note_ids[keep]
+
+    # Partial sort: only the top `limit` candidates are ordered
+    if len(scores) > limit:
+        top = np.argpartition(-scores, limit - 1)[:limit]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return [(int(note_ids[i]), float(scores[i])) for i in top]
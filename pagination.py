@@ -0,0 +1,149 @@
+"""
+Keyset (seek) pagination for SQLAlchemy queries
+
+Instead of OFFSET, each page continues from the sort key of the last row seen,
+so page N costs the same as page 1 and rows do not shift between pages when
+new ones are inserted. Cursors are opaque URL-safe strings holding that key.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_, false
+from sqlalchemy.sql import functions
+
+
+def encode_cursor(values):
+    """Encode sort key values as a URL-safe cursor string"""
+    payload = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """
+    Decode a cursor back into typed sort key values
+
+    Raises:
+        ValueError: If the cursor is malformed or does not match the columns
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        raise ValueError("Cursor does not match the sort order")
+
+    values = []
+    for value, column in zip(payload, columns):
+        python_type = column.type.python_type
+        if value is None:
+            values.append(None)
+        elif python_type is datetime:
+            values.append(datetime.fromisoformat(value))
+        elif python_type is date:
+            values.append(date.fromisoformat(value))
+        else:
+            values.append(python_type(value))
+    return values
+
+
+def _nullable(column):
+    """Whether a sort column can be NULL; COALESCE with a non-NULL fallback cannot"""
+    expression = getattr(column.expression, 'element', column.expression)  # Unwrap column_property labels
+    if isinstance(expression, functions.coalesce):
+        fallback = expression.clauses.clauses[-1]
+        return getattr(fallback, 'value', None) is None and getattr(fallback, 'nullable', True)
+    return getattr(expression, 'nullable', True)
+
+
+def _seek_condition(order, values, forward):
+    """
+    Rows strictly after (forward) or before the cursor position
+
+    NULLs always sort last, so the condition is portable between SQLite
+    and PostgreSQL whatever their default NULL ordering.
+    """
+    clauses = []
+    for position, ((column, descending), value) in enumerate(zip(order, values)):
+        prefix = [c.is_(None) if v is None else c == v for (c, _), v in zip(order[:position], values[:position])]
+        nullable = _nullable(column)
+        if value is None:
+            # After a NULL only more NULLs follow; everything non-NULL comes before
+            step = false() if forward else column.isnot(None)
+        else:
+            beyond = (column < value) if descending == forward else (column > value)
+            step = or_(beyond, column.is_(None)) if forward and nullable else beyond
+        clauses.append(and_(*prefix, step))
+    return or_(*clauses)
+
+
+class KeysetPage:
+    """One page of keyset-paginated results"""
+
+    def __init__(self, items, total, has_prev, has_next, prev_cursor, next_cursor):
+        self.items = items
+        self.total = total
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+
+def keyset_paginate(query, order, after=None, before=None, per_page=10, count=True):
+    """
+    Fetch one page of a query in keyset order
+
+    Args:
+        query: SQLAlchemy ORM query with filters applied but no ORDER BY
+        order (list): (column attribute, descending) pairs; the last must be unique. Columns
+            declared NOT NULL (or COALESCEd to a value) sort without NULLS FIRST/LAST
+        after (str): Cursor to continue forward from
+        before (str): Cursor to page backwards from
+        per_page (int): Rows per page
+        count (bool): Also count all matching rows (one extra query)
+
+    Returns:
+        KeysetPage: Items plus cursors for the neighbouring pages
+    """
+    columns = [column for column, _ in order]
+    total = query.order_by(None).count() if count else None
+
+    forward = not before
+    cursor = after if forward else before
+    values = None
+    if cursor:
+        try:
+            values = decode_cursor(cursor, columns)
+        except ValueError:
+            forward, values = True, None
+
+    page_query = query
+    if values is not None:
+        page_query = page_query.filter(_seek_condition(order, values, forward))
+
+    # NULLS FIRST/LAST only where NULLs can occur, so NOT NULL keys match a plain index
+    ordering = []
+    for column, descending in order:
+        term = column.desc() if descending == forward else column.asc()
+        if _nullable(column):
+            term = term.nullslast() if forward else term.nullsfirst()
+        ordering.append(term)
+    rows = page_query.order_by(*ordering).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def key(row):
+        return encode_cursor([getattr(row, c.key) for c in columns])
+
+    has_prev = more if not forward else values is not None
+    has_next = more if forward else True
+    return KeysetPage(
+        rows, total, has_prev, has_next,
+        key(rows[0]) if rows and has_prev else None,
+        key(rows[-1]) if rows and has_next else None
+    )
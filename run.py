@@ -5,10 +5,8 @@ Entry point for running the application
 """
 
 import os
-from app import app, db
+from app import app, db, s3_gateway
 from dummy_data import create_dummy_staff, create_dummy_patients, create_dummy_case_notes
-import boto3
-from botocore.exceptions import ClientError
 
 def create_app():
     """Create and configure the Flask application."""
@@ -17,22 +15,16 @@ def create_app():
     with app.app_context():
         db.create_all()
         
-        # Check if we need to create dummy data
+        # Seed the small demo data set on an empty database only when asked (SEED_DEMO_DATA=true)
         from app import Staff
-        if Staff.query.count() == 0:
+        seed = os.environ.get('SEED_DEMO_DATA', 'False').lower() in ['true', '1', 'yes']
+        if seed and Staff.query.count() == 0:
             print("Creating dummy data...")
             try:
-                # Initialize S3 client for dummy data creation
-                s3_client = boto3.client(
-                    's3',
-                    aws_access_key_id=app.config.get('AWS_ACCESS_KEY_ID'),
-                    aws_secret_access_key=app.config.get('AWS_SECRET_ACCESS_KEY'),
-                    region_name=app.config.get('AWS_REGION', 'us-east-1')
-                )
-                
+                # Dummy notes are uploaded through the app's shared S3 access layer
                 create_dummy_staff(db)
                 create_dummy_patients(db)
-                create_dummy_case_notes(db, s3_client, app.config.get('AWS_S3_BUCKET'))
+                create_dummy_case_notes(db, s3_gateway, app.config.get('AWS_S3_BUCKET'))
                 print("Dummy data created successfully!")
                 
             except Exception as e:
@@ -0,0 +1,489 @@
+"""
+S3 access layer and streaming transfers for case note bodies and attachments
+
+Uploads go through boto3's managed transfer (multipart above a threshold,
+parts sent concurrently) from file-like objects, and downloads are relayed
+chunk by chunk, so memory per request stays bounded by the chunk and part
+sizes rather than by the object size.
+
+All application S3 traffic goes through one S3Gateway, which owns a single
+thread-safe client with a sized connection pool, adaptive retries and
+timeouts, bounds concurrent operations with a semaphore (streamed downloads
+hold their slot until the stream closes), trips a circuit breaker when S3
+keeps failing or answering slowly, and records per-operation latency.
+"""
+
+import gzip
+import io
+import re
+import threading
+import time
+from collections import deque
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import BotoCoreError, ClientError
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+# Objects above the threshold are uploaded as concurrent multipart uploads
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+TRANSFER_CONCURRENCY = 4
+
+# Size of chunks relayed from S3 to the client
+STREAM_CHUNK_SIZE = 64 * 1024
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNKSIZE,
+    max_concurrency=TRANSFER_CONCURRENCY,
+    use_threads=True
+)
+
+# Compression codecs for text notes at rest; the codec is recorded in file_type
+COMPRESSION_CODECS = ('none', 'gzip', 'zstd')
+
+_RANGE_PATTERN = re.compile(r'^bytes=\d*-\d*$')
+
+# Error codes that indicate S3 itself is unhealthy rather than a bad request
+_UNHEALTHY_ERROR_CODES = {'SlowDown', 'Throttling', 'ThrottlingException', 'RequestTimeout',
+                          'ServiceUnavailable', 'InternalError'}
+
+# Latency samples kept per operation for percentile reporting
+LATENCY_SAMPLES = 1024
+
+
+def compressed_file_type(base_type, codec):
+    """file_type value for a body stored with the given codec, e.g. text/plain+gzip"""
+    return base_type if codec == 'none' else f'{base_type}+{codec}'
+
+
+def storage_codec(file_type):
+    """Codec recorded in a file_type value ('none' when uncompressed)"""
+    if file_type and '+' in file_type:
+        return file_type.rsplit('+', 1)[1]
+    return 'none'
+
+
+def compress_body(data, codec):
+    """
+    Compress a note body for storage
+
+    Args:
+        data (bytes): Encoded note body
+        codec (str): One of COMPRESSION_CODECS; zstd falls back to gzip if unavailable
+
+    Returns:
+        tuple: (compressed bytes, codec actually used)
+    """
+    if codec == 'zstd' and zstandard is None:
+        codec = 'gzip'
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=6), codec
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data), codec
+    return data, 'none'
+
+
+def decompressing_reader(body, codec):
+    """Wrap a streaming body so reads return decompressed bytes"""
+    if codec == 'gzip':
+        return gzip.GzipFile(fileobj=body, mode='rb')
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed notes")
+        return zstandard.ZstdDecompressor().stream_reader(body)
+    return body
+
+
+def upload_fileobj(s3_client, fileobj, bucket, key, content_type, metadata=None, content_encoding=None):
+    """
+    Upload a file-like object using multipart transfers for large bodies
+
+    Args:
+        s3_client: boto3 S3 client
+        fileobj: Readable binary file-like object
+        bucket (str): Target bucket
+        key (str): Object key
+        content_type (str): MIME type stored on the object
+        metadata (dict): User metadata (string values)
+        content_encoding (str): Content-Encoding stored on the object (optional)
+    """
+    extra_args = {
+        'ContentType': content_type,
+        'Metadata': metadata or {},
+        'ServerSideEncryption': 'AES256',
+        'StorageClass': 'STANDARD'
+    }
+    if content_encoding:
+        extra_args['ContentEncoding'] = content_encoding
+
+    s3_client.upload_fileobj(fileobj, bucket, key, ExtraArgs=extra_args, Config=TRANSFER_CONFIG)
+
+
+def upload_bytes(s3_client, data, bucket, key, content_type, metadata=None, content_encoding=None):
+    """Upload an in-memory body (e.g. a text note) through the same transfer path"""
+    upload_fileobj(s3_client, io.BytesIO(data), bucket, key, content_type, metadata, content_encoding)
+
+
+def delete_object(s3_client, bucket, key):
+    """Delete an object (e.g. an upload whose database row was never committed)"""
+    s3_client.delete_object(Bucket=bucket, Key=key)
+
+
+def read_text(s3_client, bucket, key, codec='none'):
+    """
+    Read a text note body, decompressing as it streams
+
+    Returns:
+        dict: content, metadata, last_modified and content_length (stored size)
+    """
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    reader = decompressing_reader(response['Body'], codec)
+    content = io.TextIOWrapper(reader, encoding='utf-8').read()
+    return {
+        'content': content,
+        'metadata': response.get('Metadata', {}),
+        'last_modified': response.get('LastModified'),
+        'content_length': response.get('ContentLength')
+    }
+
+
+def open_stream(s3_client, bucket, key, range_header=None, codec='none', chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Open an object for relaying to an HTTP client without buffering it
+
+    Byte ranges are passed through to S3 for uncompressed objects. Compressed
+    bodies are decompressed on the fly and always sent whole.
+
+    Args:
+        s3_client: boto3 S3 client
+        bucket (str): Bucket name
+        key (str): Object key
+        range_header (str): Incoming HTTP Range header (optional)
+        codec (str): Storage codec of the object
+        chunk_size (int): Size of relayed chunks
+
+    Returns:
+        tuple: (chunk iterator, HTTP status, response headers dict)
+    """
+    params = {'Bucket': bucket, 'Key': key}
+    ranged = codec == 'none' and range_header and _RANGE_PATTERN.match(range_header)
+    if ranged:
+        params['Range'] = range_header
+
+    response = s3_client.get_object(**params)
+    body = response['Body']
+    headers = {'Accept-Ranges': 'bytes' if codec == 'none' else 'none'}
+
+    if codec == 'none':
+        headers['Content-Length'] = str(response['ContentLength'])
+        if response.get('ContentRange'):
+            headers['Content-Range'] = response['ContentRange']
+        status = 206 if ranged and response.get('ContentRange') else 200
+        chunks = body.iter_chunks(chunk_size=chunk_size)
+    else:
+        status = 200
+        reader = decompressing_reader(body, codec)
+        chunks = iter(lambda: reader.read(chunk_size), b'')
+
+    return ObjectStream(chunks, body), status, headers
+
+
+class ObjectStream:
+    """
+    Chunk iterator over an S3 body that closes the body when exhausted, failed or closed
+
+    Unlike a generator it closes the body even if it is closed before the first
+    chunk is read, so the pooled connection is always given back. on_close, if
+    set, is called once with the exception that ended the stream (or None).
+    """
+
+    def __init__(self, chunks, body):
+        self._chunks = chunks
+        self._body = body
+        self.on_close = None
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            self.close()
+            raise
+        except Exception as e:
+            self.close(e)
+            raise
+
+    def close(self, error=None):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._body.close()
+        finally:
+            if self.on_close is not None:
+                self.on_close(error)
+
+
+class S3UnavailableError(Exception):
+    """S3 is not accepting work: the circuit is open or no concurrency slot was free in time"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker with a single half-open trial call
+
+    Calls slower than slow_call_threshold count as failures, so an S3 that
+    answers but too slowly to be useful opens the circuit as well.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, slow_call_threshold=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """Whether a call may proceed now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def cancel_trial(self):
+        """Give back a half-open trial that never reached S3"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_call(self, latency):
+        """Record a successful call, counting it as a failure if it was too slow"""
+        if self.slow_call_threshold is not None and latency >= self.slow_call_threshold:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class OperationMetrics:
+    """Call counts and a rolling latency window for one S3 operation"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, latency, error=False):
+        with self._lock:
+            self.calls += 1
+            self.errors += int(error)
+            self.latencies.append(latency)
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self.latencies)
+            calls, errors, rejected = self.calls, self.errors, self.rejected
+
+        def percentile(fraction):
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000, 2)
+
+        return {
+            'calls': calls,
+            'errors': errors,
+            'rejected': rejected,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(samples[-1] * 1000, 2) if samples else None
+        }
+
+
+def _is_unhealthy(error):
+    """Whether an exception indicates S3 trouble (as opposed to e.g. a missing key)"""
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return code in _UNHEALTHY_ERROR_CODES or status >= 500
+    return isinstance(error, BotoCoreError)
+
+
+class S3Gateway:
+    """Shared, bounded and instrumented access to S3"""
+
+    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None, region_name='us-east-1',
+                 endpoint_url=None, max_concurrency=16, acquire_timeout=2.0, connect_timeout=3, read_timeout=10,
+                 max_attempts=3, failure_threshold=5, reset_timeout=30.0, slow_call_threshold=5.0):
+        """
+        Args:
+            endpoint_url (str): S3-compatible endpoint (e.g. a local MinIO); None for AWS
+            max_concurrency (int): Concurrent S3 operations allowed; match to worker threads
+            acquire_timeout (float): Seconds to wait for a concurrency slot before giving up
+            connect_timeout (int): Socket connect timeout in seconds
+            read_timeout (int): Socket read timeout in seconds
+            max_attempts (int): Total attempts per call under the adaptive retry mode
+            failure_threshold (int): Consecutive S3 failures that open the circuit
+            reset_timeout (float): Seconds the circuit stays open before a trial call
+            slow_call_threshold (float): Seconds after which a successful call still counts as
+                a failure (None to disable); attachment uploads are exempt
+        """
+        self.acquire_timeout = acquire_timeout
+        self.client = boto3.client(
+            's3',
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key,
+            region_name=region_name,
+            endpoint_url=endpoint_url,
+            config=BotoConfig(
+                # Room for every request thread plus the multipart transfer threads
+                max_pool_connections=max_concurrency + TRANSFER_CONCURRENCY,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+                retries={'mode': 'adaptive', 'max_attempts': max_attempts}
+            )
+        )
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, slow_call_threshold)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+
+    def _operation_metrics(self, operation):
+        with self._metrics_lock:
+            if operation not in self._metrics:
+                self._metrics[operation] = OperationMetrics()
+            return self._metrics[operation]
+
+    def _acquire(self, operation):
+        """
+        Take a concurrency slot for one call, returning the operation's metrics
+
+        Raises:
+            S3UnavailableError: If the circuit is open or no slot frees up in time
+        """
+        metrics = self._operation_metrics(operation)
+        if not self.breaker.allow():
+            metrics.reject()
+            raise S3UnavailableError(f"S3 circuit open; skipping {operation}")
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            metrics.reject()
+            self.breaker.cancel_trial()
+            raise S3UnavailableError(f"S3 concurrency limit reached; skipping {operation}")
+        return metrics
+
+    def _release(self, metrics, latency, error=None, check_latency=True):
+        """Record a finished call against its metrics and the circuit, and give back its slot"""
+        try:
+            metrics.record(latency, error=error is not None)
+            if error is not None and _is_unhealthy(error):
+                self.breaker.record_failure()
+            elif error is None and check_latency:
+                self.breaker.record_call(latency)
+            else:
+                # A bad request or a size-bound upload says nothing about S3's speed
+                self.breaker.record_success()
+        finally:
+            self._slots.release()
+
+    def run(self, operation, func, *args, check_latency=True, **kwargs):
+        """
+        Run an S3 call under the concurrency limit and circuit breaker
+
+        Args:
+            check_latency (bool): Whether a slow but successful call counts against the circuit
+
+        Raises:
+            S3UnavailableError: If the circuit is open or no slot frees up in time
+        """
+        metrics = self._acquire(operation)
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._release(metrics, time.perf_counter() - started, e, check_latency)
+            raise
+        self._release(metrics, time.perf_counter() - started, check_latency=check_latency)
+        return result
+
+    def upload_fileobj(self, fileobj, bucket, key, content_type, metadata=None, content_encoding=None):
+        # Attachment uploads take as long as the file is large, so only failures count against S3
+        return self.run('upload', upload_fileobj, self.client, fileobj, bucket, key,
+                        content_type, metadata, content_encoding, check_latency=False)
+
+    def upload_bytes(self, data, bucket, key, content_type, metadata=None, content_encoding=None):
+        return self.run('upload', upload_bytes, self.client, data, bucket, key,
+                        content_type, metadata, content_encoding)
+
+    def read_text(self, bucket, key, codec='none'):
+        return self.run('read', read_text, self.client, bucket, key, codec)
+
+    def delete_object(self, bucket, key):
+        return self.run('delete', delete_object, self.client, bucket, key)
+
+    def open_stream(self, bucket, key, range_header=None, codec='none'):
+        """
+        Open an object for relaying; the call keeps its slot until the stream is closed
+
+        The recorded latency is the time to the response headers, which is also what
+        the slow-call threshold applies to. Errors raised while the body is relayed
+        are recorded when the stream closes, like errors from get_object itself.
+        """
+        metrics = self._acquire('stream')
+        started = time.perf_counter()
+        try:
+            stream, status, headers = open_stream(self.client, bucket, key, range_header, codec)
+        except Exception as e:
+            self._release(metrics, time.perf_counter() - started, e)
+            raise
+        latency = time.perf_counter() - started
+        stream.on_close = lambda error: self._release(metrics, latency, error)
+        return stream, status, headers
+
+    def metrics(self):
+        """Per-operation call counts and latency percentiles, plus circuit state"""
+        with self._metrics_lock:
+            operations = {name: m.snapshot() for name, m in self._metrics.items()}
+        return {'circuit': self.breaker.state, 'operations': operations}
@@ -0,0 +1,45 @@
+import os
+import sys
+import tempfile
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# app.py reads its configuration at import time; keep tests off the real database, bucket and spool
+_WORKDIR = tempfile.mkdtemp(prefix='hospitalapp-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_WORKDIR, 'test.db')
+os.environ['AWS_S3_BUCKET'] = 'test-bucket'
+os.environ['NOTE_SPOOL_DIR'] = os.path.join(_WORKDIR, 'note_spool')
+os.environ['SEED_DEMO_DATA'] = 'False'
+
+import pytest  # noqa: E402
+
+import app as hospital  # noqa: E402
+from app import db, Patient, Staff  # noqa: E402
+
+
+@pytest.fixture
+def database():
+    """Fresh tables in an app context holding one staff member and one patient (both id 1)"""
+    hospital.app.jinja_env.fragment_cache.clear()
+    hospital.nlp_detector._token_cache.clear()  # Keyed by note_id, which each test reuses
+    with hospital.app.app_context():
+        db.create_all()
+        staff = Staff(username='nurse', email='nurse@example.org', first_name='A', last_name='B',
+                      job_title='Nurse', department='Ward 1')
+        staff.set_password('password')
+        db.session.add_all([staff, Patient(first_name='P', last_name='Q', date_of_birth=date(1980, 1, 1),
+                                           medical_record_number='MRN-1')])
+        db.session.commit()
+        yield staff
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(database):
+    """Test client logged in as the database fixture's staff member"""
+    client = hospital.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(database.staff_id)
+    return client
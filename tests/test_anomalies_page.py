@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from app import db, CaseNote
+
+
+@pytest.fixture
+def flagged_notes(database):
+    for number in range(3):
+        db.session.add(CaseNote(patient_id=1, staff_id=1, note_type='Progress', title=f'Note {number}',
+                                content='agitated on the ward', created_at=datetime(2025, 3, 1, 9 + number),
+                                is_flagged=True, anomaly_score=0.5 + number / 10))
+    db.session.commit()
+
+
+def note_queries(client):
+    """The page and the statements it ran that read case notes with their patients"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        page = client.get('/anomalies').get_data(as_text=True)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return page, [statement for statement in statements if 'JOIN patients' in statement]
+
+
+def test_cached_rows_are_not_loaded_again(client, flagged_notes):
+    first, first_joins = note_queries(client)
+    second, second_joins = note_queries(client)
+
+    assert first_joins and not second_joins
+    for number in range(3):
+        assert first.count(f'Note {number}') == second.count(f'Note {number}') == 1
+
+
+def test_edited_note_is_reloaded(client, flagged_notes):
+    note_queries(client)
+    note = db.session.get(CaseNote, 2)
+    note.title = 'Edited'
+    db.session.commit()
+
+    page, joins = note_queries(client)
+    assert len(joins) == 1
+    assert 'Edited' in page and 'Note 0' in page
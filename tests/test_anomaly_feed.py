@@ -0,0 +1,55 @@
+import json
+
+from anomaly_feed import AnomalyFeed
+
+
+class EventTable:
+    """Committed anomaly events, queried like fetch_anomaly_events"""
+
+    def __init__(self):
+        self.committed = {}
+
+    def fetch_after(self, event_id, limit):
+        return [(key, {'note_id': key}) for key in sorted(self.committed) if key > event_id][:limit]
+
+
+def sent_events(messages):
+    """(SSE id, note id) pairs for the anomaly events among the messages"""
+    events = []
+    for message in messages:
+        if 'event: anomaly' in message:
+            lines = dict(line.split(': ', 1) for line in message.strip().splitlines())
+            events.append((int(lines['id']), json.loads(lines['data'])['note_id']))
+    return events
+
+
+def test_late_commit_below_the_cursor_is_still_sent():
+    table = EventTable()
+    feed = AnomalyFeed(poll_interval=0, max_stream_seconds=60, lookback=10)
+    stream = feed.stream(table.fetch_after, last_event_id=0)
+    next(stream)  # ready
+
+    # Event 2 commits first; event 1's transaction commits after the stream has moved past it
+    table.committed[2] = True
+    assert sent_events([next(stream)]) == [(2, 2)]
+    table.committed[1] = True
+    table.committed[3] = True
+    assert sent_events([next(stream), next(stream)]) == [(2, 1), (3, 3)]
+
+    # Nothing is sent twice
+    table.committed[4] = True
+    assert sent_events([next(stream)]) == [(4, 4)]
+
+
+def test_full_window_does_not_starve_new_events():
+    table = EventTable()
+    table.committed.update({key: True for key in range(1, 21)})
+    feed = AnomalyFeed(poll_interval=0, max_stream_seconds=60, batch_size=5, lookback=10)
+    stream = feed.stream(table.fetch_after, last_event_id=20)
+    next(stream)  # ready
+
+    # The window behind the resume point is replayed once, then new events follow
+    replayed = sent_events([next(stream) for _ in range(10)])
+    assert [note_id for _, note_id in replayed] == list(range(11, 21))
+    table.committed.update({key: True for key in range(21, 31)})
+    assert [note_id for _, note_id in sent_events([next(stream) for _ in range(10)])] == list(range(21, 31))
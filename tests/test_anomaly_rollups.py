@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, select
+
+import anomaly_rollups
+from anomaly_rollups import apply_deltas, bucket_count, bucket_range, rollup_deltas
+from app import AnomalyRollup
+
+CREATED = datetime(2025, 3, 4, 10, 30)
+
+
+@pytest.fixture(params=['native', 'generic'])
+def connection(request, monkeypatch):
+    if request.param == 'generic':
+        # Exercise the UPDATE-then-INSERT path used on MySQL and other databases
+        monkeypatch.setattr(anomaly_rollups, '_UPSERT_INSERTS', {})
+    engine = create_engine('sqlite://')
+    AnomalyRollup.__table__.create(engine)
+    with engine.begin() as connection:
+        yield connection
+
+
+def rollup_rows(connection):
+    table = AnomalyRollup.__table__
+    return {(row.granularity, row.dimension, row.severity): (row.scored_count, row.flagged_count, row.score_sum)
+            for row in connection.execute(select(table))}
+
+
+def test_deltas_create_and_then_add_to_rows(connection):
+    table = AnomalyRollup.__table__
+    apply_deltas(connection, table, rollup_deltas(CREATED, 'Progress', 'Ward 1', 7, 0.8, True))
+    apply_deltas(connection, table, rollup_deltas(CREATED, 'Progress', 'Ward 1', 7, 0.9, True))
+
+    rows = rollup_rows(connection)
+    assert len(rows) == 8  # Two granularities by four dimensions, one severity band
+    scored, flagged, score_sum = rows[('hour', 'all', 'high')]
+    assert (scored, flagged) == (2, 2)
+    assert score_sum == pytest.approx(1.7)
+
+
+def test_rescoring_moves_a_note_between_bands(connection):
+    table = AnomalyRollup.__table__
+    apply_deltas(connection, table, rollup_deltas(CREATED, 'Progress', 'Ward 1', 7, 0.8, True))
+    apply_deltas(connection, table, rollup_deltas(CREATED, 'Progress', 'Ward 1', 7, 0.2, False)
+                 + rollup_deltas(CREATED, 'Progress', 'Ward 1', 7, 0.8, True, sign=-1))
+
+    rows = rollup_rows(connection)
+    assert rows[('day', 'all', 'high')][:2] == (0, 0)
+    assert rows[('day', 'all', 'low')][:2] == (1, 0)
+
+
+def test_bucket_count_matches_bucket_range():
+    start, end = datetime(2025, 3, 1, 10, 45), datetime(2025, 3, 3, 9, 0)
+    for granularity in ('hour', 'day'):
+        assert bucket_count(start, end, granularity) == len(bucket_range(start, end, granularity))
+    assert bucket_count(end, start, 'hour') == 0
+
+
+def test_generic_upsert_retries_when_a_concurrent_insert_wins(connection, monkeypatch):
+    table = AnomalyRollup.__table__
+    deltas = rollup_deltas(CREATED, 'Progress', 'Ward 1', 7, 0.8, True)
+    apply_deltas(connection, table, deltas)
+
+    # Every first UPDATE misses, as if the row appeared between the UPDATE and the INSERT
+    update_row = anomaly_rollups._update_row
+    missed = set()
+
+    def racing_update(connection, table, delta):
+        key = tuple(delta[column] for column in anomaly_rollups.ROLLUP_KEY)
+        if key not in missed:
+            missed.add(key)
+            return False
+        return update_row(connection, table, delta)
+
+    monkeypatch.setattr(anomaly_rollups, '_UPSERT_INSERTS', {})
+    monkeypatch.setattr(anomaly_rollups, '_update_row', racing_update)
+    apply_deltas(connection, table, deltas)
+
+    assert rollup_rows(connection)[('day', 'staff', 'high')][:2] == (2, 2)
@@ -0,0 +1,47 @@
+import io
+
+import pytest
+
+import app as hospital
+from app import db, NoteAttachment
+
+
+@pytest.fixture
+def s3_objects(monkeypatch):
+    objects, deleted = {}, []
+    monkeypatch.setattr(hospital.s3_gateway, 'upload_fileobj',
+                        lambda fileobj, bucket, key, content_type, metadata=None:
+                        objects.__setitem__(key, content_type))
+    monkeypatch.setattr(hospital.s3_gateway, 'delete_object', lambda bucket, key: deleted.append(objects.pop(key)))
+    monkeypatch.setattr(hospital.note_spool, 'append', lambda header, body: None)
+    return objects, deleted
+
+
+def post_note(client, filename, mimetype):
+    return client.post('/add_case_note', content_type='multipart/form-data', data={
+        'patient_id': '1', 'note_type': 'Progress', 'title': 'Note', 'content': 'settled overnight',
+        'attachment': (io.BytesIO(b'<script>alert(1)</script>'), filename, mimetype)
+    })
+
+
+def test_attachment_type_comes_from_its_extension(client, s3_objects):
+    objects, _ = s3_objects
+    assert post_note(client, 'letter.txt', 'text/html').status_code == 302
+
+    attachment = NoteAttachment.query.one()
+    assert attachment.file_type == 'text/plain'
+    assert list(objects.values()) == ['text/plain']
+
+
+def test_uploaded_attachment_is_deleted_when_the_note_is_not_saved(client, s3_objects, monkeypatch):
+    objects, deleted = s3_objects
+
+    def failing_commit():
+        raise RuntimeError('database went away')
+
+    monkeypatch.setattr(db.session, 'commit', failing_commit)
+    assert post_note(client, 'letter.pdf', 'application/pdf').status_code == 500
+
+    assert objects == {}
+    assert deleted == ['application/pdf']
+    assert NoteAttachment.query.count() == 0
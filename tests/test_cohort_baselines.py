@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import app as hospital
+from app import db, CaseNote, CohortBaseline, Staff
+from cohort_baseline import text_statistics
+from note_vectors import decode_vector
+
+CONTENTS = [
+    'patient settled overnight and slept well',
+    'agitated on the ward, refused evening medication and shouted at staff',
+    'family visit went well, discussed discharge plans with the team',
+    'reviewed housing application with social worker',
+    'calm morning, attended group session and ate breakfast',
+    'complained of headache, paracetamol given, reviewed by doctor',
+    'refused medication again, escalated to the consultant',
+]
+
+
+@pytest.fixture
+def add_notes(database):
+    doctor = Staff(username='doctor', email='doctor@example.org', first_name='C', last_name='D',
+                   job_title='Doctor', department='Ward 2')
+    doctor.set_password('password')
+    db.session.add(doctor)
+    db.session.commit()
+
+    def add_notes(contents):
+        for number, content in enumerate(contents):
+            db.session.add(CaseNote(patient_id=1, staff_id=1 + number % 2,
+                                    note_type=('Progress', 'Assessment')[number % 3 == 0],
+                                    title='Note', content=content, created_at=datetime(2025, 3, 1, 9, number)))
+        db.session.commit()
+    return add_notes
+
+
+def baseline_state():
+    rows = CohortBaseline.query.filter_by(model_version=hospital.nlp_detector.model_version).all()
+    return {
+        (row.cohort_type, row.cohort_key): (
+            row.note_count, row.length_mean, row.length_m2, row.vocabulary_mean, row.vocabulary_m2,
+            decode_vector(row.centroid_indices, row.centroid_weights, row.dimension).toarray()
+        ) for row in rows
+    }
+
+
+def test_incremental_folds_match_a_rebuild(add_notes):
+    add_notes(CONTENTS[:4])
+    assert hospital.fold_cohort_baselines(batch_size=3) == 4
+    add_notes(CONTENTS[4:])
+    hospital.score_case_notes([note.note_id for note in CaseNote.query.all()])
+    assert hospital.fold_cohort_baselines(batch_size=3) == 3
+    assert hospital.fold_cohort_baselines() == 0  # Nothing is folded twice
+    incremental = baseline_state()
+
+    result = hospital.app.test_cli_runner().invoke(args=['rebuild-cohort-baselines'])
+    assert result.exit_code == 0, result.output
+    rebuilt = baseline_state()
+
+    assert incremental.keys() == rebuilt.keys() == {
+        ('note_type', 'Progress'), ('note_type', 'Assessment'), ('department', 'Ward 1'), ('department', 'Ward 2')
+    }
+    for key, expected in rebuilt.items():
+        for value, rebuilt_value in zip(incremental[key], expected):
+            np.testing.assert_allclose(value, rebuilt_value, rtol=1e-6)
+
+
+def test_welford_moments_match_the_notes(add_notes):
+    add_notes(CONTENTS)
+    hospital.fold_cohort_baselines(batch_size=2)
+
+    baseline = CohortBaseline.query.filter_by(cohort_type='department', cohort_key='Ward 1').one()
+    statistics = np.array([text_statistics(hospital.nlp_detector.tokenize(content)) for content in CONTENTS[::2]])
+    assert baseline.note_count == len(statistics)
+    np.testing.assert_allclose([baseline.length_mean, baseline.vocabulary_mean], statistics.mean(axis=0))
+    np.testing.assert_allclose([baseline.length_m2, baseline.vocabulary_m2],
+                               statistics.var(axis=0) * len(statistics))
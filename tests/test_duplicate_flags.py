@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+
+import app as hospital
+from app import db, CaseNote
+
+
+@pytest.fixture
+def copied_note(database):
+    original = CaseNote(patient_id=1, staff_id=1, note_type='Progress', title='Original',
+                        content='settled overnight', created_at=datetime(2025, 3, 1, 9))
+    db.session.add(original)
+    db.session.flush()
+    db.session.add(CaseNote(patient_id=1, staff_id=1, note_type='Progress', title='Pasted',
+                            content='settled overnight', created_at=datetime(2025, 3, 2, 9),
+                            is_flagged=True, anomaly_score=0.8,
+                            duplicate_of_note_id=original.note_id, duplicate_kind='exact'))
+    db.session.commit()
+
+
+@pytest.mark.parametrize('url', ['/dashboard', '/case_notes', '/client_notes/1', '/anomalies', '/view_note/2'])
+def test_copied_note_is_flagged_in_note_views(client, copied_note, url):
+    page = client.get(url).get_data(as_text=True)
+    assert 'fa-copy me-1"></i>Copy' in page
+
+
+def test_original_note_is_not_flagged(client, copied_note):
+    page = client.get('/view_note/1').get_data(as_text=True)
+    assert 'fa-copy me-1"></i>Copy' not in page
+
+
+@pytest.fixture
+def scored_history(database, monkeypatch):
+    contents = [
+        'Patient settled overnight, slept well and took evening medication without any concerns raised by staff.',
+        'Attended the morning group session, engaged with peers and discussed plans for weekend leave with family.',
+        'Patient became agitated after a phone call from family, refused lunch and was supported by staff in a '
+        'quiet room. Observations were increased to every fifteen minutes and the duty doctor reviewed medication. '
+        'By the evening the patient had calmed, ate a small meal and spoke with the named nurse about the call.',
+    ]
+    notes = [CaseNote(patient_id=1, staff_id=1, note_type='Progress', title=f'Note {number}', content=content,
+                      created_at=datetime(2025, 3, 1 + number, 9)) for number, content in enumerate(contents)]
+    db.session.add_all(notes)
+    db.session.commit()
+    hospital.score_case_notes([note.note_id for note in notes])
+
+    detected = []
+    detect_anomaly = hospital.nlp_detector.detect_anomaly
+    monkeypatch.setattr(hospital.nlp_detector, 'detect_anomaly',
+                        lambda *args, **kwargs: detected.append(args) or detect_anomaly(*args, **kwargs))
+    return notes, detected
+
+
+def add_copy(content):
+    note = CaseNote(patient_id=1, staff_id=1, note_type='Progress', title='Copy', content=content,
+                    created_at=datetime(2025, 3, 10, 9))
+    db.session.add(note)
+    db.session.commit()
+    hospital.score_case_notes([note.note_id])
+    return db.session.get(CaseNote, note.note_id)
+
+
+def test_exact_copies_inherit_the_original_score(scored_history):
+    notes, detected = scored_history
+    copy = add_copy(notes[2].content)
+
+    assert (copy.duplicate_of_note_id, copy.duplicate_kind) == (notes[2].note_id, 'exact')
+    assert (copy.is_flagged, copy.anomaly_score) == (notes[2].is_flagged, notes[2].anomaly_score)
+    assert detected == []
+
+
+def test_near_copies_are_scored_in_full(scored_history):
+    notes, detected = scored_history
+    copy = add_copy(notes[2].content.replace('fifteen', 'thirty'))
+
+    assert (copy.duplicate_of_note_id, copy.duplicate_kind) == (notes[2].note_id, 'near')
+    assert len(detected) == 1 and copy.anomaly_score is not None
@@ -0,0 +1,50 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from nlp_backends import HashingBackend, TfidfBackend, analyze_tokens, load_backend
+
+NOTES = [
+    'patient settled overnight and slept well'.split(),
+    'patient agitated on the ward and refused medication'.split(),
+    'slept well after medication was reviewed'.split(),
+    'family visited and the patient was settled'.split(),
+    'refused medication again and was agitated overnight'.split(),
+]
+
+
+def test_transform_matches_the_fitted_vectorizer():
+    backend = TfidfBackend.fit(NOTES, 'test', min_df=1)
+    reference = TfidfVectorizer(analyzer=analyze_tokens, min_df=1, max_df=0.95).fit(NOTES)
+
+    assert backend.dimension == len(reference.vocabulary_)
+    assert abs(backend.transform(NOTES) - reference.transform(NOTES)).max() < 1e-6
+    # Stop words and unseen terms add nothing
+    assert backend.transform([['the', 'and', 'unseen']]).nnz == 0
+
+
+def test_saved_model_is_memory_mapped(tmp_path):
+    backend = TfidfBackend.fit(NOTES, 'test', min_df=1)
+    backend.save(str(tmp_path))
+
+    loaded = load_backend('tfidf', str(tmp_path))
+    assert isinstance(loaded.term_hashes, np.memmap)
+    assert isinstance(loaded.idf, np.memmap)
+    assert abs(loaded.transform(NOTES) - backend.transform(NOTES)).max() == 0
+
+
+def test_model_fitted_with_another_analyzer_is_refused(tmp_path):
+    TfidfBackend.fit(NOTES, 'test', min_df=1).save(str(tmp_path))
+    manifest_path = os.path.join(tmp_path, 'test', 'manifest.json')
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    del manifest['analyzer']
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+    with pytest.raises(ValueError):
+        TfidfBackend.load(str(tmp_path))
+    assert isinstance(load_backend('tfidf', str(tmp_path)), HashingBackend)
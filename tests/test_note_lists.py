@@ -0,0 +1,50 @@
+import re
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from app import db, CaseNote
+
+# A full content column in a SELECT list; previews read it through substr()
+FULL_CONTENT = re.compile(r'(?<!substr\()case_notes(_\d+)?\.content\b')
+
+
+@pytest.fixture
+def notes(database):
+    for number in range(3):
+        db.session.add(CaseNote(patient_id=1, staff_id=1, note_type='Progress', title=f'Note {number}',
+                                content='long note body ' * 500, created_at=datetime(2025, 3, 1 + number, 9),
+                                is_flagged=True, anomaly_score=0.9))
+    db.session.commit()
+
+
+@pytest.fixture
+def statements():
+    captured = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        captured.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    yield captured
+    event.remove(db.engine, 'before_cursor_execute', capture)
+
+
+@pytest.mark.parametrize('url', ['/dashboard', '/case_notes', '/anomalies', '/client_notes/1'])
+def test_list_pages_leave_note_bodies_unloaded(client, notes, statements, url):
+    page = client.get(url)
+    assert page.status_code == 200 and 'Note 2' in page.get_data(as_text=True)
+
+    note_queries = [statement for statement in statements if 'FROM case_notes' in statement]
+    assert note_queries
+    assert not [statement for statement in note_queries if FULL_CONTENT.search(statement)]
+
+
+@pytest.mark.parametrize('url', ['/dashboard', '/case_notes'])
+def test_staff_note_lists_read_only_the_index_columns(client, notes, statements, url):
+    client.get(url)
+    listing = [statement for statement in statements if 'FROM case_notes' in statement]
+    assert listing
+    for statement in listing:
+        assert 'case_notes.s3_bucket' not in statement and 'case_notes.content_sha256' not in statement
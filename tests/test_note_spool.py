@@ -0,0 +1,228 @@
+import os
+import threading
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+from note_spool import DRAINED, FAILED, QUARANTINE_FILE, WAITING, NoteSpool, SEGMENT_SUFFIX, _FRAME_HEADER
+
+
+class Recorder:
+    """Drain handler that stores everything, or waits/fails on demand"""
+
+    def __init__(self):
+        self.records = []
+        self.mode = 'store'
+
+    def __call__(self, records):
+        if self.mode == 'wait':
+            return 0, True
+        if self.mode == 'fail':
+            raise ConnectionError('S3 is down')
+        self.records.extend(records)
+        return len(records), False
+
+    @property
+    def bodies(self):
+        return [record.body for record in self.records]
+
+
+def make_spool(root, handler=None, fernet=None, **kwargs):
+    spool = NoteSpool(str(root), fernet or Fernet(Fernet.generate_key()), **kwargs)
+    spool.set_handler(handler or Recorder())
+    # Drain synchronously; tests that want the background drainer start it themselves
+    spool._drain_forever = lambda: None
+    return spool
+
+
+def exit_process(spool):
+    """Release a spool's directory lock as if its process had exited"""
+    spool._file.close()
+    spool._lock_file.close()
+
+
+def segment_files(spool):
+    return sorted(name for name in os.listdir(spool._directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+def test_records_drain_in_order(tmp_path):
+    handler = Recorder()
+    spool = make_spool(tmp_path, handler)
+    for number in range(5):
+        spool.append({'note_id': number}, f'body {number}'.encode())
+
+    assert spool.drain_once()
+    assert [record.header['note_id'] for record in handler.records] == list(range(5))
+    assert handler.bodies == [f'body {number}'.encode() for number in range(5)]
+    assert spool.stats()['drained'] == 5
+    assert spool.stats()['pending_bytes'] == 0
+
+    # Drained records are not replayed
+    assert spool.drain_once()
+    assert len(handler.records) == 5
+
+
+def test_note_text_is_not_stored_in_the_clear(tmp_path):
+    spool = make_spool(tmp_path)
+    spool.append({'note_id': 1}, b'patient reports chest pain')
+
+    with open(os.path.join(spool._directory, segment_files(spool)[0]), 'rb') as f:
+        assert b'chest pain' not in f.read()
+
+
+def test_concurrent_appends_share_fsyncs(tmp_path):
+    handler = Recorder()
+    spool = make_spool(tmp_path, handler)
+
+    def write(worker):
+        for number in range(50):
+            spool.append({'note_id': worker * 100 + number}, b'x' * 200)
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert spool.stats()['appended'] == 400
+    assert spool.stats()['fsyncs'] <= 400
+    assert spool.drain_once()
+    assert sorted(record.header['note_id'] for record in handler.records) == \
+        sorted(worker * 100 + number for worker in range(8) for number in range(50))
+
+
+def test_segments_rotate_and_are_removed_once_drained(tmp_path):
+    handler = Recorder()
+    spool = make_spool(tmp_path, handler, segment_bytes=1024, batch_size=3)
+    for number in range(20):
+        spool.append({'note_id': number}, b'y' * 300)
+    assert len(segment_files(spool)) > 1
+
+    assert spool.drain_once()
+    assert [record.header['note_id'] for record in handler.records] == list(range(20))
+    assert segment_files(spool) == [f'{spool._segment:08d}{SEGMENT_SUFFIX}']
+
+
+def test_failed_handler_keeps_records_for_retry(tmp_path):
+    handler = Recorder()
+    spool = make_spool(tmp_path, handler)
+    spool.append({'note_id': 1}, b'one')
+
+    handler.mode = 'fail'
+    with pytest.raises(ConnectionError):
+        spool.drain_once()
+    assert spool.stats()['pending_bytes'] > 0
+
+    handler.mode = 'store'
+    assert spool.drain_once()
+    assert handler.bodies == [b'one']
+
+
+def test_record_waiting_on_its_commit_is_not_a_failure(tmp_path):
+    handler = Recorder()
+    spool = make_spool(tmp_path, handler)
+    spool.append({'note_id': 1}, b'one')
+
+    handler.mode = 'wait'
+    assert spool._drain_pass() == WAITING
+    assert not spool.drain_once()
+
+    handler.mode = 'store'
+    assert spool._drain_pass() == DRAINED
+
+
+def test_short_handler_without_waiting_is_a_failure(tmp_path):
+    spool = make_spool(tmp_path, lambda records: (0, False))
+    spool.append({'note_id': 1}, b'one')
+
+    assert spool._drain_pass() == FAILED
+
+
+def test_drainer_is_woken_by_notify_after_waiting(tmp_path):
+    committed = threading.Event()
+    stored = []
+
+    def handler(records):
+        if not committed.is_set():
+            return 0, True
+        stored.extend(records)
+        return len(records), False
+
+    # Long interval and backoff: only notify() can make the drainer retry within the test
+    spool = NoteSpool(str(tmp_path), Fernet(Fernet.generate_key()), drain_interval=30, max_backoff=60)
+    spool.set_handler(handler)
+    spool.append({'note_id': 1}, b'one')
+    time.sleep(0.2)  # The drainer finds the record but its note is not committed yet
+
+    committed.set()
+    spool.notify()
+    deadline = time.monotonic() + 5
+    while not stored and time.monotonic() < deadline:
+        time.sleep(0.01)
+    spool._pid = None  # Stops the drainer loop
+
+    assert [record.body for record in stored] == [b'one']
+
+
+def test_unreadable_records_are_quarantined(tmp_path):
+    old_key, new_key = Fernet.generate_key(), Fernet.generate_key()
+    old = make_spool(tmp_path, fernet=Fernet(old_key))
+    old.append({'note_id': 1}, b'written with the old key')
+    old.fernet = Fernet(new_key)
+    old.append({'note_id': 2}, b'written with the new key')
+    exit_process(old)
+
+    handler = Recorder()
+    new = make_spool(tmp_path, handler, fernet=Fernet(new_key))
+    assert new.drain_once()
+
+    assert handler.bodies == [b'written with the new key']
+    assert new.stats()['quarantined'] == 1
+    assert not os.path.exists(old._directory)
+
+    # The quarantined frame is intact and readable with the old key
+    with open(tmp_path / QUARANTINE_FILE, 'rb') as f:
+        data = f.read()
+    length = _FRAME_HEADER.unpack_from(data)[0]
+    assert b'written with the old key' in Fernet(old_key).decrypt(data[_FRAME_HEADER.size:_FRAME_HEADER.size + length])
+
+
+def test_exited_process_directory_is_drained_and_removed(tmp_path):
+    exited = make_spool(tmp_path)
+    exited.append({'note_id': 1}, b'left behind')
+    exit_process(exited)
+
+    handler = Recorder()
+    survivor = make_spool(tmp_path, handler, fernet=exited.fernet)
+    assert survivor.drain_once()
+
+    assert handler.bodies == [b'left behind']
+    assert not os.path.exists(exited._directory)
+
+
+def test_directory_of_running_process_is_not_claimed(tmp_path):
+    running = make_spool(tmp_path)
+    running.append({'note_id': 1}, b'still being written')
+
+    handler = Recorder()
+    other = make_spool(tmp_path, handler, fernet=running.fernet)
+    assert other.drain_once()
+
+    assert handler.records == []
+    assert os.path.exists(running._directory)
+
+
+def test_torn_final_record_is_ignored(tmp_path):
+    crashed = make_spool(tmp_path)
+    crashed.append({'note_id': 1}, b'complete')
+    crashed.append({'note_id': 2}, b'torn by a crash')
+    exit_process(crashed)
+    path = os.path.join(crashed._directory, segment_files(crashed)[0])
+    os.truncate(path, os.path.getsize(path) - 10)
+
+    handler = Recorder()
+    survivor = make_spool(tmp_path, handler, fernet=crashed.fernet)
+    assert survivor.drain_once()
+
+    assert handler.bodies == [b'complete']
@@ -0,0 +1,97 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import event
+
+from app import db, Patient, PATIENT_SORTS
+from pagination import decode_cursor, encode_cursor, keyset_paginate
+
+# Repeated sort keys and missing admission dates, so pages break inside runs of equal keys
+ADMISSIONS = [datetime(2025, 3, 1, 9), None, datetime(2025, 3, 1, 9), datetime(2025, 1, 5), None,
+              datetime(2025, 3, 1, 9), datetime(2024, 12, 31), None, datetime(2025, 1, 5)]
+BIRTHS = [date(1970, 5, 1), date(1985, 2, 2), date(1970, 5, 1), date(1999, 9, 9), date(1985, 2, 2),
+          date(1970, 5, 1), date(1960, 1, 1), date(1999, 9, 9), date(1985, 2, 2)]
+
+
+@pytest.fixture
+def patients(database):
+    for number, (admitted, born) in enumerate(zip(ADMISSIONS, BIRTHS), start=2):
+        db.session.add(Patient(first_name='P', last_name='Q', date_of_birth=born, admission_date=admitted,
+                               medical_record_number=f'MRN-{number}'))
+    db.session.commit()
+    return Patient.query.all()
+
+
+def expected_order(patients, sort_by):
+    if sort_by == 'admission':
+        # Newest admission first, patients never admitted last; ties newest patient first
+        return sorted(patients, key=lambda p: (p.admission_date or datetime.min, p.patient_id), reverse=True)
+    return sorted(patients, key=lambda p: (p.date_of_birth, p.patient_id), reverse=True)
+
+
+@pytest.mark.parametrize('sort_by', ['admission', 'age'])
+@pytest.mark.parametrize('per_page', [1, 2, 3, 4])
+def test_pages_cover_every_row_forwards_and_backwards(patients, sort_by, per_page):
+    order = PATIENT_SORTS[sort_by]
+    expected = [p.patient_id for p in expected_order(patients, sort_by)]
+
+    pages, cursor = [], None
+    while True:
+        page = keyset_paginate(Patient.query, order, after=cursor, per_page=per_page)
+        pages.append([p.patient_id for p in page.items])
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+    assert [patient_id for items in pages for patient_id in items] == expected
+    assert page.total == len(expected)
+
+    # Back from the last page, each previous page is the one seen going forward
+    for items in reversed(pages[:-1]):
+        page = keyset_paginate(Patient.query, order, before=page.prev_cursor, per_page=per_page)
+        assert [p.patient_id for p in page.items] == items
+    assert not page.has_prev
+
+
+@pytest.mark.parametrize('sort_by', ['admission', 'age'])
+def test_sorted_pages_read_the_sort_index(patients, sort_by):
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if 'ORDER BY' in statement:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        first = keyset_paginate(Patient.query, PATIENT_SORTS[sort_by], per_page=3, count=False)
+        keyset_paginate(Patient.query, PATIENT_SORTS[sort_by], after=first.next_cursor, per_page=3, count=False)
+        keyset_paginate(Patient.query, PATIENT_SORTS[sort_by], before=first.next_cursor, per_page=3, count=False)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    assert len(statements) == 3
+    for statement, parameters in statements:
+        assert 'NULLS' not in statement
+        # The ORDER BY is read from the composite index rather than sorted
+        plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, tuple(parameters))
+        details = [row[-1] for row in plan]
+        assert any('ix_patients_' in detail for detail in details), details
+        assert not any('TEMP B-TREE' in detail for detail in details), details
+
+
+def test_cursors_round_trip_typed_values():
+    columns = [Patient.admission_date, Patient.date_of_birth, Patient.patient_id]
+    values = [datetime(2025, 3, 1, 9, 30), date(1970, 5, 1), 42]
+    assert decode_cursor(encode_cursor(values), columns) == values
+    assert decode_cursor(encode_cursor([None, date(1970, 5, 1), 7]), columns) == [None, date(1970, 5, 1), 7]
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', encode_cursor([1]), encode_cursor({'a': 1}), '%%'])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, [Patient.date_of_birth, Patient.patient_id])
+
+
+def test_malformed_cursor_restarts_from_the_first_page(patients):
+    first = keyset_paginate(Patient.query, PATIENT_SORTS['age'], per_page=3)
+    page = keyset_paginate(Patient.query, PATIENT_SORTS['age'], after='garbage', per_page=3)
+    assert page.items == first.items and not page.has_prev
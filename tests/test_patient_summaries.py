@@ -0,0 +1,82 @@
+from datetime import date, datetime
+
+import pytest
+
+from app import db, CaseNote, Patient, Staff, patient_summary_values
+
+SUMMARY_COLUMNS = ('note_count', 'flagged_count', 'last_note_at', 'last_note_staff_id', 'max_anomaly_score')
+
+
+def stored_summary(patient_id):
+    patients = Patient.__table__
+    row = db.session.execute(db.select(*(patients.c[name] for name in SUMMARY_COLUMNS))
+                             .where(patients.c.patient_id == patient_id)).one()
+    return dict(zip(SUMMARY_COLUMNS, row))
+
+
+def recomputed_summary(patient_id):
+    patients = Patient.__table__
+    values = patient_summary_values()
+    row = db.session.execute(db.select(*(values[name].label(name) for name in SUMMARY_COLUMNS))
+                             .select_from(patients).where(patients.c.patient_id == patient_id)).one()
+    return dict(zip(SUMMARY_COLUMNS, row))
+
+
+def assert_summaries_current():
+    for patient_id in (1, 2):
+        assert stored_summary(patient_id) == recomputed_summary(patient_id)
+
+
+@pytest.fixture
+def notes(database):
+    doctor = Staff(username='doctor', email='doctor@example.org', first_name='C', last_name='D',
+                   job_title='Doctor', department='Ward 2')
+    doctor.set_password('password')
+    db.session.add_all([doctor, Patient(first_name='R', last_name='S', date_of_birth=date(1990, 1, 1),
+                                        medical_record_number='MRN-2')])
+    db.session.commit()
+
+    # Saved out of order: the second note is the latest one
+    created = [
+        CaseNote(patient_id=1, staff_id=1, note_type='Progress', title='Morning', content='settled',
+                 created_at=datetime(2025, 3, 2, 9)),
+        CaseNote(patient_id=1, staff_id=2, note_type='Progress', title='Evening', content='agitated',
+                 created_at=datetime(2025, 3, 2, 21), is_flagged=True, anomaly_score=0.8),
+        CaseNote(patient_id=1, staff_id=1, note_type='Progress', title='Night', content='slept',
+                 created_at=datetime(2025, 3, 1, 23), anomaly_score=0.2),
+    ]
+    for note in created:
+        db.session.add(note)
+        db.session.commit()
+    return created
+
+
+def test_inserted_notes_are_folded_into_the_summary(notes):
+    assert stored_summary(1) == {'note_count': 3, 'flagged_count': 1, 'last_note_at': datetime(2025, 3, 2, 21),
+                                 'last_note_staff_id': 2, 'max_anomaly_score': 0.8}
+    assert stored_summary(2)['note_count'] == 0
+    assert_summaries_current()
+
+
+@pytest.mark.parametrize('changes', [
+    {'is_flagged': True},
+    {'is_flagged': False, 'anomaly_score': 0.1},  # Lowers the patient's maximum
+    {'anomaly_score': 0.9},
+    {'anomaly_score': None},
+    {'created_at': datetime(2025, 3, 1)},  # No longer the latest note
+    {'staff_id': 1},
+    {'patient_id': 2},
+])
+def test_updated_notes_keep_the_summary_current(notes, changes):
+    for key, value in changes.items():
+        setattr(notes[1], key, value)
+    db.session.commit()
+    assert_summaries_current()
+
+
+def test_deleted_notes_are_removed_from_the_summary(notes):
+    db.session.delete(notes[1])
+    db.session.commit()
+    assert stored_summary(1) == {'note_count': 2, 'flagged_count': 0, 'last_note_at': datetime(2025, 3, 2, 9),
+                                 'last_note_staff_id': 1, 'max_anomaly_score': 0.2}
+    assert_summaries_current()
@@ -0,0 +1,75 @@
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+import app as hospital
+from app import db, CaseNote, NoteVector, Patient
+from note_vectors import decode_vector, encode_vector, most_similar, stack_vectors
+
+
+@pytest.fixture
+def notes(database):
+    db.session.add(Patient(first_name='R', last_name='S', date_of_birth=date(1990, 1, 1),
+                           medical_record_number='MRN-2'))
+    contents = [
+        (1, 'patient agitated on the ward and refused medication'),
+        (1, 'agitated again overnight and refused evening medication'),
+        (1, 'family visit went well, discussed discharge plans'),
+        (1, 'reviewed housing application with social worker'),
+        (2, 'patient agitated on the ward and refused medication'),
+    ]
+    created = []
+    for number, (patient_id, content) in enumerate(contents):
+        note = CaseNote(patient_id=patient_id, staff_id=1, note_type='Progress', title=f'Note {number}',
+                        content=content, created_at=datetime(2025, 3, 1 + number, 9))
+        db.session.add(note)
+        created.append(note)
+    db.session.commit()
+    return created
+
+
+def test_related_notes_are_ranked_within_the_patient(notes):
+    hospital.get_note_vectors(notes)
+    db.session.commit()
+
+    related = hospital.find_related_notes(notes[0])
+
+    # The closest note comes first; the other patient's identical note and unrelated notes are left out
+    assert related[0] == notes[1]
+    assert notes[0] not in related and notes[4] not in related
+    assert notes[3] not in related
+
+
+def test_vectors_recomputed_for_older_notes_are_used(notes):
+    hospital.get_note_vectors(notes)
+    db.session.commit()
+    # As after a backend switch: older vectors belong to another model version until recomputed
+    NoteVector.query.filter(NoteVector.note_id != notes[0].note_id).update({'model_version': 'retired'})
+    db.session.commit()
+    assert hospital.find_related_notes(notes[0]) == []  # No current vectors and no earlier notes
+
+    hospital.get_note_vectors(notes)
+    db.session.commit()
+    assert hospital.find_related_notes(notes[0])[0] == notes[1]
+
+
+def test_notes_without_vectors_fall_back_to_the_most_recent(notes):
+    related = hospital.find_related_notes(notes[3])
+    assert related == [notes[2], notes[1], notes[0]]
+
+
+def test_stacked_vectors_match_decoded_rows():
+    rng = np.random.default_rng(7)
+    rows = [sparse.random(1, 50, density=density, format='csr', dtype=np.float32, random_state=rng)
+            for density in (0.1, 0.0, 0.3)]
+    serialised = [encode_vector(row) for row in rows]
+
+    stacked = stack_vectors(serialised, 50)
+    expected = sparse.vstack([decode_vector(indices, weights, 50) for indices, weights in serialised])
+    assert (stacked != expected).nnz == 0
+
+    query = rows[2]
+    matches = most_similar(query, stacked, [10, 11, 12], limit=2, min_score=0.01)
+    assert matches[0][0] == 12 and 11 not in [note_id for note_id, _ in matches]
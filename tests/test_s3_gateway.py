@@ -0,0 +1,84 @@
+import pytest
+from botocore.exceptions import ReadTimeoutError
+
+from s3_storage import S3Gateway, S3UnavailableError
+
+
+class Body:
+    """Streaming body that yields chunks, optionally failing part way through"""
+
+    def __init__(self, chunks, fail_after=None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.closed = False
+
+    def iter_chunks(self, chunk_size):
+        for number, chunk in enumerate(self.chunks):
+            if number == self.fail_after:
+                raise ReadTimeoutError(endpoint_url='https://s3.example.org')
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class Client:
+    def __init__(self, body):
+        self.body = body
+
+    def get_object(self, **params):
+        return {'Body': self.body, 'ContentLength': sum(len(chunk) for chunk in self.body.chunks)}
+
+
+def make_gateway(body, **kwargs):
+    gateway = S3Gateway(aws_access_key_id='test', aws_secret_access_key='test',
+                        max_concurrency=1, acquire_timeout=0, **kwargs)
+    gateway.client = Client(body)
+    return gateway
+
+
+def test_stream_holds_its_slot_until_closed():
+    body = Body([b'a', b'b'])
+    gateway = make_gateway(body)
+    stream, status, headers = gateway.open_stream('bucket', 'key')
+    assert status == 200
+
+    with pytest.raises(S3UnavailableError):
+        gateway.open_stream('bucket', 'key')
+
+    # Closing before reading anything still closes the body and frees the slot
+    stream.close()
+    assert body.closed
+    stream, _, _ = gateway.open_stream('bucket', 'key')
+    assert list(stream) == [b'a', b'b']
+    assert gateway.metrics()['operations']['stream']['calls'] == 2
+
+
+def test_error_while_relaying_is_recorded_and_trips_the_breaker():
+    gateway = make_gateway(Body([b'a', b'b'], fail_after=1), failure_threshold=1)
+    stream, _, _ = gateway.open_stream('bucket', 'key')
+
+    assert next(stream) == b'a'
+    with pytest.raises(ReadTimeoutError):
+        next(stream)
+
+    assert gateway.metrics()['operations']['stream']['errors'] == 1
+    assert gateway.breaker.state == 'open'
+
+
+def test_slow_calls_trip_the_breaker():
+    gateway = make_gateway(Body([]), failure_threshold=2, slow_call_threshold=0)
+    gateway.run('read', lambda: None)
+    gateway.run('read', lambda: None)
+
+    assert gateway.breaker.state == 'open'
+    with pytest.raises(S3UnavailableError):
+        gateway.run('read', lambda: None)
+
+
+def test_attachment_uploads_are_not_judged_on_latency():
+    gateway = make_gateway(Body([]), failure_threshold=1, slow_call_threshold=0)
+    gateway.client.upload_fileobj = lambda *args, **kwargs: None
+    gateway.upload_fileobj(None, 'bucket', 'key', 'application/pdf')
+
+    assert gateway.breaker.state == 'closed'
@@ -0,0 +1,57 @@
+from datetime import date, datetime
+
+import pytest
+
+import app as hospital
+from app import db, CaseNote, Patient
+
+
+@pytest.fixture
+def notes(database):
+    db.session.add(Patient(first_name='R', last_name='S', date_of_birth=date(1990, 1, 1),
+                           medical_record_number='MRN-2'))
+    # Patient 1 has a long history with a tie on created_at, saved out of order; patient 2 has two notes
+    written = [
+        (1, datetime(2025, 3, 3, 9)), (1, datetime(2025, 3, 1, 9)), (2, datetime(2025, 3, 2, 9)),
+        (1, datetime(2025, 3, 2, 9)), (1, datetime(2025, 3, 2, 9)), (1, datetime(2025, 3, 5, 9)),
+        (2, datetime(2025, 3, 1, 9)), (1, datetime(2025, 3, 4, 9)),
+    ]
+    for number, (patient_id, created_at) in enumerate(written):
+        db.session.add(CaseNote(patient_id=patient_id, staff_id=1, note_type='Progress', title=f'Note {number}',
+                                content=f'note {number} for patient {patient_id}', created_at=created_at))
+    db.session.commit()
+    return CaseNote.query.order_by(CaseNote.note_id).all()
+
+
+def per_note_history(note, history_size):
+    """The patient's notes written before this one, newest first, one query per note"""
+    return CaseNote.query.filter(
+        CaseNote.patient_id == note.patient_id,
+        db.or_(CaseNote.created_at < note.created_at,
+               db.and_(CaseNote.created_at == note.created_at, CaseNote.note_id < note.note_id))
+    ).order_by(CaseNote.created_at.desc(), CaseNote.note_id.desc()).limit(history_size).all()
+
+
+@pytest.mark.parametrize('history_size', [1, 3, 10])
+def test_batched_histories_match_per_note_queries(notes, history_size):
+    histories = hospital.load_scoring_histories(notes, history_size)
+
+    assert histories.keys() == {note.note_id for note in notes}
+    for note in notes:
+        expected = per_note_history(note, history_size)
+        assert [row.note_id for row in histories[note.note_id]] == [other.note_id for other in expected]
+        assert [row.content for row in histories[note.note_id]] == [other.content for other in expected]
+
+
+def test_short_histories_are_returned_whole(notes):
+    histories = hospital.load_scoring_histories(notes, 3)
+
+    # Patient 2's later note has a single earlier note; each patient's first note has none
+    assert [row.note_id for row in histories[notes[2].note_id]] == [notes[6].note_id]
+    assert histories[notes[6].note_id] == [] and histories[notes[1].note_id] == []
+    assert len(histories[notes[5].note_id]) == 3
+
+
+def test_batch_subsets_see_notes_outside_the_batch(notes):
+    histories = hospital.load_scoring_histories([notes[0]], 2)
+    assert [row.note_id for row in histories[notes[0].note_id]] == [notes[4].note_id, notes[3].note_id]
@@ -0,0 +1,54 @@
+import pytest
+
+import app as hospital
+from app import db, CaseNote
+from note_spool import SpoolRecord
+
+
+@pytest.fixture
+def uploads(database, monkeypatch):
+    stored = {}
+    monkeypatch.setattr(hospital.s3_gateway, 'upload_bytes',
+                        lambda body, bucket, key, **kwargs: stored.__setitem__(key, body))
+    # Capture what would be spooled instead of writing it to disk
+    spooled = []
+    monkeypatch.setattr(hospital.note_spool, 'append', lambda header, body: spooled.append(SpoolRecord(header, body)))
+    return stored, spooled
+
+
+def flush_note(content):
+    note = CaseNote(patient_id=1, staff_id=1, note_type='Progress', title='Note', content=content)
+    db.session.add(note)
+    db.session.flush()
+    hospital.spool_case_note_upload(note)
+    return note
+
+
+def test_rolled_back_note_does_not_claim_reused_id(uploads):
+    stored, spooled = uploads
+    rolled_back_id = flush_note('rolled back note').note_id
+    db.session.rollback()
+    note = flush_note('committed note')
+    db.session.commit()
+    assert note.note_id == rolled_back_id
+
+    # The rolled-back note's record is dropped rather than stored against the reused id
+    assert hospital.store_spooled_notes(spooled[:1]) == (1, False)
+    db.session.expire_all()
+    assert db.session.get(CaseNote, note.note_id).s3_file_key is None
+    assert stored == {}
+
+    assert hospital.store_spooled_notes(spooled[1:]) == (1, False)
+    db.session.expire_all()
+    note = db.session.get(CaseNote, note.note_id)
+    assert stored[note.s3_file_key] == b'committed note'
+    assert note.content_sha256 in note.s3_file_key
+
+
+def test_uncommitted_note_is_waited_for(uploads):
+    stored, spooled = uploads
+    flush_note('not committed yet')
+
+    # The drainer uses its own session, which cannot see the flushed row
+    assert hospital.store_spooled_notes(spooled) == (0, True)
+    assert stored == {}
@@ -0,0 +1,74 @@
+import pytest
+
+import app as hospital
+from app import db, CaseNote, Patient
+from content_hash import content_sha256
+
+# Tables as created by the first release, before summary, fingerprint and scoring columns
+LEGACY_SCHEMA = [
+    """CREATE TABLE staff (
+        staff_id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, email VARCHAR(120) NOT NULL UNIQUE,
+        password_hash VARCHAR(255) NOT NULL, first_name VARCHAR(50) NOT NULL, last_name VARCHAR(50) NOT NULL,
+        job_title VARCHAR(100) NOT NULL, department VARCHAR(100), created_at DATETIME, is_active BOOLEAN)""",
+    """CREATE TABLE patients (
+        patient_id INTEGER PRIMARY KEY, first_name VARCHAR(50) NOT NULL, last_name VARCHAR(50) NOT NULL,
+        date_of_birth DATE NOT NULL, medical_record_number VARCHAR(20) NOT NULL UNIQUE, admission_date DATETIME,
+        discharge_date DATETIME, status VARCHAR(20), created_at DATETIME)""",
+    """CREATE TABLE case_notes (
+        note_id INTEGER PRIMARY KEY, patient_id INTEGER NOT NULL REFERENCES patients (patient_id),
+        staff_id INTEGER NOT NULL REFERENCES staff (staff_id), note_type VARCHAR(50) NOT NULL,
+        title VARCHAR(200) NOT NULL, content TEXT NOT NULL, s3_file_key VARCHAR(500), s3_bucket VARCHAR(100),
+        file_size INTEGER, file_type VARCHAR(50), created_at DATETIME, updated_at DATETIME, is_flagged BOOLEAN,
+        anomaly_score FLOAT)""",
+    "INSERT INTO staff VALUES (1, 'nurse', 'nurse@example.org', 'x', 'A', 'B', 'Nurse', 'Ward 1', NULL, 1)",
+    "INSERT INTO patients VALUES (1, 'P', 'Q', '1980-01-01', 'MRN-1', NULL, NULL, 'Active', NULL)",
+    """INSERT INTO case_notes VALUES
+        (1, 1, 1, 'Progress', 'First', 'settled overnight', NULL, NULL, NULL, NULL,
+         '2025-03-01 09:00:00', '2025-03-01 09:00:00', 0, 0.2),
+        (2, 1, 1, 'Progress', 'Second', 'agitated on the ward', NULL, NULL, NULL, NULL,
+         '2025-03-02 09:00:00', '2025-03-02 09:00:00', 1, 0.9)""",
+]
+
+
+@pytest.fixture
+def legacy_database():
+    with hospital.app.app_context():
+        db.drop_all()
+        for statement in LEGACY_SCHEMA:
+            db.session.execute(db.text(statement))
+        db.session.commit()
+        yield
+        db.session.remove()
+        db.drop_all()
+
+
+def test_upgrade_adds_columns_and_repairs_summaries(legacy_database):
+    result = hospital.app.test_cli_runner().invoke(args=['upgrade-schema'])
+    assert result.exit_code == 0, result.output
+
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns('case_notes')}
+    assert {'content_sha256', 'content_simhash', 'duplicate_of_note_id', 'anomaly_model_version'} <= columns
+    indexes = {index['name'] for index in db.inspect(db.engine).get_indexes('case_notes')}
+    assert 'ix_case_notes_staff_created' in indexes
+    # Expression indexes are not reflected on SQLite, so check what the command reports
+    assert 'ix_patients_admission_sort' in result.output and 'ix_patients_birth_sort' in result.output
+
+    patient = db.session.get(Patient, 1)
+    assert (patient.note_count, patient.flagged_count, patient.last_note_staff_id) == (2, 1, 1)
+    assert patient.max_anomaly_score == pytest.approx(0.9)
+    assert db.session.get(CaseNote, 1).content_sha256 == content_sha256('settled overnight')
+
+    # Re-running finds nothing left to add
+    result = hospital.app.test_cli_runner().invoke(args=['upgrade-schema'])
+    assert 'Added 0 columns and indexes' in result.output
+
+
+def test_out_of_date_include_columns_are_detected():
+    index = next(index for index in CaseNote.__table__.indexes if index.name == 'ix_case_notes_staff_created')
+    current = list(index.dialect_options['postgresql']['include'])
+
+    # As reflected from PostgreSQL
+    assert not hospital.include_columns_changed(index, {'dialect_options': {'postgresql_include': current[::-1]}})
+    stale = [column for column in current if column != 'duplicate_kind']
+    assert hospital.include_columns_changed(index, {'dialect_options': {'postgresql_include': stale}})
+    assert hospital.include_columns_changed(index, {'include_columns': []})
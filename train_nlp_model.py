@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Fit the TF-IDF anomaly detection model offline
+Reads every stored case note, fits a vocabulary and IDF weights, and saves them
+under NLP_MODEL_PATH. Restart workers to use it (NLP_BACKEND defaults to tfidf).
+"""
+
+import argparse
+from datetime import datetime
+
+from app import app, db, CaseNote, nlp_detector
+from nlp_backends import TfidfBackend
+
+
+def iter_note_tokens(batch_size=1000):
+    """Yield tokenized note contents in primary-key order without loading whole rows"""
+    last_note_id = 0
+    while True:
+        rows = db.session.query(CaseNote.note_id, CaseNote.content)\
+                         .filter(CaseNote.note_id > last_note_id)\
+                         .order_by(CaseNote.note_id).limit(batch_size).all()
+        if not rows:
+            break
+        for row in rows:
+            yield nlp_detector.tokenize(row.content).tokens
+        last_note_id = rows[-1].note_id
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit and save the TF-IDF anomaly detection model')
+    parser.add_argument('--model-path', default=app.config['NLP_MODEL_PATH'])
+    parser.add_argument('--max-features', type=int, default=50000)
+    parser.add_argument('--min-df', type=int, default=2)
+    args = parser.parse_args()
+
+    version = f"tfidf-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+
+    with app.app_context():
+        token_lists = list(iter_note_tokens())
+        print(f"Fitting {version} on {len(token_lists)} case notes...")
+        backend = TfidfBackend.fit(token_lists, version, max_features=args.max_features, min_df=args.min_df)
+        path = backend.save(args.model_path)
+
+    print(f"Saved {backend.dimension}-term model to {path}")